@@ -1,20 +1,121 @@
 """
 FastAPI application for IELTS Task 1 image metadata extraction.
 """
-from fastapi import FastAPI, HTTPException, File, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, File, Query, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, HttpUrl
-from typing import Optional, List
-import io
-from PIL import Image
+from typing import Dict, Literal, Optional, List
+import asyncio
+import time
+import orjson
 
-from services.vision_service import get_vision_service
+from services.batch_scheduler import (
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+    DeadlineExceededError,
+    QueueFullError,
+    get_batch_scheduler,
+)
+from services.extraction_pipeline import ExtractionResult, get_extraction_pipeline
+from services.image_fetcher import ImageFetchError, get_image_fetcher
+from services.inference_backend import close_vision_service, get_vision_service
+from services.job_runner import get_job_runner
+from services.job_store import get_job_store
+from services.metrics import render_metrics
+from services.model_loader import get_model_loader
+from services.near_duplicate_index import get_near_duplicate_index
+from services.result_cache import get_result_cache
+from utils.config import JOBS_MAX_IMAGES, UPLOAD_MAX_BYTES, UPLOAD_MAX_FILES, WORKER_POOL_SIZE
+from utils.image_loader import InvalidImageError
+
+# Uploads are copied out of the spooled multipart file in pieces of this size
+_UPLOAD_CHUNK_BYTES = 256 * 1024
+# Allowance for multipart boundaries and part headers on top of the file data
+_MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+Priority = Literal["interactive", "bulk"]
+_PRIORITY_DESCRIPTION = (
+    "Scheduling class: interactive requests are batched before bulk ones"
+)
+_DEADLINE_DESCRIPTION = (
+    "Milliseconds from now after which the image is no longer sent to the model (answered with 504)"
+)
+
+
+class ORJSONResponse(Response):
+    """JSON response serialized with orjson (several times faster than json.dumps on metadata documents)."""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+class UploadSizeLimitMiddleware:
+    """
+    Cap the request body of the upload endpoints while it is received.
+
+    Starlette spools a multipart body to a temporary file before the
+    endpoint runs, so an oversized upload would otherwise be read in full
+    first. A declared Content-Length over the limit is refused at once, and
+    a body that grows past it (chunked, or with a false Content-Length)
+    fails with 413 as soon as the limit is crossed.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        """
+        Args:
+            app: ASGI application to wrap
+            limits: Maximum body size in bytes per request path
+        """
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        declared = dict(scope["headers"]).get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > limit:
+            response = ORJSONResponse(status_code=413, content={"detail": _upload_too_large_detail()})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside body parsing, so the endpoint's exception
+                    # handling turns it into the response
+                    raise HTTPException(status_code=413, detail=_upload_too_large_detail())
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _upload_too_large_detail() -> str:
+    """Error message for an upload over UPLOAD_MAX_BYTES."""
+    return f"Uploaded file is larger than {UPLOAD_MAX_BYTES / (1024 * 1024):g} MB"
 
 
 app = FastAPI(
     title="IELTS Metadata API",
     description="API for extracting structured metadata from IELTS Task 1 images",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
+)
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    limits={
+        "/api/extract/file": UPLOAD_MAX_BYTES + _MULTIPART_OVERHEAD_BYTES,
+        "/api/extract/file/stream": UPLOAD_MAX_BYTES + _MULTIPART_OVERHEAD_BYTES,
+        "/api/extract/batch/files": UPLOAD_MAX_FILES * (UPLOAD_MAX_BYTES + _MULTIPART_OVERHEAD_BYTES),
+    }
 )
 
 
@@ -45,13 +146,251 @@ class BatchImageURLRequest(BaseModel):
         }
 
 
+def _queue_full_exception(error: QueueFullError) -> HTTPException:
+    """Translate a full inference queue into a 503 with Retry-After."""
+    return HTTPException(
+        status_code=503,
+        detail="Inference queue is full, retry later",
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
+def _require_ready():
+    """Answer 503 with Retry-After while the model is still loading (or failed to load)."""
+    loader = get_model_loader()
+    if loader.is_ready:
+        return
+    status = loader.get_status()
+    detail = (
+        f"Model failed to load: {status['error']}" if loader.has_failed
+        else f"Model is loading ({status['phase']}), retry later"
+    )
+    raise HTTPException(
+        status_code=503,
+        detail=detail,
+        headers={"Retry-After": str(loader.retry_after())}
+    )
+
+
+def _deadline(deadline_ms: Optional[float]) -> Optional[float]:
+    """Turn a request's time budget in milliseconds into a time.monotonic() deadline."""
+    if deadline_ms is None:
+        return None
+    return time.monotonic() + deadline_ms / 1000.0
+
+
+def _deadline_exception() -> HTTPException:
+    """Translate a deadline that passed before inference started into a 504."""
+    return HTTPException(
+        status_code=504,
+        detail="Deadline passed before extraction started"
+    )
+
+
+def _fetch_error_exception(error: ImageFetchError) -> HTTPException:
+    """Translate a failed image download into 400 (bad URL/image) or 502 (remote failure)."""
+    return HTTPException(status_code=error.status_code, detail=str(error))
+
+
+def _metadata_response(result: ExtractionResult) -> ORJSONResponse:
+    """Build the response for a single extraction, tagged with its cache status."""
+    if result.near_duplicate:
+        cache_status = "HIT-NEAR"
+    else:
+        cache_status = "HIT" if result.cache_hit else "MISS"
+    return ORJSONResponse(
+        content=result.metadata,
+        headers={"X-Cache": cache_status}
+    )
+
+
+async def _read_image_upload(file: UploadFile) -> bytes:
+    """
+    Read an uploaded file in chunks, rejecting it with 413 once it exceeds UPLOAD_MAX_BYTES.
+    
+    The bytes are not decoded here: the extraction pipeline decodes each
+    image exactly once and answers 400 if it is not an image.
+    """
+    if file.size is not None and file.size > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=_upload_too_large_detail())
+    chunks = []
+    received = 0
+    while True:
+        chunk = await file.read(_UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        received += len(chunk)
+        if received > UPLOAD_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=_upload_too_large_detail())
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def _event_stream_response(source, priority: str, deadline: Optional[float]) -> StreamingResponse:
+    """
+    Start a streamed extraction and wrap it as a Server-Sent Events response.
+    
+    Admission errors (full queue, unreadable image, passed deadline) are
+    raised before the response starts so they still map to proper HTTP
+    status codes.
+    """
+    try:
+        events = await get_extraction_pipeline().open_stream(source, priority, deadline)
+    except QueueFullError as e:
+        raise _queue_full_exception(e)
+    except DeadlineExceededError:
+        raise _deadline_exception()
+    except ImageFetchError as e:
+        raise _fetch_error_exception(e)
+    except InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Failed to extract metadata: {str(e)}"
+        )
+    
+    async def body():
+        async for event, data in events:
+            yield b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+    
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _batch_result(idx: int, label: dict, outcome) -> dict:
+    """
+    Shape one image's outcome (an ExtractionResult or an exception) as a batch result entry.
+    
+    label identifies the image in the entry: {"image_url": ...} or {"filename": ...}.
+    """
+    if isinstance(outcome, Exception):
+        return {
+            **label,
+            "index": idx,
+            "success": False,
+            "error": str(outcome)
+        }
+    return {
+        **label,
+        "index": idx,
+        "success": True,
+        "cached": outcome.cache_hit,
+        "near_duplicate": outcome.near_duplicate,
+        "metadata": outcome.metadata
+    }
+
+
+async def _extract_batch_item(idx: int, label: dict, source, priority: str, deadline: Optional[float]) -> dict:
+    """
+    Extract one image of a batch and shape its result entry.
+    
+    source is an image URL, image bytes, or the exception that kept the
+    image from being read, which becomes the entry's error.
+    """
+    if isinstance(source, Exception):
+        return _batch_result(idx, label, source)
+    try:
+        outcome = await get_extraction_pipeline().extract(
+            source, wait_for_capacity=True, priority=priority, deadline=deadline
+        )
+    except Exception as e:
+        outcome = e
+    return _batch_result(idx, label, outcome)
+
+
+async def _batch_response(
+    labels: List[dict], sources: list, priority: str, deadline: Optional[float]
+) -> ORJSONResponse:
+    """Extract every image of a batch at once and answer with all results."""
+    # Every image is queued for inference as soon as it is ready, so the
+    # scheduler batches whatever has arrived while slower downloads are
+    # still in flight
+    results = await asyncio.gather(
+        *(
+            _extract_batch_item(idx, label, source, priority, deadline)
+            for idx, (label, source) in enumerate(zip(labels, sources))
+        )
+    )
+    successful = sum(1 for r in results if r["success"])
+    return ORJSONResponse(content={
+        "total_images": len(results),
+        "successful": successful,
+        "failed": len(results) - successful,
+        "results": results
+    })
+
+
+def _ndjson_batch_response(
+    labels: List[dict], sources: list, priority: str, deadline: Optional[float]
+) -> StreamingResponse:
+    """
+    Stream batch results as NDJSON: one line per image in completion order,
+    then a summary line.
+    """
+    async def body():
+        tasks = [
+            asyncio.create_task(_extract_batch_item(idx, label, source, priority, deadline))
+            for idx, (label, source) in enumerate(zip(labels, sources))
+        ]
+        successful = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                successful += result["success"]
+                yield orjson.dumps(result) + b"\n"
+        finally:
+            # Client disconnected: stop work nobody will read
+            for task in tasks:
+                task.cancel()
+        yield orjson.dumps({
+            "summary": True,
+            "total_images": len(tasks),
+            "successful": successful,
+            "failed": len(tasks) - successful
+        }) + b"\n"
+    
+    return StreamingResponse(
+        body(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _refuse_batch_when_saturated():
+    """Refuse new batches outright while the replica is saturated."""
+    scheduler = get_batch_scheduler()
+    if scheduler.is_saturated:
+        raise _queue_full_exception(QueueFullError(scheduler.estimate_retry_after()))
+
+
 @app.on_event("startup")
 async def startup_event():
-    """Initialize the vision service on startup."""
+    """Start loading the model in the background; the API serves probes meanwhile."""
     print("Starting IELTS Metadata API...")
-    # Initialize the model (this will take some time on first run)
-    get_vision_service()
-    print("API ready to accept requests!")
+    loop = asyncio.get_running_loop()
+    
+    def start_job_runner():
+        # Resume any batch jobs left unfinished by a previous run
+        get_job_runner().start()
+        print("API ready to accept requests!")
+    
+    # Loading the model takes a while on first run; readiness flips once
+    # it is loaded and warmed up
+    get_model_loader().start(on_ready=lambda: loop.call_soon_threadsafe(start_job_runner))
+    print("Accepting connections; model is loading in the background")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop job workers, model worker processes and pooled download connections."""
+    if get_model_loader().is_ready:
+        await get_job_runner().stop()
+        await run_in_threadpool(close_vision_service)
+    await get_image_fetcher().aclose()
 
 
 @app.get("/")
@@ -63,39 +402,173 @@ async def root():
         "endpoints": {
             "extract_from_url": "/api/extract/url",
             "extract_from_file": "/api/extract/file",
+            "extract_from_url_stream": "/api/extract/url/stream",
+            "extract_from_file_stream": "/api/extract/file/stream",
             "extract_batch": "/api/extract/batch",
-            "health": "/health"
+            "extract_batch_files": "/api/extract/batch/files",
+            "create_job": "/api/jobs",
+            "job_status": "/api/jobs/{job_id}",
+            "job_results": "/api/jobs/{job_id}/results",
+            "health": "/health",
+            "liveness": "/health/live",
+            "readiness": "/health/ready",
+            "stats": "/api/stats",
+            "metrics": "/metrics"
         }
     }
 
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
-    return {
-        "status": "healthy",
-        "model_loaded": get_vision_service().model is not None
+    """
+    Health check endpoint.
+    
+    Returns 503 while the model is loading and while the inference queue is
+    saturated so a load balancer can route new work to another replica.
+    """
+    loader = get_model_loader()
+    if not loader.is_ready:
+        loading = loader.get_status()
+        return ORJSONResponse(
+            status_code=503,
+            content={
+                "status": "failed" if loader.has_failed else "loading",
+                "backend": loading["backend"],
+                "model_loaded": False,
+                "loading": loading
+            },
+            headers={"Retry-After": str(loader.retry_after())}
+        )
+    
+    scheduler = get_batch_scheduler()
+    queue_stats = scheduler.get_queue_stats()
+    content = {
+        "status": "saturated" if queue_stats["saturated"] else "healthy",
+        "backend": loader.get_status()["backend"],
+        "model_loaded": True,
+        "queue": queue_stats
+    }
+    if queue_stats["saturated"]:
+        return ORJSONResponse(
+            status_code=503,
+            content=content,
+            headers={"Retry-After": str(queue_stats["retry_after_seconds"])}
+        )
+    return content
+
+
+@app.get("/health/live")
+async def liveness():
+    """
+    Liveness probe: 200 while the process is up and loading has not failed.
+    
+    Reports the loading phase, how long it has lasted and overall progress,
+    so a slow start can be told apart from a hung one.
+    """
+    loader = get_model_loader()
+    status = loader.get_status()
+    if loader.has_failed:
+        return ORJSONResponse(status_code=503, content={"status": "failed", **status})
+    return {"status": "alive", **status}
+
+
+@app.get("/health/ready")
+async def readiness():
+    """
+    Readiness probe: 200 once the model is loaded and warmed up and the
+    inference queue has room; 503 with Retry-After otherwise.
+    """
+    loader = get_model_loader()
+    status = loader.get_status()
+    if not loader.is_ready:
+        return ORJSONResponse(
+            status_code=503,
+            content={"status": "failed" if loader.has_failed else "loading", **status},
+            headers={"Retry-After": str(loader.retry_after())}
+        )
+    scheduler = get_batch_scheduler()
+    if scheduler.is_saturated:
+        return ORJSONResponse(
+            status_code=503,
+            content={"status": "saturated", **status},
+            headers={"Retry-After": str(scheduler.estimate_retry_after())}
+        )
+    return {"status": "ready", **status}
+
+
+@app.get("/api/stats")
+async def stats():
+    """Serving statistics, including how full inference batches are."""
+    loader = get_model_loader()
+    if not loader.is_ready:
+        # The scheduler only exists once the model is loaded
+        return {"loading": loader.get_status(), "jobs": get_job_store().get_stats()}
+    scheduler = get_batch_scheduler()
+    content = {
+        "loading": loader.get_status(),
+        "batching": scheduler.get_stats(),
+        "queue": scheduler.get_queue_stats(),
+        "cache": get_result_cache().get_stats(),
+        "near_duplicates": get_near_duplicate_index().get_stats(),
+        "fetch": get_image_fetcher().get_stats(),
+        "coalescing": get_extraction_pipeline().get_coalescing_stats(),
+        "jobs": get_job_store().get_stats()
     }
+    backend = get_vision_service()
+    if WORKER_POOL_SIZE > 0:
+        content["workers"] = backend.get_stats()
+    if backend.speculative_stats is not None:
+        content["speculative"] = backend.speculative_stats.get_stats()
+    if backend.grammar_tables is not None:
+        content["constrained_decoding"] = backend.grammar_tables.get_stats()
+    return content
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-stage latency, token counts, queue depth, cache outcomes."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
 
 @app.post("/api/extract/url")
-async def extract_from_url(request: ImageURLRequest):
+async def extract_from_url(
+    request: ImageURLRequest,
+    priority: Priority = Query(PRIORITY_INTERACTIVE, description=_PRIORITY_DESCRIPTION),
+    deadline_ms: Optional[float] = Query(None, gt=0, description=_DEADLINE_DESCRIPTION)
+):
     """
     Extract metadata from an image URL.
     
     Args:
         request: ImageURLRequest containing the image URL
+        priority: "interactive" (default) or "bulk"
+        deadline_ms: Give up with 504 if inference has not started within
+            this many milliseconds
         
     Returns:
-        JSON metadata extracted from the image
+        JSON metadata extracted from the image; the X-Cache header says
+        whether it was served from the result cache (HIT), reused from a
+        near-duplicate image (HIT-NEAR) or freshly extracted (MISS)
     """
+    _require_ready()
     try:
-        # Extract metadata (qwen_vl_utils handles URL download internally)
-        vision_service = get_vision_service()
-        metadata = vision_service.extract_metadata(str(request.image_url))
+        # Extract metadata; concurrent requests are grouped into one
+        # batched generate call
+        result = await get_extraction_pipeline().extract(
+            str(request.image_url), priority=priority, deadline=_deadline(deadline_ms)
+        )
         
-        return JSONResponse(content=metadata)
+        return _metadata_response(result)
         
+    except QueueFullError as e:
+        raise _queue_full_exception(e)
+    except DeadlineExceededError:
+        raise _deadline_exception()
+    except ImageFetchError as e:
+        raise _fetch_error_exception(e)
+    except InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500, 
@@ -104,35 +577,44 @@ async def extract_from_url(request: ImageURLRequest):
 
 
 @app.post("/api/extract/file")
-async def extract_from_file(file: UploadFile = File(...)):
+async def extract_from_file(
+    file: UploadFile = File(...),
+    priority: Priority = Query(PRIORITY_INTERACTIVE, description=_PRIORITY_DESCRIPTION),
+    deadline_ms: Optional[float] = Query(None, gt=0, description=_DEADLINE_DESCRIPTION)
+):
     """
     Extract metadata from an uploaded image file.
     
     Args:
         file: Uploaded image file
+        priority: "interactive" (default) or "bulk"
+        deadline_ms: Give up with 504 if inference has not started within
+            this many milliseconds
         
     Returns:
-        JSON metadata extracted from the image
+        JSON metadata extracted from the image; the X-Cache header says
+        whether it was served from the result cache (HIT), reused from a
+        near-duplicate image (HIT-NEAR) or freshly extracted (MISS)
     """
+    _require_ready()
     try:
-        # Read file contents
-        image_bytes = await file.read()
-        
-        # Validate it's an image
-        try:
-            Image.open(io.BytesIO(image_bytes)).verify()
-        except Exception as e:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Invalid image format: {str(e)}"
-            )
+        image_bytes = await _read_image_upload(file)
         
         # Extract metadata
-        vision_service = get_vision_service()
-        metadata = vision_service.extract_metadata(image_bytes)
+        result = await get_extraction_pipeline().extract(
+            image_bytes, priority=priority, deadline=_deadline(deadline_ms)
+        )
         
-        return JSONResponse(content=metadata)
+        return _metadata_response(result)
         
+    except HTTPException:
+        raise
+    except QueueFullError as e:
+        raise _queue_full_exception(e)
+    except DeadlineExceededError:
+        raise _deadline_exception()
+    except InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500, 
@@ -140,46 +622,232 @@ async def extract_from_file(file: UploadFile = File(...)):
         )
 
 
+@app.post("/api/extract/url/stream")
+async def extract_from_url_stream(
+    request: ImageURLRequest,
+    priority: Priority = Query(PRIORITY_INTERACTIVE, description=_PRIORITY_DESCRIPTION),
+    deadline_ms: Optional[float] = Query(None, gt=0, description=_DEADLINE_DESCRIPTION)
+):
+    """
+    Extract metadata from an image URL, streamed as Server-Sent Events.
+    
+    Args:
+        request: ImageURLRequest containing the image URL
+        priority: "interactive" (default) or "bulk"
+        deadline_ms: Give up with 504 if inference has not started within
+            this many milliseconds
+        
+    Returns:
+        text/event-stream of "delta" (decoded text), "section" (a completed
+        top-level key of the metadata object), then "done" or "error"
+    """
+    _require_ready()
+    return await _event_stream_response(str(request.image_url), priority, _deadline(deadline_ms))
+
+
+@app.post("/api/extract/file/stream")
+async def extract_from_file_stream(
+    file: UploadFile = File(...),
+    priority: Priority = Query(PRIORITY_INTERACTIVE, description=_PRIORITY_DESCRIPTION),
+    deadline_ms: Optional[float] = Query(None, gt=0, description=_DEADLINE_DESCRIPTION)
+):
+    """
+    Extract metadata from an uploaded image file, streamed as Server-Sent Events.
+    
+    Args:
+        file: Uploaded image file
+        priority: "interactive" (default) or "bulk"
+        deadline_ms: Give up with 504 if inference has not started within
+            this many milliseconds
+        
+    Returns:
+        text/event-stream of "delta" (decoded text), "section" (a completed
+        top-level key of the metadata object), then "done" or "error"
+    """
+    _require_ready()
+    image_bytes = await _read_image_upload(file)
+    return await _event_stream_response(image_bytes, priority, _deadline(deadline_ms))
+
+
 @app.post("/api/extract/batch")
-async def extract_batch(request: BatchImageURLRequest):
+async def extract_batch(
+    request: BatchImageURLRequest,
+    stream: bool = Query(False),
+    priority: Priority = Query(PRIORITY_BULK, description=_PRIORITY_DESCRIPTION),
+    deadline_ms: Optional[float] = Query(None, gt=0, description=_DEADLINE_DESCRIPTION)
+):
     """
     Extract metadata from multiple image URLs in batch.
     
     Args:
         request: BatchImageURLRequest containing list of image URLs
+        stream: Return application/x-ndjson with one line per image as soon
+            as it completes (in completion order, each carrying its index),
+            followed by a {"summary": true, ...} line with the counts
+        priority: "bulk" (default) or "interactive"
+        deadline_ms: Images whose inference has not started within this
+            many milliseconds fail their entry
         
     Returns:
-        List of JSON metadata for each image
+        List of JSON metadata for each image, or the NDJSON stream
     """
-    results = []
-    vision_service = get_vision_service()
+    _require_ready()
+    _refuse_batch_when_saturated()
+    deadline = _deadline(deadline_ms)
     
-    for idx, image_url in enumerate(request.image_urls):
+    labels = [{"image_url": str(image_url)} for image_url in request.image_urls]
+    sources = [str(image_url) for image_url in request.image_urls]
+    if stream:
+        return _ndjson_batch_response(labels, sources, priority, deadline)
+    # All downloads start at once and overlap with inference
+    return await _batch_response(labels, sources, priority, deadline)
+
+
+@app.post("/api/extract/batch/files")
+async def extract_batch_files(
+    files: List[UploadFile] = File(...),
+    stream: bool = Query(False),
+    priority: Priority = Query(PRIORITY_BULK, description=_PRIORITY_DESCRIPTION),
+    deadline_ms: Optional[float] = Query(None, gt=0, description=_DEADLINE_DESCRIPTION)
+):
+    """
+    Extract metadata from multiple uploaded image files in one request.
+    
+    The files go through the same cache, micro-batching and response shape
+    as /api/extract/batch, with each entry naming its "filename" instead of
+    an "image_url". A file that is too large or not an image only fails its
+    own entry.
+    
+    Args:
+        files: Uploaded image files (repeat the "files" form field)
+        stream: Return application/x-ndjson with one line per image as soon
+            as it completes (in completion order, each carrying its index),
+            followed by a {"summary": true, ...} line with the counts
+        priority: "bulk" (default) or "interactive"
+        deadline_ms: Images whose inference has not started within this
+            many milliseconds fail their entry
+        
+    Returns:
+        List of JSON metadata for each image, or the NDJSON stream
+    """
+    _require_ready()
+    if len(files) > UPLOAD_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A request may contain at most {UPLOAD_MAX_FILES} files"
+        )
+    _refuse_batch_when_saturated()
+    deadline = _deadline(deadline_ms)
+    
+    labels = [{"filename": file.filename} for file in files]
+    sources = []
+    for file in files:
         try:
-            # Extract metadata (qwen_vl_utils handles URL download internally)
-            metadata = vision_service.extract_metadata(str(image_url))
-            
-            results.append({
-                "image_url": str(image_url),
-                "index": idx,
-                "success": True,
-                "metadata": metadata
-            })
-            
-        except Exception as e:
-            results.append({
-                "image_url": str(image_url),
-                "index": idx,
-                "success": False,
-                "error": str(e)
-            })
-    
-    return JSONResponse(content={
-        "total_images": len(request.image_urls),
-        "successful": sum(1 for r in results if r.get("success")),
-        "failed": sum(1 for r in results if not r.get("success")),
+            sources.append(await _read_image_upload(file))
+        except HTTPException as e:
+            sources.append(ValueError(e.detail))
+    if stream:
+        return _ndjson_batch_response(labels, sources, priority, deadline)
+    return await _batch_response(labels, sources, priority, deadline)
+
+
+@app.post("/api/jobs", status_code=202)
+async def create_job(request: BatchImageURLRequest):
+    """
+    Submit a batch of image URLs as a background job.
+    
+    The job is persisted before this returns; completed items survive a
+    server restart and unfinished ones are picked up again on startup.
+    
+    Args:
+        request: BatchImageURLRequest containing list of image URLs
+        
+    Returns:
+        Job status with its id; poll /api/jobs/{job_id} for progress and
+        page through /api/jobs/{job_id}/results
+    """
+    if not request.image_urls:
+        raise HTTPException(status_code=400, detail="image_urls must not be empty")
+    if len(request.image_urls) > JOBS_MAX_IMAGES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A job may contain at most {JOBS_MAX_IMAGES} images"
+        )
+    
+    store = get_job_store()
+    job_id = await run_in_threadpool(
+        store.create_job, [str(image_url) for image_url in request.image_urls]
+    )
+    # Before the model is ready the runner is not started yet; it picks the
+    # job up from the store once it is
+    if get_model_loader().is_ready:
+        get_job_runner().notify()
+    job = await run_in_threadpool(store.get_job, job_id)
+    return ORJSONResponse(
+        status_code=202,
+        content={
+            **job,
+            "status_url": f"/api/jobs/{job_id}",
+            "results_url": f"/api/jobs/{job_id}/results"
+        },
+        headers={"Location": f"/api/jobs/{job_id}"}
+    )
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Report a batch job's status and progress.
+    
+    Args:
+        job_id: Id returned by POST /api/jobs
+        
+    Returns:
+        Status ("queued", "running" or "completed") with per-state item
+        counts and the fraction of images finished
+    """
+    job = await run_in_threadpool(get_job_store().get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/api/jobs/{job_id}/results")
+async def get_job_results(
+    job_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500)
+):
+    """
+    Page through a batch job's results in image order.
+    
+    Pages can be read while the job is still running; entries for images
+    that have not finished yet only carry their status.
+    
+    Args:
+        job_id: Id returned by POST /api/jobs
+        offset: Index of the first image to return
+        limit: Maximum number of results to return
+        
+    Returns:
+        A page of results shaped like /api/extract/batch results plus a
+        per-item status, with next_offset set while more images remain
+    """
+    store = get_job_store()
+    job = await run_in_threadpool(store.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    results = await run_in_threadpool(store.get_results, job_id, offset, limit)
+    next_offset = offset + limit
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "total_images": job["total_images"],
+        "offset": offset,
+        "limit": limit,
+        "next_offset": next_offset if next_offset < job["total_images"] else None,
         "results": results
-    })
+    }
 
 
 if __name__ == "__main__":
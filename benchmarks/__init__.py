@@ -0,0 +1 @@
+"""Benchmarks for IELTS Metadata API."""
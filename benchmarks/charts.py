@@ -0,0 +1,7 @@
+"""
+Synthetic IELTS-style chart images for benchmarks.
+
+The generator lives in utils.synthetic_charts so that model warmup does not
+depend on the benchmarks package being deployed.
+"""
+from utils.synthetic_charts import bar_chart_values, make_bar_chart
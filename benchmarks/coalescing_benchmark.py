@@ -0,0 +1,92 @@
+"""
+Benchmark single-flight coalescing of identical concurrent requests.
+
+Sends --requests requests for --distinct different charts all at once
+(a class opening the same exam) through the extraction pipeline with the
+fake backend (no GPU needed), from a local stand-in image server (URLs) or
+as uploaded bytes, with coalescing on and off. Reports wall time, how
+many images reached the model and how many requests were coalesced. The
+result cache starts empty each run, so without coalescing every duplicate
+that arrives before the first result is stored is generated again.
+
+Usage:
+    python -m benchmarks.coalescing_benchmark --requests 200 --distinct 4 --prefill-ms 400 --per-token-ms 2
+"""
+import argparse
+import asyncio
+import io
+import time
+
+from benchmarks.charts import make_bar_chart
+from benchmarks.fetch_benchmark import start_server
+
+
+async def run(sources, coalesce: bool, args) -> tuple:
+    """Extract every source at once through a fresh pipeline; returns (seconds, stats)."""
+    from services.batch_scheduler import BatchScheduler
+    from services.extraction_pipeline import ExtractionPipeline
+    from services.fake_backend import FakeVisionBackend
+    from services.image_fetcher import ImageFetcher
+    from services.result_cache import ResultCache
+
+    backend = FakeVisionBackend(prefill_ms=args.prefill_ms, per_token_ms=args.per_token_ms)
+    scheduler = BatchScheduler(backend, max_batch_size=args.batch_size, max_queue_size=len(sources))
+    fetcher = ImageFetcher(max_per_host=args.requests)
+    pipeline = ExtractionPipeline(scheduler, ResultCache(disk_dir=None), fetcher=fetcher, coalesce=coalesce)
+    try:
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(
+            *(pipeline.extract(source, wait_for_capacity=True) for source in sources),
+            return_exceptions=True,
+        )
+        elapsed = time.perf_counter() - started
+    finally:
+        scheduler.shutdown()
+        await fetcher.aclose()
+    failures = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+    if failures:
+        raise failures[0]
+    stats = pipeline.get_coalescing_stats()
+    return elapsed, {
+        "generated": scheduler.get_stats()["requests_processed"],
+        "downloads": fetcher.get_stats()["downloads"],
+        "coalesced": stats["url"]["coalesced"] + stats["content"]["coalesced"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200, help="Concurrent requests")
+    parser.add_argument("--distinct", type=int, default=4, help="Different charts among them")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--prefill-ms", type=float, default=400.0)
+    parser.add_argument("--per-token-ms", type=float, default=2.0)
+    parser.add_argument("--delay-ms", type=float, default=50.0, help="Image server latency")
+    args = parser.parse_args()
+
+    server = start_server(args.distinct, args.delay_ms, flaky=0.0)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    charts = []
+    for seed in range(args.distinct):
+        buffer = io.BytesIO()
+        make_bar_chart(seed=seed).save(buffer, format="PNG")
+        charts.append(buffer.getvalue())
+
+    workloads = {
+        "urls": [f"{base}/chart/{n % args.distinct}.png" for n in range(args.requests)],
+        "uploads": [charts[n % args.distinct] for n in range(args.requests)],
+    }
+    print(f"{args.requests} concurrent requests for {args.distinct} charts, batch size {args.batch_size}")
+    print(f"{'source':<8} {'coalesce':<9} {'seconds':>8} {'generated':>10} {'downloads':>10} {'coalesced':>10}")
+    try:
+        for name, sources in workloads.items():
+            for coalesce in (False, True):
+                elapsed, stats = asyncio.run(run(sources, coalesce, args))
+                print(f"{name:<8} {str(coalesce):<9} {elapsed:8.2f} {stats['generated']:10d} "
+                      f"{stats['downloads']:10d} {stats['coalesced']:10d}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Benchmark output tokens of the compact columnar format against task1_v1.
+
+Each document is serialized as the model would write it in both formats:
+task1_v1 as is, and compact as produced by utils.compact_format. The same
+extraction in either format therefore differs only in how the values are
+spelled out. Token counts use MODEL_NAME's tokenizer when it is available
+locally, otherwise an estimate of 4 characters per token. Documents are
+written the way the model writes them in each extraction mode: complete,
+or with the derived blocks removed (--data-only). Every compact document is
+expanded again and checked against the original. The expansion time
+reported is the median of --repeat runs.
+
+The documents are the fake backend's samples (bar charts and line graphs
+with 2-4 series), plus a bar chart and a line graph with --series x
+--categories values, a table and a pie chart.
+
+Usage:
+    python -m benchmarks.compact_format_benchmark --series 6 --categories 8 --ms-per-token 25
+"""
+import argparse
+import copy
+import json
+import random
+import statistics
+import time
+
+from benchmarks.derived_fields_benchmark import load_token_counter
+from services.fake_backend import _sample_document
+from utils.compact_format import compact_document, expand_compact
+from utils.config import MODEL_NAME
+from utils.derived_fields import fill_derived_fields, strip_derived_fields
+
+
+def wide_chart(bar_chart: bool, series: int, categories: int, seed: int = 0) -> dict:
+    """A bar chart or line graph document with series x categories estimated values."""
+    document = _sample_document(0 if bar_chart else 1)
+    rng = random.Random(seed)
+    years = [str(1960 + 5 * i) for i in range(categories)]
+    labels = [f"Region {chr(ord('A') + n)}" for n in range(series)]
+    structure = document["visuals"][0]["structure"]
+    document["topic_context"]["time_dimension"].update(start=years[0], end=years[-1], raw_time_labels=years)
+
+    def point(value: float) -> dict:
+        return {"approximate": True, "value_range": {"min": round(value - 1, 1), "max": round(value + 1, 1)},
+                "raw_value_label": None}
+
+    if bar_chart:
+        structure["axes"]["category_axis"]["categories"] = [
+            {"category_id": f"c{i + 1}", "label": year, "order_index": i, "group_label": None}
+            for i, year in enumerate(years)
+        ]
+        structure["series"] = [
+            {"series_id": f"s{n + 1}", "label": label, "legend_label": label, "notes": None,
+             "data_points": [
+                 dict({"category_id": f"c{i + 1}", "value": value}, **point(value))
+                 for i, value in enumerate(round(rng.uniform(5, 95), 1) for _ in years)
+             ],
+             "series_pattern_summary": None}
+            for n, label in enumerate(labels)
+        ]
+    else:
+        structure["axes"]["x_axis"]["ticks"] = [
+            {"tick_id": f"t{i + 1}", "label": year, "numeric_value": int(year), "order_index": i}
+            for i, year in enumerate(years)
+        ]
+        structure["line_series"] = [
+            {"series_id": f"s{n + 1}", "label": label, "legend_label": label,
+             "data_points": [
+                 dict({"x_tick_id": f"t{i + 1}", "x_label": year, "x_numeric_value": int(year), "y_value": value},
+                      **point(value))
+                 for i, (year, value) in enumerate((year, round(rng.uniform(5, 95), 1)) for year in years)
+             ],
+             "series_trend_summary": None}
+            for n, label in enumerate(labels)
+        ]
+    return fill_derived_fields(strip_derived_fields(document))
+
+
+def table_document(rows: int, columns: int, seed: int = 0) -> dict:
+    """A table document with exact cell values and their printed labels."""
+    rng = random.Random(seed)
+    document = _sample_document(0)
+    document["task_visual_category"] = "table"
+    visual = document["visuals"][0]
+    visual["visual_type"] = "table"
+    cells = []
+    for r in range(rows):
+        for c in range(columns):
+            value = float(rng.randint(1, 99))
+            cells.append({"row_id": f"r{r + 1}", "column_id": f"c{c + 1}", "value": value, "approximate": False,
+                          "value_range": None, "raw_value_label": f"{value:g}"})
+    visual["structure"] = {
+        "table_title": None,
+        "row_headers": [{"row_id": f"r{r + 1}", "label": f"Activity {r + 1}", "group_label": "Activity",
+                         "order_index": r} for r in range(rows)],
+        "column_headers": [{"column_id": f"c{c + 1}", "label": f"Group {c + 1}", "unit": "percent",
+                            "group_label": "Age group", "order_index": c} for c in range(columns)],
+        "cells": cells,
+    }
+    return fill_derived_fields(document)
+
+
+def pie_document(slices: int, seed: int = 0) -> dict:
+    """A pie chart document whose slices add up to 100%."""
+    rng = random.Random(seed)
+    document = _sample_document(0)
+    document["task_visual_category"] = "pie_chart"
+    visual = document["visuals"][0]
+    visual["visual_type"] = "pie_chart"
+    weights = [rng.uniform(1, 10) for _ in range(slices)]
+    percentages = [round(100 * weight / sum(weights), 1) for weight in weights]
+    visual["structure"] = {
+        "context_label": None,
+        "is_donut_chart": False,
+        "slices": [
+            {"slice_id": f"sl{i + 1}", "label": f"Category {i + 1}", "category": "expenditure_category",
+             "percentage": percentage, "value": None, "approximate": False, "value_range": None,
+             "raw_value_label": f"{percentage:g}%", "is_highlighted_on_chart": False, "notes": []}
+            for i, percentage in enumerate(percentages)
+        ],
+    }
+    return fill_derived_fields(document)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--samples", type=int, default=4, help="Fake backend sample documents (seeds 0..N-1)")
+    parser.add_argument("--series", type=int, default=6, help="Series of the wide bar chart and line graph")
+    parser.add_argument("--categories", type=int, default=8, help="Categories / ticks of the wide charts")
+    parser.add_argument("--data-only", action="store_true", help="Leave out the derived blocks, as in data-only mode")
+    parser.add_argument("--ms-per-token", type=float, default=25.0, help="Decode time per token")
+    parser.add_argument("--repeat", type=int, default=50, help="Timed expansions per document")
+    parser.add_argument("--model", default=MODEL_NAME, help="Tokenizer to count with")
+    args = parser.parse_args()
+
+    documents = [(f"sample {seed} {_sample_document(seed)['task_visual_category']}", _sample_document(seed))
+                 for seed in range(args.samples)]
+    shape = f"{args.series}x{args.categories}"
+    documents += [
+        (f"bar_chart {shape}", wide_chart(True, args.series, args.categories)),
+        (f"line_graph {shape}", wide_chart(False, args.series, args.categories)),
+        (f"table {args.categories}x{args.series}", table_document(args.categories, args.series)),
+        (f"pie_chart {args.categories}", pie_document(args.categories)),
+    ]
+
+    count_tokens, counted_with = load_token_counter(args.model)
+    print(f"Token counts: {counted_with}; {'data-only' if args.data_only else 'full'} extraction mode")
+    print(f"{'document':<24} {'task1_v1':>9} {'compact':>8} {'saved':>6} {'saved %':>8} "
+          f"{'saved ms':>9} {'expand ms':>10} {'exact':>6}")
+    verbose_totals, compact_totals = [], []
+    for label, document in documents:
+        if args.data_only:
+            document = strip_derived_fields(document)
+        compact = compact_document(document)
+        verbose_tokens = count_tokens(json.dumps(document, indent=2, ensure_ascii=False))
+        compact_tokens = count_tokens(json.dumps(compact, indent=2, ensure_ascii=False))
+        exact = expand_compact(copy.deepcopy(compact)) == document
+
+        timings = []
+        for _ in range(args.repeat):
+            candidate = copy.deepcopy(compact)
+            started = time.perf_counter()
+            expand_compact(candidate)
+            timings.append(time.perf_counter() - started)
+
+        saved = verbose_tokens - compact_tokens
+        verbose_totals.append(verbose_tokens)
+        compact_totals.append(compact_tokens)
+        print(f"{label:<24} {verbose_tokens:9d} {compact_tokens:8d} {saved:6d} {saved / verbose_tokens:8.1%} "
+              f"{saved * args.ms_per_token:9.0f} {statistics.median(timings) * 1000:10.3f} {str(exact):>6}")
+
+    saved_total = sum(verbose_totals) - sum(compact_totals)
+    print()
+    print(f"Total: {sum(verbose_totals)} -> {sum(compact_totals)} tokens "
+          f"({saved_total / sum(verbose_totals):.1%} fewer, "
+          f"{saved_total * args.ms_per_token / 1000 / len(documents):.1f} s of decode saved per image at "
+          f"{args.ms_per_token:g} ms/token)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Benchmark the per-token cost and mask-cache hit rate of constrained decoding.
+
+First replays --samples sample task1_v1 documents (the fake backend's) token
+by token through the grammar logits processor, as generation would call it,
+once for each mask cache size in --cache-sizes: reports the processor's
+time per token, the mask-cache hit rate and the memory the cached masks
+take. Uses MODEL_NAME's tokenizer when it is available locally, otherwise
+the byte-level tokenizer of a tiny random Qwen2.5-VL (2000 tokens, so a
+missing mask is much cheaper to compute than with the ~150k Qwen vocabulary).
+
+With --generate, a chart is also decoded for --tokens tokens with
+constrained decoding off and on (per cache size), and tokens/s and the hit
+rate during generation are reported. --tiny uses the tiny random model
+(CPU, nothing to download); its output is gibberish, so the constrained run
+mostly stays inside strings and stops once the object closes.
+
+Usage:
+    python -m benchmarks.constrained_decoding_benchmark --samples 8 --cache-sizes 1024,256,64
+    python -m benchmarks.constrained_decoding_benchmark --generate --tiny --tokens 256
+"""
+import argparse
+import json
+import tempfile
+import time
+
+from utils.config import MODEL_NAME
+
+
+def load_tokenizer(model_name: str, tiny_dir: str):
+    """MODEL_NAME's tokenizer if it is cached locally, else the tiny model's."""
+    from transformers import AutoProcessor, AutoTokenizer
+
+    from benchmarks.precision_benchmark import save_tiny_model
+
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=True)
+        return tokenizer, "tiny random model" if model_name == tiny_dir else model_name
+    except Exception:
+        save_tiny_model(tiny_dir)
+        return AutoProcessor.from_pretrained(tiny_dir).tokenizer, "tiny random model"
+
+
+def build_tables(tokenizer, vocab_size: int, eos_token_ids, max_cached_masks: int):
+    """Index the vocabulary and warm the mask cache from the schema prompt."""
+    from services.constrained_decoding import GrammarTokenTables, schema_samples
+    from utils.json_grammar import JSONGrammar, extract_enum_constraints
+    from utils.prompts import get_system_prompt
+
+    system_prompt = get_system_prompt(False)
+    enums = extract_enum_constraints(system_prompt)
+    tables = GrammarTokenTables(tokenizer, JSONGrammar(enums), vocab_size, eos_token_ids, max_cached_masks)
+    tables.warm_up(tokenizer, schema_samples(system_prompt, enums))
+    return tables
+
+
+def replay(tokenizer, cache_sizes, samples: int):
+    """Print processor time per token and hit rate while replaying sample documents."""
+    import torch
+
+    from services.constrained_decoding import JSONGrammarLogitsProcessor
+    from services.fake_backend import _sample_document
+
+    documents = [
+        tokenizer(json.dumps(_sample_document(seed), indent=2, ensure_ascii=False), add_special_tokens=False).input_ids
+        for seed in range(samples)
+    ]
+    total_tokens = sum(len(tokens) for tokens in documents)
+    vocab_size = len(tokenizer)
+    print(f"Replaying {samples} documents ({total_tokens} tokens), vocabulary {vocab_size}")
+    print(f"{'cache size':>10} {'us/token':>9} {'hit rate':>9} {'masks':>6} {'mask MB':>8}")
+    for size in cache_sizes:
+        tables = build_tables(tokenizer, vocab_size, [tokenizer.eos_token_id], size)
+        scores = torch.zeros(1, vocab_size)
+        started = time.perf_counter()
+        for tokens in documents:
+            processor = JSONGrammarLogitsProcessor(tables, prompt_length=0, batch_size=1)
+            ids = torch.tensor([tokens], dtype=torch.long)
+            for step in range(len(tokens)):
+                processor(ids[:, :step], scores)
+        elapsed = time.perf_counter() - started
+        stats = tables.get_stats()
+        print(f"{size:10d} {elapsed / total_tokens * 1e6:9.1f} {stats['hit_rate']:9.1%} "
+              f"{stats['cached_masks']:6d} {stats['cached_mask_bytes'] / 2 ** 20:8.1f}")
+
+
+def generate(model_name: str, cache_sizes, tokens: int):
+    """Print decode tokens/s with constrained decoding off and on."""
+    import torch
+
+    from benchmarks.charts import make_bar_chart
+    from services.constrained_decoding import JSONGrammarLogitsProcessor
+    from services.vision_service import VisionService
+    from utils.image_preprocessing import preprocess_image
+
+    service = VisionService(model_name=model_name, draft_model_name="")
+    tokenizer = service.processor.tokenizer
+    inputs = service._prepare_inputs([preprocess_image(make_bar_chart(seed=0))])
+    prompt_length = inputs.input_ids.shape[1]
+    eos_token_ids = service.model.generation_config.eos_token_id or tokenizer.eos_token_id
+    if isinstance(eos_token_ids, int):
+        eos_token_ids = [eos_token_ids]
+    vocab_size = max(len(tokenizer), service.model.get_output_embeddings().weight.shape[0])
+
+    def run(max_new_tokens: int, **generate_kwargs):
+        with torch.no_grad():
+            started = time.perf_counter()
+            output = service._generate(inputs, max_new_tokens=max_new_tokens, **generate_kwargs)
+            if output.is_cuda:
+                torch.cuda.synchronize(output.device)
+            elapsed = time.perf_counter() - started
+        generated = int((output[0, prompt_length:] != tokenizer.pad_token_id).sum())
+        return generated, elapsed
+
+    # One short untimed pass so kernel selection does not count
+    run(2, min_new_tokens=2)
+    print()
+    print(f"Decoding up to {tokens} tokens on {model_name} ({service.precision_profile})")
+    print(f"{'constrained':<18} {'tokens':>7} {'tokens/s':>9} {'hit rate':>9} {'masks':>6}")
+    generated, elapsed = run(tokens, min_new_tokens=tokens)
+    print(f"{'off':<18} {generated:7d} {generated / elapsed:9.1f} {'-':>9} {'-':>6}")
+    for size in cache_sizes:
+        tables = build_tables(tokenizer, vocab_size, eos_token_ids, size)
+        processor = JSONGrammarLogitsProcessor(tables, prompt_length, batch_size=1)
+        generated, elapsed = run(tokens, logits_processor=[processor])
+        stats = tables.get_stats()
+        print(f"{f'on, cache {size}':<18} {generated:7d} {generated / elapsed:9.1f} "
+              f"{stats['hit_rate']:9.1%} {stats['cached_masks']:6d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--model", default=None, help="Model name or path (defaults to MODEL_NAME)")
+    parser.add_argument("--samples", type=int, default=8, help="Sample documents to replay")
+    parser.add_argument("--cache-sizes", default="1024,256,64", help="Comma-separated mask cache sizes")
+    parser.add_argument("--generate", action="store_true", help="Also time decoding with the model")
+    parser.add_argument("--tiny", action="store_true", help="Decode with a tiny random model")
+    parser.add_argument("--tokens", type=int, default=256, help="Tokens to decode with --generate")
+    args = parser.parse_args()
+
+    cache_sizes = [int(size) for size in args.cache_sizes.split(",") if size.strip()]
+    model_name = args.model or MODEL_NAME
+    with tempfile.TemporaryDirectory() as tiny_dir:
+        if args.tiny:
+            from benchmarks.precision_benchmark import save_tiny_model
+
+            save_tiny_model(tiny_dir)
+            model_name = tiny_dir
+        tokenizer, tokenized_with = load_tokenizer(model_name, tiny_dir)
+        print(f"Tokenizer: {tokenized_with}")
+        replay(tokenizer, cache_sizes, args.samples)
+        if args.generate:
+            generate(model_name, cache_sizes, args.tokens)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark the output tokens data-only extraction saves, and what computing the derived blocks costs.
+
+For the fake backend's sample documents (bar charts and line graphs with
+2-4 series), the derived blocks are computed from the raw values and the
+document is serialized twice: complete, as the model writes it in the
+full mode, and with the derived blocks removed, as it writes it in
+data-only mode. The difference is the decode work saved per image, for
+derived blocks as detailed as the computed ones (a model writing terser
+blocks saves proportionally less); it is reported in tokens (with
+MODEL_NAME's tokenizer when it is available locally, otherwise estimated
+at 4 characters per token) and in decode time at --ms-per-token. The
+post-processing time is the median of --repeat runs.
+
+Usage:
+    python -m benchmarks.derived_fields_benchmark --samples 8 --ms-per-token 25
+"""
+import argparse
+import copy
+import json
+import statistics
+import time
+
+from services.fake_backend import _sample_document
+from utils.config import MODEL_NAME
+from utils.derived_fields import fill_derived_fields, strip_derived_fields
+
+_CHARS_PER_TOKEN = 4
+
+
+def load_token_counter(model_name: str):
+    """Token counter using the model's tokenizer if it is cached locally, else a character estimate."""
+    try:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=True)
+        return lambda text: len(tokenizer(text)["input_ids"]), f"{model_name} tokenizer"
+    except Exception:
+        return lambda text: -(-len(text) // _CHARS_PER_TOKEN), f"estimate, {_CHARS_PER_TOKEN} chars/token"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--samples", type=int, default=8, help="Sample documents (seeds 0..N-1)")
+    parser.add_argument("--ms-per-token", type=float, default=25.0, help="Decode time per token")
+    parser.add_argument("--repeat", type=int, default=50, help="Timed post-processing runs per document")
+    parser.add_argument("--model", default=MODEL_NAME, help="Tokenizer to count with")
+    args = parser.parse_args()
+
+    count_tokens, counted_with = load_token_counter(args.model)
+    print(f"Token counts: {counted_with}")
+    print(f"{'sample':<14} {'full tokens':>12} {'data-only':>10} {'saved':>7} {'saved %':>8} "
+          f"{'saved ms':>9} {'derive ms':>10}")
+
+    saved_totals, full_totals, derive_times = [], [], []
+    for seed in range(args.samples):
+        data_only = strip_derived_fields(_sample_document(seed))
+        full = fill_derived_fields(copy.deepcopy(data_only))
+        full_tokens = count_tokens(json.dumps(full, indent=2, ensure_ascii=False))
+        data_only_tokens = count_tokens(json.dumps(data_only, indent=2, ensure_ascii=False))
+
+        timings = []
+        for _ in range(args.repeat):
+            document = copy.deepcopy(data_only)
+            started = time.perf_counter()
+            fill_derived_fields(document)
+            timings.append(time.perf_counter() - started)
+        derive_ms = statistics.median(timings) * 1000
+
+        saved = full_tokens - data_only_tokens
+        saved_totals.append(saved)
+        full_totals.append(full_tokens)
+        derive_times.append(derive_ms)
+        label = f"{seed} {data_only['task_visual_category']}"
+        print(f"{label:<14} {full_tokens:12d} {data_only_tokens:10d} {saved:7d} "
+              f"{saved / full_tokens:8.1%} {saved * args.ms_per_token:9.0f} {derive_ms:10.2f}")
+
+    print()
+    print(f"Mean saved: {statistics.mean(saved_totals):.0f} tokens per image "
+          f"({sum(saved_totals) / sum(full_totals):.1%} of the full output), "
+          f"{statistics.mean(saved_totals) * args.ms_per_token / 1000:.1f} s of decode at "
+          f"{args.ms_per_token:g} ms/token, for {statistics.mean(derive_times):.2f} ms of post-processing")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark concurrent image downloading against a local stand-in server.
+
+Starts a threaded HTTP server on localhost that serves synthetic chart
+PNGs after a configurable delay (and optionally fails some requests with
+503 to exercise retries), then downloads the same URLs one by one and
+through the pooled ImageFetcher. No model is loaded.
+
+Usage:
+    python -m benchmarks.fetch_benchmark --images 32 --delay-ms 200 --flaky 0.2
+"""
+import argparse
+import asyncio
+import io
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from benchmarks.charts import make_bar_chart
+from services.image_fetcher import ImageFetcher
+
+
+def start_server(images: int, delay_ms: float, flaky: float) -> ThreadingHTTPServer:
+    """Serve /chart/<n>.png from a background thread; returns the running server."""
+    bodies = []
+    for seed in range(images):
+        buffer = io.BytesIO()
+        make_bar_chart(seed=seed).save(buffer, format="PNG")
+        bodies.append(buffer.getvalue())
+    rng = random.Random(0)
+    rng_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay_ms / 1000)
+            with rng_lock:
+                fail = rng.random() < flaky
+            index = int(urlsplit(self.path).path.rsplit("/", 1)[-1].split(".")[0])
+            if fail:
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = bodies[index]
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        # The default listen backlog of 5 would stall concurrent connects
+        request_queue_size = 128
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def fetch_all(fetcher: ImageFetcher, urls, concurrent: bool):
+    """Download every URL, either all at once or one after another."""
+    if concurrent:
+        return await asyncio.gather(*(fetcher.fetch(url) for url in urls), return_exceptions=True)
+    results = []
+    for url in urls:
+        try:
+            results.append(await fetcher.fetch(url))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=32)
+    parser.add_argument("--delay-ms", type=float, default=200.0)
+    parser.add_argument("--flaky", type=float, default=0.0,
+                        help="Share of requests answered with 503")
+    parser.add_argument("--max-per-host", type=int, default=6)
+    args = parser.parse_args()
+
+    server = start_server(args.images, args.delay_ms, args.flaky)
+    host, port = server.server_address
+    urls = [f"http://{host}:{port}/chart/{index}.png" for index in range(args.images)]
+
+    for label, concurrent in (("sequential", False), ("concurrent", True)):
+        fetcher = ImageFetcher(max_per_host=args.max_per_host, backoff_seconds=0.05)
+        started = time.perf_counter()
+        results = asyncio.run(fetch_all(fetcher, urls, concurrent))
+        elapsed = time.perf_counter() - started
+        failed = sum(1 for result in results if isinstance(result, Exception))
+        stats = fetcher.get_stats()
+        print(f"{label:>10}: {elapsed:6.2f} s for {args.images} images "
+              f"({failed} failed, {stats['retries']} retries, {stats['bytes'] / 1e6:.1f} MB)")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark recovery rate and parse time of tolerant JSON parsing.
+
+Runs every fixture in benchmarks/fixtures/malformed_outputs through the old
+parser (strip the code fence, json.loads, discard on failure) and through
+utils.json_repair, and reports how many outputs each recovers, how many
+match the fixture's `<name>.expected.json` where there is one, and the
+median parse time. Fixtures without an expected file (truncated output,
+refusals) only count towards recovery. The fast path is timed separately
+on valid documents, json against orjson.
+
+The fixtures are task1_v1 documents from the fake backend, damaged the way
+model output goes wrong: trailing and missing commas, copied schema
+comments, bare values such as `35 vs 10`, unquoted keys, Python literals,
+raw newlines in strings, prose around the object and truncation.
+
+Usage:
+    python -m benchmarks.json_repair_benchmark --repeat 50
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import time
+
+import orjson
+
+from utils.json_repair import parse_model_output, strip_code_fence
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "malformed_outputs")
+
+
+def load_fixtures(fixtures_dir: str) -> list:
+    """Read (name, text, expected or None) for every *.txt fixture, sorted by name."""
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, "*.txt"))):
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        expected_path = path[:-len(".txt")] + ".expected.json"
+        expected = None
+        if os.path.exists(expected_path):
+            with open(expected_path, "r", encoding="utf-8") as f:
+                expected = json.load(f)
+        fixtures.append((os.path.basename(path)[:-len(".txt")], text, expected))
+    return fixtures
+
+
+def strict_parse(text: str):
+    """The parser this replaced: strip a code fence and json.loads."""
+    return json.loads(strip_code_fence(text))
+
+
+def tolerant_parse(text: str):
+    """Parse with repair, dropping the repair report."""
+    return parse_model_output(text)[0]
+
+
+def median_seconds(parse, text: str, repeat: int) -> float:
+    """Median wall time of one parse call."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        try:
+            parse(text)
+        except json.JSONDecodeError:
+            pass
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def evaluate(parse, fixtures: list, repeat: int) -> dict:
+    """Recovered and matching counts, and median parse time per fixture."""
+    recovered = matched = with_expected = 0
+    timings = []
+    for _, text, expected in fixtures:
+        try:
+            value = parse(text)
+            recovered += isinstance(value, dict)
+        except json.JSONDecodeError:
+            value = None
+        if expected is not None:
+            with_expected += 1
+            matched += value == expected
+        timings.append(median_seconds(parse, text, repeat))
+    return {
+        "recovered": recovered,
+        "matched": matched,
+        "with_expected": with_expected,
+        "median_ms": statistics.median(timings) * 1000,
+        "max_ms": max(timings) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="Folder of *.txt fixtures")
+    parser.add_argument("--repeat", type=int, default=50, help="Timed parses per fixture")
+    parser.add_argument("--verbose", action="store_true", help="Show the repairs made per fixture")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        raise SystemExit(f"No fixtures in {args.fixtures}")
+
+    if args.verbose:
+        for name, text, _ in fixtures:
+            try:
+                print(f"{name:<28} {parse_model_output(text)[1]}")
+            except json.JSONDecodeError as e:
+                print(f"{name:<28} unrecoverable: {e}")
+        print()
+
+    print(f"{len(fixtures)} fixtures from {args.fixtures}")
+    print(f"{'parser':<22} {'recovered':>10} {'match expected':>15} {'median ms':>10} {'max ms':>8}")
+    for label, parse in (("strip + json.loads", strict_parse), ("json_repair", tolerant_parse)):
+        result = evaluate(parse, fixtures, args.repeat)
+        print(f"{label:<22} {result['recovered']:>4}/{len(fixtures):<5} "
+              f"{result['matched']:>8}/{result['with_expected']:<6} "
+              f"{result['median_ms']:10.3f} {result['max_ms']:8.3f}")
+
+    # Valid output never reaches the repair pass; compare the parsers it does use
+    valid = [json.dumps(expected, indent=2, ensure_ascii=False) for _, _, expected in fixtures if expected]
+    json_ms = statistics.median(median_seconds(json.loads, text, args.repeat) for text in valid) * 1000
+    orjson_ms = statistics.median(median_seconds(orjson.loads, text, args.repeat) for text in valid) * 1000
+    print()
+    print(f"Valid documents: json.loads {json_ms:.3f} ms, orjson.loads {orjson_ms:.3f} ms "
+          f"({json_ms / orjson_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Load-test the serving path with the fake inference backend.
+
+Runs the API in-process under uvicorn with INFERENCE_BACKEND=fake, serves
+synthetic chart PNGs from a local stand-in server, and fires concurrent
+/api/extract/url requests at it. Reports throughput, latency percentiles,
+rejections and the batching statistics from /api/stats, so scheduler,
+cache and queue settings can be tuned without a GPU.
+
+Usage:
+    python -m benchmarks.load_benchmark --requests 200 --concurrency 32 --distinct 100 --batch-size 4
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import threading
+import time
+
+
+def start_api(port: int):
+    """Run the API on localhost from a background thread; returns the uvicorn server."""
+    import uvicorn
+    from app import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def run_load(base_url: str, urls, concurrency: int):
+    """POST every URL with at most `concurrency` requests in flight; returns (status, seconds) pairs."""
+    import httpx
+
+    slots = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=600, limits=limits) as client:
+        async def one(url):
+            async with slots:
+                started = time.perf_counter()
+                response = await client.post("/api/extract/url", json={"image_url": url})
+                return response.status_code, time.perf_counter() - started
+
+        return await asyncio.gather(*(one(url) for url in urls))
+
+
+def percentile(values, fraction: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--distinct", type=int, default=None,
+                        help="Distinct images (defaults to --requests, i.e. no cache hits)")
+    parser.add_argument("--batch-size", type=int, default=None, help="Overrides BATCH_MAX_SIZE")
+    parser.add_argument("--prefill-ms", type=float, default=None, help="Overrides FAKE_PREFILL_MS")
+    parser.add_argument("--per-token-ms", type=float, default=None, help="Overrides FAKE_PER_TOKEN_MS")
+    args = parser.parse_args()
+
+    # Settings are read at import time, so they go into the environment
+    # before the app is imported. Caches and the job store stay in memory.
+    os.environ["INFERENCE_BACKEND"] = "fake"
+    os.environ["CACHE_DIR"] = ""
+    os.environ["PHASH_INDEX_PATH"] = ""
+    os.environ["JOBS_DB_PATH"] = ":memory:"
+    for flag, name in ((args.batch_size, "BATCH_MAX_SIZE"),
+                       (args.prefill_ms, "FAKE_PREFILL_MS"),
+                       (args.per_token_ms, "FAKE_PER_TOKEN_MS")):
+        if flag is not None:
+            os.environ[name] = str(flag)
+
+    import httpx
+    from benchmarks.fetch_benchmark import start_server
+
+    distinct = args.distinct or args.requests
+    images = start_server(distinct, delay_ms=0, flaky=0)
+    host, image_port = images.server_address
+    urls = [f"http://{host}:{image_port}/chart/{n % distinct}.png" for n in range(args.requests)]
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    api = start_api(port)
+    base_url = f"http://127.0.0.1:{port}"
+
+    started = time.perf_counter()
+    results = asyncio.run(run_load(base_url, urls, args.concurrency))
+    elapsed = time.perf_counter() - started
+    stats = httpx.get(f"{base_url}/api/stats").json()
+
+    latencies = [seconds for status, seconds in results if status == 200]
+    rejected = sum(1 for status, _ in results if status == 503)
+    failed = len(results) - len(latencies) - rejected
+    print(f"{args.requests} requests ({distinct} distinct images), concurrency {args.concurrency}")
+    print(f"  wall time:   {elapsed:.2f} s, {len(latencies) / elapsed:.1f} successful requests/s")
+    if latencies:
+        print(f"  latency:     p50 {statistics.median(latencies) * 1000:.0f} ms, "
+              f"p95 {percentile(latencies, 0.95) * 1000:.0f} ms, max {max(latencies) * 1000:.0f} ms")
+    print(f"  rejected:    {rejected} (503), failed: {failed}")
+    batching, cache = stats["batching"], stats["cache"]
+    print(f"  batching:    {batching['batches_run']} batches, avg size {batching['avg_batch_size']} "
+          f"(fill {batching['avg_fill_ratio']:.0%}), sizes {batching['batch_size_histogram']}")
+    print(f"  cache:       hit rate {cache['hit_rate']:.0%}")
+
+    api.should_exit = True
+    images.shutdown()
+
+
+if __name__ == "__main__":
+    main()
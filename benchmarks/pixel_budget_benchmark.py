@@ -0,0 +1,112 @@
+"""
+Benchmark vision-token count, latency and output fidelity at several pixel budgets.
+
+Each synthetic chart is rendered, upscaled to phone-photo resolution and
+framed by a uniform margin, then preprocessed at every budget. For each
+budget the benchmark reports the vision tokens per image, prefill time
+(time-to-first-token), full extraction time, and how many of the drawn bar
+values appear in the extracted metadata.
+
+Usage:
+    python -m benchmarks.pixel_budget_benchmark --budgets 256,512,1024,2048 --images 3
+"""
+import argparse
+import statistics
+import time
+
+import torch
+from PIL import Image, ImageOps
+
+from benchmarks.charts import bar_chart_values, make_bar_chart
+from services.vision_service import VisionService
+from utils.config import IMAGE_MIN_PIXELS
+from utils.image_preprocessing import PATCH_FACTOR, preprocess_image, vision_token_count
+
+
+def make_photo(seed: int, width: int, height: int) -> Image.Image:
+    """A chart upscaled to camera resolution with a uniform grey frame around it."""
+    chart = make_bar_chart(seed=seed).resize((width, height), Image.BICUBIC)
+    return ImageOps.expand(chart, border=width // 20, fill=(200, 200, 200))
+
+
+def numbers_in(value) -> list:
+    """All numbers anywhere in a metadata dict."""
+    if isinstance(value, bool):
+        return []
+    if isinstance(value, (int, float)):
+        return [value]
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, list):
+        return [number for item in value for number in numbers_in(item)]
+    return []
+
+
+def recovered_fraction(metadata: dict, expected: list, tolerance: float) -> float:
+    """Share of drawn bar values found (within tolerance) in the metadata."""
+    found = numbers_in(metadata)
+    values = [value for row in expected for value in row]
+    hits = sum(1 for value in values if any(abs(value - number) <= tolerance for number in found))
+    return hits / len(values)
+
+
+def timed(fn):
+    """Run fn and return (result, seconds)."""
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    started = time.perf_counter()
+    result = fn()
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--budgets", default="256,512,1024,2048",
+                        help="Comma-separated maximum vision tokens per image")
+    parser.add_argument("--images", type=int, default=3)
+    parser.add_argument("--width", type=int, default=3200)
+    parser.add_argument("--height", type=int, default=2400)
+    parser.add_argument("--tolerance", type=float, default=3.0,
+                        help="Allowed error when matching extracted values")
+    args = parser.parse_args()
+
+    service = VisionService()
+    photos = [make_photo(seed, args.width, args.height) for seed in range(args.images)]
+    expected = [bar_chart_values(seed=seed) for seed in range(args.images)]
+    print(f"Source images: {photos[0].width}x{photos[0].height} "
+          f"(unbounded: {vision_token_count(photos[0].width, photos[0].height)} vision tokens)")
+    print(f"{'budget':>7} {'size':>10} {'tokens':>7} {'prefill ms':>11} {'extract s':>10} {'parsed':>7} {'values':>7}")
+
+    for budget in (int(item) for item in args.budgets.split(",")):
+        max_pixels = budget * PATCH_FACTOR * PATCH_FACTOR
+        service.min_pixels = min(IMAGE_MIN_PIXELS, max_pixels)
+        service.max_pixels = max_pixels
+        images = [
+            preprocess_image(photo, min_pixels=service.min_pixels, max_pixels=max_pixels)
+            for photo in photos
+        ]
+
+        prefill, extract, parsed, recovered = [], [], 0, []
+        for image, values in zip(images, expected):
+            inputs = service._prepare_inputs([image])
+            with torch.no_grad():
+                service._generate(inputs, max_new_tokens=1)  # untimed warmup
+                _, seconds = timed(lambda: service._generate(inputs, max_new_tokens=1))
+            prefill.append(seconds)
+            metadata, seconds = timed(lambda: service.extract_metadata(image))
+            extract.append(seconds)
+            if "error" not in metadata:
+                parsed += 1
+            recovered.append(recovered_fraction(metadata, values, args.tolerance))
+
+        size = f"{images[0].width}x{images[0].height}"
+        tokens = vision_token_count(images[0].width, images[0].height)
+        print(f"{budget:>7} {size:>10} {tokens:>7} "
+              f"{statistics.median(prefill) * 1000:>11.1f} {statistics.median(extract):>10.2f} "
+              f"{parsed:>3}/{len(images):<3} {statistics.mean(recovered):>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark load time, memory and decode speed of each precision profile.
+
+Every profile is measured in a fresh process so load time and resident
+memory are not flattered by an earlier load: the service is constructed
+with the profile (weights, processor, prefix cache), then a synthetic chart
+is decoded for a fixed number of tokens. GPU profiles are skipped when no
+GPU is visible.
+
+With --tiny, a small randomly initialized Qwen2.5-VL is written to a
+temporary directory and used instead of MODEL_NAME, so the CPU profiles can
+be compared without downloading anything.
+
+Usage:
+    python -m benchmarks.precision_benchmark --profiles gpu-nf4,gpu-int8,gpu-bf16,cpu-int8,cpu-bf16 --tokens 128
+    python -m benchmarks.precision_benchmark --tiny --profiles cpu-int8,cpu-bf16 --tokens 128
+"""
+import argparse
+import multiprocessing
+import resource
+import tempfile
+import time
+
+
+def measure(model_name: str, profile: str, tokens: int) -> dict:
+    """Load the service with one profile and time a fixed-length generation (runs in a child process)."""
+    import torch
+
+    from benchmarks.charts import make_bar_chart
+    from services.vision_service import VisionService
+    from utils.image_preprocessing import preprocess_image
+
+    started = time.perf_counter()
+    service = VisionService(model_name=model_name, draft_model_name="", precision_profile=profile)
+    load_seconds = time.perf_counter() - started
+
+    inputs = service._prepare_inputs([preprocess_image(make_bar_chart(seed=0))])
+    with torch.no_grad():
+        # One short untimed pass so kernel selection does not count
+        service._generate(inputs, max_new_tokens=2, min_new_tokens=2)
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        started = time.perf_counter()
+        service._generate(inputs, max_new_tokens=tokens, min_new_tokens=tokens)
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        generate_seconds = time.perf_counter() - started
+
+    return {
+        "profile": profile,
+        "load_seconds": load_seconds,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "gpu_peak_mb": torch.cuda.max_memory_allocated() / 2 ** 20 if torch.cuda.is_available() else None,
+        "tokens_per_second": tokens / generate_seconds,
+        "threads": torch.get_num_threads(),
+    }
+
+
+def save_tiny_model(path: str):
+    """Write a small random Qwen2.5-VL and its processor to a directory."""
+    from benchmarks.speculative_benchmark import build_model, build_processor
+
+    processor = build_processor(vocab_size=2000)
+    model = build_model(processor.tokenizer, layers=8, hidden_size=512)
+    model.save_pretrained(path)
+    processor.save_pretrained(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--profiles", default="gpu-nf4,gpu-int8,gpu-bf16,cpu-int8,cpu-bf16")
+    parser.add_argument("--tokens", type=int, default=128)
+    parser.add_argument("--model", default=None, help="Model name or path (defaults to MODEL_NAME)")
+    parser.add_argument("--tiny", action="store_true", help="Use a tiny random model instead")
+    args = parser.parse_args()
+
+    import torch
+
+    from utils.config import MODEL_NAME
+
+    profiles = [profile.strip() for profile in args.profiles.split(",") if profile.strip()]
+    if not torch.cuda.is_available():
+        skipped = [profile for profile in profiles if profile.startswith("gpu-")]
+        if skipped:
+            print(f"No GPU visible; skipping {', '.join(skipped)}")
+        profiles = [profile for profile in profiles if not profile.startswith("gpu-")]
+
+    with tempfile.TemporaryDirectory() as tiny_dir:
+        model_name = args.model or MODEL_NAME
+        if args.tiny:
+            save_tiny_model(tiny_dir)
+            model_name = tiny_dir
+
+        context = multiprocessing.get_context("spawn")
+        results = []
+        for profile in profiles:
+            with context.Pool(1) as pool:
+                results.append(pool.apply(measure, (model_name, profile, args.tokens)))
+
+    print()
+    print(f"{'profile':<10} {'load s':>8} {'peak RSS MB':>12} {'GPU peak MB':>12} {'tokens/s':>9} {'threads':>8}")
+    for result in results:
+        gpu_peak = f"{result['gpu_peak_mb']:.0f}" if result["gpu_peak_mb"] is not None else "-"
+        print(f"{result['profile']:<10} {result['load_seconds']:8.1f} {result['peak_rss_mb']:12.0f} "
+              f"{gpu_peak:>12} {result['tokens_per_second']:9.1f} {result['threads']:8d}")
+
+
+if __name__ == "__main__":
+    main()
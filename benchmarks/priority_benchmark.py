@@ -0,0 +1,91 @@
+"""
+Benchmark interactive latency behind a bulk backlog with and without priority classes.
+
+Queues --bulk images at once (a nightly re-extraction) on the batch
+scheduler in front of the fake backend (no GPU needed), then submits one
+interactive image every --interval-ms for --interactive images. The same
+workload runs with everything in one class (arrival order, as before
+priorities existed), then with interactive ahead of bulk at each
+--bulk-shares share of the queue picks reserved for bulk while both
+classes wait (0: strict priority). Reports interactive latency and
+queue-wait percentiles and when the last bulk image finished.
+
+Usage:
+    python -m benchmarks.priority_benchmark --bulk 64 --interactive 20 --interval-ms 250 --bulk-shares 0,0.25
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.charts import make_bar_chart
+
+
+def run(images, args, priorities: bool, bulk_share: float) -> dict:
+    """Push the bulk backlog and the interactive arrivals through one scheduler."""
+    from services.batch_scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, BatchScheduler
+    from services.fake_backend import FakeVisionBackend
+
+    backend = FakeVisionBackend(prefill_ms=args.prefill_ms, per_token_ms=args.per_token_ms)
+    scheduler = BatchScheduler(
+        backend,
+        max_batch_size=args.batch_size,
+        max_queue_size=args.bulk + args.interactive + 1,
+        interactive_reserve=args.interactive,
+        bulk_share=bulk_share,
+    )
+    bulk_priority = PRIORITY_BULK if priorities else PRIORITY_INTERACTIVE
+    started = time.monotonic()
+    bulk = [scheduler.submit(images[n % len(images)], priority=bulk_priority) for n in range(args.bulk)]
+
+    interactive = []
+    for n in range(args.interactive):
+        time.sleep(max(0.0, started + (n + 1) * args.interval_ms / 1000 - time.monotonic()))
+        submitted = time.monotonic()
+        future = scheduler.submit(images[n % len(images)], priority=PRIORITY_INTERACTIVE)
+        interactive.append((submitted, future))
+
+    latencies = []
+    for submitted, future in interactive:
+        future.result()
+        latencies.append(time.monotonic() - submitted)
+    for future in bulk:
+        future.result()
+    bulk_done = time.monotonic() - started
+    waits = scheduler.get_queue_stats()["by_priority"][PRIORITY_INTERACTIVE]
+    scheduler.shutdown()
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies),
+        "p95": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+        "wait_p95": waits["wait_ms_p95"] / 1000,
+        "bulk_done": bulk_done,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--bulk", type=int, default=64, help="Bulk images queued at the start")
+    parser.add_argument("--interactive", type=int, default=20, help="Interactive images arriving afterwards")
+    parser.add_argument("--interval-ms", type=float, default=250.0, help="Time between interactive arrivals")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--prefill-ms", type=float, default=200.0)
+    parser.add_argument("--per-token-ms", type=float, default=0.5)
+    parser.add_argument("--bulk-shares", default="0,0.25", help="Comma-separated bulk shares to compare")
+    args = parser.parse_args()
+
+    images = [make_bar_chart(seed=seed) for seed in range(8)]
+    print(f"{args.bulk} bulk images queued, then {args.interactive} interactive every {args.interval_ms:g} ms; "
+          f"batch size {args.batch_size}")
+    print(f"{'scheduling':<30} {'interactive p50 s':>18} {'p95 s':>7} {'queue wait p95 s':>17} {'bulk done s':>12}")
+    runs = [("arrival order (one class)", False, 0.0)] + [
+        (f"interactive first, bulk {float(share):.0%}", True, float(share))
+        for share in args.bulk_shares.split(",")
+    ]
+    for name, priorities, bulk_share in runs:
+        result = run(images, args, priorities, bulk_share)
+        print(f"{name:<30} {result['p50']:18.2f} {result['p95']:7.2f} {result['wait_p95']:17.2f} "
+              f"{result['bulk_done']:12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Benchmark prompt tokens and prefill time of two-stage extraction.
+
+Counts the tokens of the full schema prompt and of the prompt assembled for
+each visual type (single visuals, and a line graph plus a table as the
+multi-visual case), in both extraction modes, plus the classification
+prompt (with MODEL_NAME's tokenizer when it is available locally,
+otherwise estimated at 4 characters per token).
+
+With --prefill, a bar chart is also run through the model: the time to
+the first new token with the full prompt, the classification pass
+(--classify-tokens tokens, the length of its JSON answer) and the
+extraction prefill with each assembled prompt, all from the prefix cache
+and reusing the classification pass's image embeddings, and again with
+the prefix cache off. The classification is forced rather than generated,
+so every prompt is measured. With --tiny, a small randomly initialized
+Qwen2.5-VL is used instead of MODEL_NAME (CPU, nothing to download).
+
+Usage:
+    python -m benchmarks.two_stage_benchmark
+    python -m benchmarks.two_stage_benchmark --prefill --tiny --runs 3
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.derived_fields_benchmark import load_token_counter
+from utils.config import MODEL_NAME
+from utils.prompts import (
+    IELTS_TASK1_CLASSIFICATION_PROMPT,
+    VISUAL_TYPES,
+    get_classified_prompts,
+    get_system_prompt,
+)
+
+# One multi-visual combination next to the single visuals
+_CLASSIFICATIONS = [(visual_type, (visual_type,)) for visual_type in VISUAL_TYPES] + [
+    ("multiple_graphs", ("line_graph", "table")),
+]
+
+
+def label(classification) -> str:
+    """Short row label for a classification."""
+    category, visual_types = classification
+    return "+".join(visual_types) if category == "multiple_graphs" else category
+
+
+def report_prompt_tokens(model_name: str):
+    """Print system-prompt tokens per classification, full vs assembled."""
+    count_tokens, counted_with = load_token_counter(model_name)
+    print(f"System-prompt tokens ({counted_with}); classification prompt: "
+          f"{count_tokens(IELTS_TASK1_CLASSIFICATION_PROMPT)}")
+    print(f"{'visual':<20} {'mode':<10} {'full':>7} {'assembled':>10} {'ratio':>6}")
+    for data_only in (False, True):
+        full = count_tokens(get_system_prompt(data_only))
+        for classification in _CLASSIFICATIONS:
+            assembled = count_tokens(get_classified_prompts(classification, data_only)[0])
+            print(f"{label(classification):<20} {'data-only' if data_only else 'full':<10} "
+                  f"{full:7d} {assembled:10d} {full / assembled:5.1f}x")
+
+
+def median_ms(run, runs: int) -> float:
+    """Median wall time of run() in milliseconds, after one untimed call."""
+    run()
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def report_prefill(model_name: str, runs: int, classify_tokens: int):
+    """Print prompt tokens and prefill times per prompt, with and without the prefix cache."""
+    # Read when the service modules are imported
+    os.environ["TWO_STAGE_EXTRACTION"] = "true"
+    import torch
+
+    from benchmarks.charts import make_bar_chart
+    from services.prefix_cache import encode_images
+    from services.vision_service import VisionService
+    from utils.image_preprocessing import preprocess_image
+    from utils.prompts import IELTS_TASK1_CLASSIFICATION_USER_PROMPT
+
+    service = VisionService(model_name=model_name, draft_model_name="")
+    image = preprocess_image(make_bar_chart(seed=0))
+    full_inputs = service._prepare_inputs([image])
+    classify_inputs = service._prepare_inputs(
+        [image], IELTS_TASK1_CLASSIFICATION_PROMPT, IELTS_TASK1_CLASSIFICATION_USER_PROMPT
+    )
+    image_embeds = encode_images(service.model, classify_inputs["pixel_values"], classify_inputs["image_grid_thw"])
+
+    rows = [("full prompt", full_inputs, None, None, 1)]
+    rows.append(("classification", classify_inputs, IELTS_TASK1_CLASSIFICATION_PROMPT, None, classify_tokens))
+    for classification in _CLASSIFICATIONS:
+        system_prompt, user_text = get_classified_prompts(classification, service.data_only)
+        inputs = service._retemplate_inputs(classify_inputs, [0], system_prompt, user_text)
+        rows.append((label(classification), inputs, system_prompt, image_embeds, 1))
+
+    print()
+    print(f"Prefill on {model_name} ({service.precision_profile}), median of {runs}; "
+          f"classification generates {classify_tokens} tokens")
+    print(f"{'prompt':<20} {'tokens':>7} {'prefix cache ms':>16} {'no cache ms':>12}")
+    for name, inputs, system_prompt, embeds, tokens in rows:
+        timings = []
+        for use_prefix_cache in (True, False):
+            service.use_prefix_cache = use_prefix_cache
+
+            def run():
+                with torch.no_grad():
+                    service._generate(
+                        inputs, system_prompt=system_prompt, image_embeds=embeds,
+                        max_new_tokens=tokens, min_new_tokens=tokens,
+                    )
+                if torch.cuda.is_available():
+                    torch.cuda.synchronize()
+
+            timings.append(median_ms(run, runs))
+        print(f"{name:<20} {int(inputs['attention_mask'].sum()):7d} {timings[0]:16.0f} {timings[1]:12.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--model", default=None, help="Model name or path (defaults to MODEL_NAME)")
+    parser.add_argument("--prefill", action="store_true", help="Also time prefill with the model")
+    parser.add_argument("--tiny", action="store_true", help="Time prefill on a tiny random model")
+    parser.add_argument("--runs", type=int, default=3, help="Timed runs per prompt")
+    parser.add_argument("--classify-tokens", type=int, default=24, help="Tokens the classification pass generates")
+    args = parser.parse_args()
+
+    report_prompt_tokens(args.model or MODEL_NAME)
+    if not args.prefill:
+        return
+    with tempfile.TemporaryDirectory() as tiny_dir:
+        model_name = args.model or MODEL_NAME
+        if args.tiny:
+            from benchmarks.precision_benchmark import save_tiny_model
+
+            save_tiny_model(tiny_dir)
+            model_name = tiny_dir
+        report_prefill(model_name, args.runs, args.classify_tokens)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark throughput of the model worker pool against a single in-process backend.
+
+Runs the fake backend (no GPU needed) in-process and in pools of several
+worker processes behind the batch scheduler, pushes the same set of
+synthetic chart images through each, and reports images per second. Also
+times moving one image into a worker through shared memory versus
+pickling it.
+
+Usage:
+    python -m benchmarks.worker_pool_benchmark --workers 1,2,4 --images 64 --prefill-ms 100 --per-token-ms 1
+"""
+import argparse
+import os
+import pickle
+import time
+from concurrent.futures import wait
+
+
+def run(backend, images, batch_size: int) -> float:
+    """Push every image through a scheduler in front of the backend; returns seconds."""
+    from services.batch_scheduler import BatchScheduler
+
+    scheduler = BatchScheduler(
+        backend, max_batch_size=batch_size, max_wait_ms=5, max_queue_size=len(images)
+    )
+    started = time.perf_counter()
+    futures = [scheduler.submit(image) for image in images]
+    wait(futures)
+    elapsed = time.perf_counter() - started
+    for future in futures:
+        future.result()
+    scheduler.shutdown()
+    return elapsed
+
+
+def transfer_times(image, repeats: int = 20) -> tuple:
+    """Median seconds to hand an image over via shared memory and via pickling."""
+    from services.worker_pool import _from_shared, _release, _to_shared
+
+    shared, pickled = [], []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        segment, descriptor = _to_shared(image)
+        _from_shared(descriptor)
+        shared.append(time.perf_counter() - started)
+        _release([segment])
+
+        started = time.perf_counter()
+        pickle.loads(pickle.dumps(image))
+        pickled.append(time.perf_counter() - started)
+    return sorted(shared)[repeats // 2], sorted(pickled)[repeats // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated pool sizes")
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--prefill-ms", type=float, default=100.0)
+    parser.add_argument("--per-token-ms", type=float, default=1.0)
+    parser.add_argument("--width", type=int, default=1600)
+    parser.add_argument("--height", type=int, default=1200)
+    args = parser.parse_args()
+
+    # Worker processes read these when they import the config
+    os.environ["FAKE_PREFILL_MS"] = str(args.prefill_ms)
+    os.environ["FAKE_PER_TOKEN_MS"] = str(args.per_token_ms)
+
+    from benchmarks.charts import make_bar_chart
+    from services.fake_backend import FakeVisionBackend
+    from services.worker_pool import WorkerPool
+
+    images = [make_bar_chart(width=args.width, height=args.height, seed=seed) for seed in range(args.images)]
+    shared, pickled = transfer_times(images[0])
+    print(f"Image hand-over ({args.width}x{args.height}): shared memory {shared * 1000:.2f} ms, "
+          f"pickle {pickled * 1000:.2f} ms")
+
+    backend = FakeVisionBackend(prefill_ms=args.prefill_ms, per_token_ms=args.per_token_ms)
+    baseline = run(backend, images, args.batch_size)
+    print(f"{'in-process':>12}: {baseline:6.2f} s, {args.images / baseline:6.1f} images/s")
+
+    for size in (int(item) for item in args.workers.split(",")):
+        pool = WorkerPool("fake", size)
+        try:
+            elapsed = run(pool, images, args.batch_size)
+            batches = [worker["batches"] for worker in pool.get_stats()]
+        finally:
+            pool.close()
+        print(f"{f'{size} worker(s)':>12}: {elapsed:6.2f} s, {args.images / elapsed:6.1f} images/s "
+              f"({baseline / elapsed:.1f}x), batches per worker {batches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,517 @@
+"""
+Dynamic micro-batching scheduler in front of the inference backend.
+
+Requests that arrive within a short window are grouped into one padded,
+batched generate call so concurrent API calls share the GPU instead of
+serializing on it at batch size 1. Inference runs on dedicated worker
+threads, off the asyncio event loop (one per batch the backend can run at
+once, e.g. one per model process of a worker pool), and the number of
+waiting images is bounded so overload turns into fast rejections instead
+of a growing backlog.
+
+Each request carries a priority class and an optional deadline.
+Interactive requests are batched before bulk ones, except that a fixed
+share of the images taken while both classes wait are bulk ones, so a
+steady stream of interactive work cannot starve bulk work. Requests whose
+deadline passes while they wait are failed instead of being run.
+"""
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from services.inference_backend import InferenceBackend, get_vision_service
+from services.metrics import (
+    BATCH_SIZE,
+    DEADLINE_REJECTIONS,
+    QUEUE_DEPTH,
+    QUEUE_REJECTIONS,
+    QUEUE_WAIT_SECONDS,
+    STAGE_SECONDS,
+)
+from utils.config import (
+    BATCH_MAX_SIZE,
+    BATCH_MAX_WAIT_MS,
+    QUEUE_INTERACTIVE_RESERVE,
+    QUEUE_MAX_SIZE,
+    SCHEDULER_BULK_SHARE,
+)
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BULK)
+
+
+class QueueFullError(Exception):
+    """Raised when the inference queue cannot accept more work."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(Exception):
+    """Raised when a request's deadline passed before inference started."""
+
+    def __init__(self):
+        super().__init__("Deadline passed before extraction started")
+
+
+@dataclass
+class _PendingRequest:
+    """A single image waiting to be batched."""
+    image_data: Any
+    on_text: Optional[Callable[[str], None]] = None
+    priority: str = PRIORITY_INTERACTIVE
+    deadline: Optional[float] = None
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+    def expired(self, now: float) -> bool:
+        """Whether the deadline (a time.monotonic() value) has passed."""
+        return self.deadline is not None and now >= self.deadline
+
+
+class _PriorityQueue:
+    """
+    Thread-safe queue of pending requests with one FIFO per priority class.
+
+    Interactive requests are handed out first, except that while both
+    classes are waiting, bulk requests get bulk_share of the picks.
+    """
+
+    def __init__(self, bulk_share: float):
+        self.bulk_share = bulk_share
+        self._queues: Dict[str, deque] = {priority: deque() for priority in PRIORITIES}
+        self._condition = threading.Condition()
+        self._closed = False
+        self._contended_picks = 0
+        self._contended_bulk_picks = 0
+
+    def qsize(self, priority: Optional[str] = None) -> int:
+        """Requests waiting, in one class or in all of them."""
+        if priority is not None:
+            return len(self._queues[priority])
+        return sum(len(waiting) for waiting in self._queues.values())
+
+    def put(self, request: _PendingRequest):
+        with self._condition:
+            self._queues[request.priority].append(request)
+            self._condition.notify()
+
+    def raise_priority(self, future: Future, priority: str) -> bool:
+        """Move the request behind future from a lower class to the back of priority's FIFO."""
+        with self._condition:
+            for lower in PRIORITIES[PRIORITIES.index(priority) + 1:]:
+                waiting = self._queues[lower]
+                for request in waiting:
+                    if request.future is future:
+                        waiting.remove(request)
+                        request.priority = priority
+                        self._queues[priority].append(request)
+                        return True
+        return False
+
+    def close(self):
+        """Let get() return None once the queue has drained."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[_PendingRequest]:
+        """
+        Take the next request by priority.
+
+        Args:
+            timeout: Seconds to wait for one (None waits until one arrives
+                or the queue is closed)
+
+        Returns:
+            Optional[_PendingRequest]: The request, or None on timeout or
+                once the queue is closed and empty
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                request = self._pop()
+                if request is not None or self._closed:
+                    return request
+                if deadline is None:
+                    self._condition.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def _pop(self) -> Optional[_PendingRequest]:
+        interactive = self._queues[PRIORITY_INTERACTIVE]
+        bulk = self._queues[PRIORITY_BULK]
+        if interactive and bulk:
+            self._contended_picks += 1
+            if self._contended_bulk_picks + 1 <= self.bulk_share * self._contended_picks:
+                self._contended_bulk_picks += 1
+                return bulk.popleft()
+            return interactive.popleft()
+        if interactive:
+            return interactive.popleft()
+        if bulk:
+            return bulk.popleft()
+        return None
+
+
+class BatchScheduler:
+    """Collects extraction requests into batches and runs them on worker threads."""
+
+    def __init__(
+        self,
+        vision_service: InferenceBackend,
+        max_batch_size: int = BATCH_MAX_SIZE,
+        max_wait_ms: float = BATCH_MAX_WAIT_MS,
+        max_queue_size: int = QUEUE_MAX_SIZE,
+        concurrency: Optional[int] = None,
+        interactive_reserve: int = QUEUE_INTERACTIVE_RESERVE,
+        bulk_share: float = SCHEDULER_BULK_SHARE,
+    ):
+        """
+        Initialize the scheduler and start its worker threads.
+
+        Args:
+            vision_service: Service used to run batched extraction
+            max_batch_size: Maximum number of images per generate call
+            max_wait_ms: How long to hold the first request of a batch
+                while waiting for more to arrive
+            max_queue_size: Maximum number of images waiting for the worker
+            concurrency: Batches run at the same time (defaults to the
+                backend's concurrency)
+            interactive_reserve: Queue slots bulk requests may not take
+            bulk_share: Share of the images taken from the queue that are
+                bulk ones while interactive requests are waiting too
+        """
+        self.vision_service = vision_service
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self.max_queue_size = max(1, max_queue_size)
+        self.concurrency = max(1, concurrency or vision_service.concurrency)
+        self.interactive_reserve = min(max(0, interactive_reserve), self.max_queue_size - 1)
+
+        # Capacity is enforced in submit() under _submit_lock
+        self._queue = _PriorityQueue(min(max(0.0, bulk_share), 1.0))
+        self._submit_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches_run = 0
+        self._requests_processed = 0
+        self._batch_failures = 0
+        self._rejected = 0
+        self._deadline_rejections: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self._batch_size_counts: Dict[int, int] = {}
+        self._recent_waits_ms: deque = deque(maxlen=1000)
+        self._recent_class_waits_ms: Dict[str, deque] = {
+            priority: deque(maxlen=1000) for priority in PRIORITIES
+        }
+        self._avg_batch_seconds: Optional[float] = None
+
+        self._workers = [
+            threading.Thread(target=self._run, name=f"batch-scheduler-{n}", daemon=True)
+            for n in range(self.concurrency)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of images waiting for the worker."""
+        return self._queue.qsize()
+
+    @property
+    def is_saturated(self) -> bool:
+        """Whether the queue is at capacity and new work will be rejected."""
+        return self.queue_depth >= self.max_queue_size
+
+    def has_capacity(self, priority: str = PRIORITY_INTERACTIVE) -> bool:
+        """Whether a request of this priority class would be admitted now."""
+        limit = self.max_queue_size
+        if priority == PRIORITY_BULK:
+            limit -= self.interactive_reserve
+        return self.queue_depth < limit
+
+    def submit(
+        self,
+        image_data: Any,
+        on_text: Optional[Callable[[str], None]] = None,
+        priority: str = PRIORITY_INTERACTIVE,
+        deadline: Optional[float] = None,
+    ) -> Future:
+        """
+        Queue an image for extraction.
+
+        Args:
+            image_data: Image URL, image bytes or decoded PIL image
+            on_text: Called from the worker thread with each newly decoded
+                chunk of output; streaming requests run as a batch of one
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BULK
+            deadline: time.monotonic() value after which the request is
+                failed with DeadlineExceededError instead of being run
+
+        Returns:
+            Future: Resolves to the metadata dict for this image
+
+        Raises:
+            QueueFullError: If the queue has no room for this priority class
+            DeadlineExceededError: If the deadline has already passed
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        request = _PendingRequest(
+            image_data=image_data, on_text=on_text, priority=priority, deadline=deadline
+        )
+        if request.expired(request.enqueued_at):
+            self._record_deadline_rejection(priority)
+            raise DeadlineExceededError()
+        with self._submit_lock:
+            if not self.has_capacity(priority):
+                with self._stats_lock:
+                    self._rejected += 1
+                QUEUE_REJECTIONS.inc()
+                raise QueueFullError(self.estimate_retry_after())
+            self._queue.put(request)
+            QUEUE_DEPTH.set(self.queue_depth)
+        return request.future
+
+    def raise_priority(self, future: Future, priority: str) -> bool:
+        """
+        Move a request that is still waiting to a higher priority class.
+
+        Used when a higher-priority request joins a lower-priority one
+        that computes the same result. The request keeps its deadline and
+        queues behind the requests already waiting in the new class.
+
+        Args:
+            future: Future returned by submit() for the request
+            priority: New priority class
+
+        Returns:
+            bool: Whether the request was waiting in a lower class and was moved
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        return self._queue.raise_priority(future, priority)
+
+    def estimate_retry_after(self) -> int:
+        """
+        Estimate how many seconds it takes to drain the current queue.
+
+        Returns:
+            int: Suggested Retry-After value in seconds (at least 1)
+        """
+        with self._stats_lock:
+            avg_batch_seconds = self._avg_batch_seconds
+        if avg_batch_seconds is None:
+            return 1
+        batches_ahead = math.ceil(self.queue_depth / (self.max_batch_size * self.concurrency))
+        return max(1, math.ceil(batches_ahead * avg_batch_seconds))
+
+    def shutdown(self):
+        """Stop the worker threads once the queued requests have been served."""
+        self._queue.close()
+        for worker in self._workers:
+            worker.join()
+
+    def _take(self, timeout: Optional[float] = None) -> Optional[_PendingRequest]:
+        """Next request by priority, failing expired ones on the way; None on timeout or shutdown."""
+        while True:
+            request = self._queue.get(timeout=timeout)
+            if request is None or not request.expired(time.monotonic()):
+                return request
+            # Never reaches the model; a caller that already left needs no answer
+            if request.future.set_running_or_notify_cancel():
+                request.future.set_exception(DeadlineExceededError())
+                self._record_deadline_rejection(request.priority)
+
+    def _collect_batch(self, first: _PendingRequest) -> List[_PendingRequest]:
+        """Gather more requests until the batch is full or the wait window closes."""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            request = self._take(timeout=remaining)
+            if request is None:
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        """Worker loop: block for a request, then batch and process it."""
+        while True:
+            first = self._take()
+            if first is None:
+                return
+            batch = self._collect_batch(first)
+            # Drop requests whose callers have already gone away
+            batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            self._record_waits(batch)
+            # Token streaming cannot be batched, so streamed requests run alone
+            batched = [r for r in batch if r.on_text is None]
+            if batched:
+                self._process(batched)
+            for request in batch:
+                if request.on_text is not None:
+                    self._process([request])
+
+    def _process(self, batch: List[_PendingRequest]):
+        """Run one batched extraction and resolve each caller's future."""
+        started = time.monotonic()
+        try:
+            results = self.vision_service.extract_metadata_batch(
+                [r.image_data for r in batch],
+                on_text=batch[0].on_text if len(batch) == 1 else None,
+            )
+        except Exception as e:
+            self._record_batch(len(batch), failed=True)
+            if len(batch) == 1:
+                batch[0].future.set_exception(e)
+                return
+            # One bad image must not fail its neighbours: retry individually
+            for request in batch:
+                self._process([request])
+            return
+
+        self._record_batch(len(batch), failed=False, seconds=time.monotonic() - started)
+        for request, result in zip(batch, results):
+            request.future.set_result(result)
+
+    def _record_waits(self, batch: List[_PendingRequest]):
+        """Record how long each request of a batch sat in the queue."""
+        now = time.monotonic()
+        QUEUE_DEPTH.set(self.queue_depth)
+        queue_wait = STAGE_SECONDS.labels(stage="queue_wait")
+        with self._stats_lock:
+            for request in batch:
+                waited = now - request.enqueued_at
+                self._recent_waits_ms.append(waited * 1000.0)
+                self._recent_class_waits_ms[request.priority].append(waited * 1000.0)
+                queue_wait.observe(waited)
+                QUEUE_WAIT_SECONDS.labels(priority=request.priority).observe(waited)
+
+    def _record_deadline_rejection(self, priority: str):
+        """Count a request failed because its deadline passed."""
+        with self._stats_lock:
+            self._deadline_rejections[priority] += 1
+        DEADLINE_REJECTIONS.labels(priority=priority).inc()
+
+    def _record_batch(self, size: int, failed: bool, seconds: float = 0.0):
+        """Update batch-size and batch-duration statistics."""
+        with self._stats_lock:
+            if failed:
+                self._batch_failures += 1
+                return
+            self._batches_run += 1
+            self._requests_processed += size
+            BATCH_SIZE.observe(size)
+            STAGE_SECONDS.labels(stage="inference").observe(seconds)
+            self._batch_size_counts[size] = self._batch_size_counts.get(size, 0) + 1
+            # Exponentially weighted so Retry-After follows recent load
+            if self._avg_batch_seconds is None:
+                self._avg_batch_seconds = seconds
+            else:
+                self._avg_batch_seconds = 0.8 * self._avg_batch_seconds + 0.2 * seconds
+
+    def get_queue_stats(self) -> dict:
+        """
+        Report queue depth and recent queue wait times.
+
+        Returns:
+            dict: Queue capacity, depth, saturation and wait-time summary
+        """
+        with self._stats_lock:
+            waits = sorted(self._recent_waits_ms)
+            class_waits = {
+                priority: sorted(recent) for priority, recent in self._recent_class_waits_ms.items()
+            }
+            rejected = self._rejected
+            deadline_rejections = dict(self._deadline_rejections)
+
+        def percentile(values: list, p: float) -> float:
+            if not values:
+                return 0.0
+            return round(values[min(len(values) - 1, int(p * len(values)))], 1)
+
+        return {
+            "depth": self.queue_depth,
+            "capacity": self.max_queue_size,
+            "saturated": self.is_saturated,
+            "rejected": rejected,
+            "wait_ms_p50": percentile(waits, 0.50),
+            "wait_ms_p95": percentile(waits, 0.95),
+            "wait_ms_max": round(waits[-1], 1) if waits else 0.0,
+            "retry_after_seconds": self.estimate_retry_after(),
+            "interactive_reserve": self.interactive_reserve,
+            "bulk_share": self._queue.bulk_share,
+            "by_priority": {
+                priority: {
+                    "depth": self._queue.qsize(priority),
+                    "wait_ms_p50": percentile(class_waits[priority], 0.50),
+                    "wait_ms_p95": percentile(class_waits[priority], 0.95),
+                    "wait_ms_max": round(class_waits[priority][-1], 1) if class_waits[priority] else 0.0,
+                    "deadline_rejections": deadline_rejections[priority],
+                }
+                for priority in PRIORITIES
+            },
+        }
+
+    def get_stats(self) -> dict:
+        """
+        Report how full batches actually are.
+
+        Returns:
+            dict: Batch configuration, counts and fill statistics
+        """
+        with self._stats_lock:
+            batches = self._batches_run
+            processed = self._requests_processed
+            avg_size = processed / batches if batches else 0.0
+            return {
+                "max_batch_size": self.max_batch_size,
+                "concurrency": self.concurrency,
+                "max_wait_ms": self.max_wait_ms,
+                "batches_run": batches,
+                "batch_failures": self._batch_failures,
+                "requests_processed": processed,
+                "avg_batch_size": round(avg_size, 3),
+                "avg_fill_ratio": round(avg_size / self.max_batch_size, 3),
+                "batch_size_histogram": {
+                    str(size): count
+                    for size, count in sorted(self._batch_size_counts.items())
+                },
+                "avg_batch_seconds": (
+                    round(self._avg_batch_seconds, 3)
+                    if self._avg_batch_seconds is not None else None
+                ),
+            }
+
+
+# Global instance
+_batch_scheduler: Optional[BatchScheduler] = None
+_batch_scheduler_lock = threading.Lock()
+
+
+def get_batch_scheduler() -> BatchScheduler:
+    """
+    Get or create the global batch scheduler instance.
+
+    Returns:
+        BatchScheduler: The global batch scheduler instance
+    """
+    global _batch_scheduler
+    if _batch_scheduler is None:
+        with _batch_scheduler_lock:
+            if _batch_scheduler is None:
+                _batch_scheduler = BatchScheduler(get_vision_service())
+    return _batch_scheduler
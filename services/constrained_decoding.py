@@ -0,0 +1,347 @@
+"""
+Schema-constrained decoding for the task1_v1 JSON output.
+
+A logits processor walks each row's output through the JSON automaton from
+utils/json_grammar.py and masks every token that would make the output
+invalid: broken syntax, comments, trailing commas, prose after the object,
+or an enum value the schema does not list.
+
+Checking all ~150k vocabulary entries at every step would cost more than
+the forward pass, so masks are memoized per automaton state (states are
+small tuples, and a generation revisits the same few hundred of them).
+Computing a missing mask only simulates tokens that can possibly be
+accepted: tokens are bucketed by their first (non-whitespace) character,
+and inside strings every token without a quote, backslash or control
+character is accepted without simulation.
+
+Each mask is one bool per vocabulary entry (~150 KB for Qwen2.5-VL), so
+the CONSTRAINED_MASK_CACHE_SIZE most recently used ones are kept in CPU
+memory rather than next to the model, and each decoding step copies one
+mask per row to the logits device.
+"""
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+import torch
+from transformers import LogitsProcessor
+
+from utils.config import CONSTRAINED_MASK_CACHE_SIZE
+from utils.json_grammar import (
+    DONE,
+    FREE_TEXT_MODES,
+    INITIAL_STATE,
+    WHITESPACE,
+    WS_SELF_LOOP_MODES,
+    JSONGrammar,
+    State,
+    extract_enum_constraints,
+)
+
+
+class GrammarTokenTables:
+    """Vocabulary tables and memoized per-state token masks for one tokenizer."""
+
+    def __init__(
+        self,
+        tokenizer,
+        grammar: JSONGrammar,
+        vocab_size: int,
+        eos_token_ids: Iterable[int],
+        max_cached_masks: int = CONSTRAINED_MASK_CACHE_SIZE,
+    ):
+        """
+        Decode the vocabulary once and index it for mask computation.
+
+        Args:
+            tokenizer: Tokenizer of the model being constrained
+            grammar: JSON automaton to enforce
+            vocab_size: Width of the model's logits (may exceed len(tokenizer))
+            eos_token_ids: Tokens that end generation; allowed once the object closes
+            max_cached_masks: Number of state masks kept (least recently
+                used ones are recomputed when needed again)
+        """
+        self.grammar = grammar
+        self.vocab_size = vocab_size
+        self.max_cached_masks = max(1, max_cached_masks)
+        self.eos_token_ids = sorted(set(eos_token_ids))
+        special_ids = set(tokenizer.all_special_ids) | set(tokenizer.added_tokens_decoder)
+
+        # None marks tokens that can never appear in the JSON text
+        self.token_text: List[Optional[str]] = [None] * vocab_size
+        free_text_ids, whitespace_ids = [], []
+        self._by_first_char: Dict[str, List[int]] = {}
+        self._by_first_non_ws: Dict[str, List[int]] = {}
+        self._needs_check_in_strings: List[int] = []
+
+        for token_id in range(min(len(tokenizer), vocab_size)):
+            if token_id in special_ids:
+                continue
+            text = tokenizer.decode([token_id])
+            if not text:
+                continue
+            self.token_text[token_id] = text
+            self._by_first_char.setdefault(text[0], []).append(token_id)
+            stripped = text.lstrip(WHITESPACE)
+            if stripped:
+                self._by_first_non_ws.setdefault(stripped[0], []).append(token_id)
+            else:
+                whitespace_ids.append(token_id)
+            if '"' in text or "\\" in text or min(text) < " ":
+                self._needs_check_in_strings.append(token_id)
+            else:
+                free_text_ids.append(token_id)
+
+        self._free_text_mask = self._ids_to_mask(free_text_ids)
+        self._whitespace_mask = self._ids_to_mask(whitespace_ids)
+        self._masks: "OrderedDict[State, torch.Tensor]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _ids_to_mask(self, token_ids: List[int]) -> torch.Tensor:
+        mask = torch.zeros(self.vocab_size, dtype=torch.bool)
+        if token_ids:
+            mask[torch.tensor(token_ids, dtype=torch.long)] = True
+        return mask
+
+    def advance(self, state: State, token_id: int) -> Optional[State]:
+        """
+        Feed one generated token through the automaton.
+
+        Args:
+            state: Current state
+            token_id: Generated token
+
+        Returns:
+            State or None: The new state, or None if the token is not allowed
+        """
+        text = self.token_text[token_id] if token_id < self.vocab_size else None
+        if text is None:
+            return None
+        return self.grammar.advance(state, text)
+
+    def blocked_mask(self, state: State) -> torch.Tensor:
+        """
+        Tokens that are not allowed in a state, as a bool mask on the CPU.
+
+        Args:
+            state: Automaton state
+
+        Returns:
+            torch.Tensor: True for every token that must be suppressed
+        """
+        with self._lock:
+            blocked = self._masks.get(state)
+            if blocked is not None:
+                self._masks.move_to_end(state)
+                self._hits += 1
+                return blocked
+            self._misses += 1
+        blocked = ~self._compute_allowed(state)
+        with self._lock:
+            self._masks[state] = blocked
+            while len(self._masks) > self.max_cached_masks:
+                self._masks.popitem(last=False)
+        return blocked
+
+    def _compute_allowed(self, state: State) -> torch.Tensor:
+        """Simulate the candidate tokens for a state."""
+        mode, aux = state[0], state[1]
+        if mode in FREE_TEXT_MODES and aux == 0:
+            allowed = self._free_text_mask.clone()
+            candidates = self._needs_check_in_strings
+        else:
+            if mode in WS_SELF_LOOP_MODES:
+                # Leading whitespace never changes these states
+                allowed = self._whitespace_mask.clone()
+                buckets = self._by_first_non_ws
+            else:
+                allowed = torch.zeros(self.vocab_size, dtype=torch.bool)
+                buckets = self._by_first_char
+            candidates = [
+                token_id
+                for char, token_ids in buckets.items()
+                if self.grammar.step(state, char) is not None
+                for token_id in token_ids
+            ]
+
+        advance = self.grammar.advance
+        token_text = self.token_text
+        accepted = [token_id for token_id in candidates if advance(state, token_text[token_id]) is not None]
+        if accepted:
+            allowed[torch.tensor(accepted, dtype=torch.long)] = True
+        if mode == DONE and self.eos_token_ids:
+            allowed[torch.tensor(self.eos_token_ids, dtype=torch.long)] = True
+        return allowed
+
+    def warm_up(self, tokenizer, samples: Iterable[str]):
+        """
+        Precompute masks for every state visited while generating sample documents.
+
+        Args:
+            tokenizer: Tokenizer used to split the samples into tokens
+            samples: JSON documents representative of real output
+        """
+        for sample in samples:
+            state = INITIAL_STATE
+            for token_id in tokenizer(sample, add_special_tokens=False).input_ids:
+                self.blocked_mask(state)
+                state = self.advance(state, token_id)
+                if state is None:
+                    break
+        # The hit rate should describe generation, not the warm-up
+        with self._lock:
+            self._hits = self._misses = 0
+
+    def cached_masks(self) -> int:
+        """Number of memoized state masks."""
+        with self._lock:
+            return len(self._masks)
+
+    def get_stats(self) -> dict:
+        """
+        Report mask cache size and hit rate.
+
+        Returns:
+            dict: Constrained-decoding mask cache statistics
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "cached_masks": len(self._masks),
+                "max_cached_masks": self.max_cached_masks,
+                "cached_mask_bytes": len(self._masks) * self.vocab_size,
+                "mask_hits": self._hits,
+                "mask_misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+class JSONGrammarLogitsProcessor(LogitsProcessor):
+    """Mask tokens that would take a row's output outside the JSON grammar."""
+
+    def __init__(self, tables: GrammarTokenTables, prompt_length: int, batch_size: int):
+        """
+        Initialize per-row automaton state.
+
+        Args:
+            tables: Shared vocabulary tables and mask cache
+            prompt_length: Length of the (padded) prompt in tokens
+            batch_size: Number of rows being generated
+        """
+        self.tables = tables
+        self.prompt_length = prompt_length
+        self._states: List[Optional[State]] = [INITIAL_STATE] * batch_size
+        self._seen = 0
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        new_tokens = input_ids[:, self.prompt_length + self._seen:].tolist()
+        self._seen = input_ids.shape[1] - self.prompt_length
+
+        rows = []
+        for row, tokens in enumerate(new_tokens):
+            state = self._states[row]
+            for token_id in tokens:
+                if state is None or state[0] == DONE:
+                    # Unconstrained row, or one that is only padding from here on
+                    break
+                state = self.tables.advance(state, token_id)
+                if state is None:
+                    print(f"Warning: constrained decoding lost track of row {row}; leaving it unconstrained")
+            self._states[row] = state
+            rows.append(state)
+
+        width = scores.shape[-1]
+        # Assembled on the CPU, where the cached masks live, then copied once
+        blocked = torch.zeros(scores.shape, dtype=torch.bool)
+        for row, state in enumerate(rows):
+            if state is None:
+                continue
+            mask = self.tables.blocked_mask(state)
+            if mask.shape[0] >= width:
+                blocked[row] = mask[:width]
+            else:
+                blocked[row, :mask.shape[0]] = mask
+                blocked[row, mask.shape[0]:] = True
+        return scores.masked_fill(blocked.to(scores.device), float("-inf"))
+
+
+def schema_samples(prompt: str, enums: Dict[str, frozenset]) -> List[str]:
+    """
+    Turn the JSON shapes documented in a schema prompt into valid sample documents.
+
+    Comments are dropped and "a | b" option strings replaced by their first
+    option, so the samples walk the automaton through typical states.
+
+    Args:
+        prompt: Schema prompt text
+        enums: Enum constraints enforced by the grammar
+
+    Returns:
+        list: JSON documents
+    """
+    text = re.sub(r"//[^\n]*", "", prompt)
+    samples = []
+    start = text.find("{")
+    while start >= 0:
+        depth, end = 0, start
+        for end in range(start, len(text)):
+            if text[end] == "{":
+                depth += 1
+            elif text[end] == "}":
+                depth -= 1
+                if depth == 0:
+                    break
+        try:
+            shape = json.loads(text[start:end + 1])
+        except ValueError:
+            shape = None
+        if isinstance(shape, dict):
+            samples.append(json.dumps(_first_options(shape, enums), indent=2, ensure_ascii=False))
+        start = text.find("{", end + 1)
+    return samples
+
+
+def _first_options(value, enums: Dict[str, frozenset], key: Optional[str] = None):
+    """Replace enum option lists in a documented shape by one valid option."""
+    if isinstance(value, dict):
+        return {k: _first_options(v, enums, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_first_options(v, enums, key) for v in value]
+    if isinstance(value, str) and key in enums and value not in enums[key]:
+        option = value.split("|")[0].strip()
+        return option if option in enums[key] else None
+    return value
+
+
+def build_grammar_tables(model, processor, system_prompt: str) -> Optional[GrammarTokenTables]:
+    """
+    Build the constrained-decoding tables, falling back to free decoding if it fails.
+
+    Args:
+        model: Loaded model
+        processor: Matching processor
+        system_prompt: Schema prompt the grammar and its enums are derived from
+
+    Returns:
+        GrammarTokenTables or None: The tables, or None if they could not be built
+    """
+    try:
+        tokenizer = processor.tokenizer
+        enums = extract_enum_constraints(system_prompt)
+        eos_token_ids = model.generation_config.eos_token_id
+        if eos_token_ids is None:
+            eos_token_ids = tokenizer.eos_token_id
+        if isinstance(eos_token_ids, int):
+            eos_token_ids = [eos_token_ids]
+        vocab_size = max(len(tokenizer), model.get_output_embeddings().weight.shape[0])
+        tables = GrammarTokenTables(tokenizer, JSONGrammar(enums), vocab_size, eos_token_ids)
+        tables.warm_up(tokenizer, schema_samples(system_prompt, enums))
+    except Exception as e:
+        print(f"Warning: could not build constrained-decoding tables: {e}")
+        return None
+    print(f"Constrained decoding ready ({len(enums)} enum fields, {tables.cached_masks()} masks precomputed)")
+    return tables
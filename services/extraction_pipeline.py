@@ -0,0 +1,503 @@
+"""
+Extraction pipeline shared by the API endpoints.
+
+URLs are downloaded concurrently through the shared async fetcher, so
+network time overlaps with inference on other images. Each image is then
+decoded once, looked up in the result cache by its content hash, then by
+perceptual hash among near-duplicates and, on a miss, trimmed and resized
+into the vision-token budget and queued on the batch scheduler.
+
+Identical requests that arrive while one is still running are coalesced:
+the same URL shares one download and extraction, and the same image
+content (uploads, or different URLs serving the same file) shares one
+generation. An interactive request that joins a bulk one raises it to
+the interactive class, so it never waits behind bulk work.
+"""
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Optional, Tuple, Union
+from urllib.parse import urlsplit, urlunsplit
+
+from PIL import Image
+
+from services.batch_scheduler import (
+    PRIORITIES,
+    PRIORITY_INTERACTIVE,
+    BatchScheduler,
+    DeadlineExceededError,
+    QueueFullError,
+    get_batch_scheduler,
+)
+from services.image_fetcher import ImageFetcher, get_image_fetcher
+from services.metrics import CACHE_LOOKUPS, observe_stage
+from services.near_duplicate_index import NearDuplicateIndex, get_near_duplicate_index
+from services.result_cache import ResultCache, get_result_cache
+from services.single_flight import SingleFlight
+from utils.compact_format import expand_compact_section
+from utils.config import COMPACT_OUTPUT, DATA_ONLY_EXTRACTION, PHASH_ENABLED
+from utils.derived_fields import fill_derived_fields_section
+from utils.image_loader import image_content_hash, load_image_from_bytes
+from utils.image_preprocessing import preprocess_image
+from utils.incremental_json import IncrementalSectionParser
+from utils.json_repair import is_truncated
+from utils.perceptual_hash import fingerprint
+
+
+@dataclass
+class ExtractionResult:
+    """Metadata for one image plus how it was produced."""
+    metadata: dict
+    cache_hit: bool
+    near_duplicate: bool = False
+
+
+@dataclass
+class _Admission:
+    """How a request enters the inference queue."""
+    wait_for_capacity: bool = False
+    priority: str = PRIORITY_INTERACTIVE
+    deadline: Optional[float] = None
+    # Scheduler future of the image this request submitted, once queued
+    future: Optional[Future] = None
+    # Admission of the in-flight run this request joined
+    joined: Optional["_Admission"] = None
+
+    def expired(self) -> bool:
+        """Whether the deadline (a time.monotonic() value) has passed."""
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+
+@dataclass
+class _PreparedImage:
+    """A decoded image with its cache lookup outcome."""
+    image: Image.Image
+    cache_key: str
+    perceptual_hash: Optional[int] = None
+    aspect_ratio: float = 1.0
+    cached: Optional[dict] = None
+    near_duplicate: bool = False
+
+
+class ExtractionPipeline:
+    """Load, cache-check and extract metadata for a single image."""
+
+    def __init__(
+        self,
+        scheduler: BatchScheduler,
+        cache: ResultCache,
+        near_duplicates: Optional[NearDuplicateIndex] = None,
+        fetcher: Optional[ImageFetcher] = None,
+        coalesce: bool = True,
+    ):
+        """
+        Initialize the pipeline.
+
+        Args:
+            scheduler: Batch scheduler used for inference
+            cache: Result cache consulted before inference
+            near_duplicates: Perceptual-hash index consulted after an exact
+                cache miss (None disables near-duplicate lookup)
+            fetcher: Downloader for image URLs
+            coalesce: Share one extraction among identical concurrent requests
+        """
+        self.scheduler = scheduler
+        self.cache = cache
+        self.near_duplicates = near_duplicates
+        self.fetcher = fetcher or ImageFetcher()
+        self.coalesce = coalesce
+        self._url_flights = SingleFlight("url")
+        self._content_flights = SingleFlight("content")
+
+    async def _load(self, source: Union[str, bytes]) -> _PreparedImage:
+        """Download (if needed), decode and cache-check an image."""
+        if isinstance(source, bytes):
+            image_bytes = source
+        else:
+            with observe_stage("fetch"):
+                image_bytes = await self.fetcher.fetch(source)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(self._prepare, image_bytes)
+        )
+
+    def _prepare(self, image_bytes: bytes) -> _PreparedImage:
+        """
+        Decode an image and look it up in the cache (blocking).
+
+        This is the only place an image is decoded; everything after it,
+        down to the vision processor, works on the decoded image.
+
+        Args:
+            image_bytes: Encoded image data
+
+        Returns:
+            _PreparedImage: Cache key and any cached metadata; on a miss, the
+                image preprocessed for inference
+        """
+        with observe_stage("decode_image"):
+            image = load_image_from_bytes(image_bytes)
+        with observe_stage("cache_lookup"):
+            prepared = self._lookup(image)
+        if prepared.cached is not None:
+            CACHE_LOOKUPS.labels(outcome="near_hit" if prepared.near_duplicate else "hit").inc()
+            return prepared
+
+        CACHE_LOOKUPS.labels(outcome="miss").inc()
+        self.cache.record_miss()
+        with observe_stage("preprocess"):
+            prepared.image = preprocess_image(image)
+        return prepared
+
+    def _lookup(self, image: Image.Image) -> _PreparedImage:
+        """Find cached metadata for an image, by content hash and then among near-duplicates."""
+        prepared = _PreparedImage(
+            image=image, cache_key=self.cache.make_key(image_content_hash(image))
+        )
+        prepared.cached = self.cache.get(prepared.cache_key, count_miss=False)
+        if prepared.cached is not None or self.near_duplicates is None:
+            return prepared
+
+        prepared.perceptual_hash, prepared.aspect_ratio = fingerprint(image)
+        candidates = self.near_duplicates.find(prepared.perceptual_hash, prepared.aspect_ratio)
+        for _, candidate_key in candidates:
+            prepared.cached = self.cache.get(candidate_key, count_miss=False)
+            if prepared.cached is not None:
+                prepared.near_duplicate = True
+                self.near_duplicates.record_hit()
+                return prepared
+            # Evicted or expired; stop offering it as a candidate
+            self.near_duplicates.remove(candidate_key)
+        return prepared
+
+    async def _run_inference(self, image: Image.Image, admission: _Admission) -> dict:
+        """Queue an image on the scheduler and await its metadata."""
+        def submit() -> Future:
+            # Read at submit time: a joining request may have raised it
+            admission.future = self.scheduler.submit(
+                image, priority=admission.priority, deadline=admission.deadline
+            )
+            return admission.future
+
+        if not admission.wait_for_capacity:
+            return await asyncio.wrap_future(submit())
+
+        # Admitted batch work feeds its images in as capacity frees up
+        # rather than failing halfway through
+        while True:
+            if self.scheduler.has_capacity(admission.priority):
+                try:
+                    return await asyncio.wrap_future(submit())
+                except QueueFullError:
+                    pass
+            elif admission.expired():
+                # Waited for room past the deadline: submit() rejects and counts it
+                return await asyncio.wrap_future(submit())
+            await asyncio.sleep(0.1)
+
+    async def extract(
+        self,
+        source: Union[str, bytes],
+        wait_for_capacity: bool = False,
+        priority: str = PRIORITY_INTERACTIVE,
+        deadline: Optional[float] = None,
+    ) -> ExtractionResult:
+        """
+        Extract metadata for one image, serving it from cache when possible.
+
+        A request for a URL or image content that is already being
+        extracted waits for that extraction and gets its result (or error)
+        instead of running its own, raising its priority class if it was
+        lower than this request's.
+
+        Args:
+            source: Image URL or image bytes
+            wait_for_capacity: Wait for room in the inference queue instead
+                of raising QueueFullError
+            priority: Scheduling class, PRIORITY_INTERACTIVE or PRIORITY_BULK
+            deadline: time.monotonic() value after which the image is no
+                longer sent to the model
+
+        Returns:
+            ExtractionResult: The metadata and whether it was a cache hit
+
+        Raises:
+            ImageFetchError: If the image URL cannot be downloaded
+            InvalidImageError: If the image data cannot be decoded
+            QueueFullError: If the queue is full and wait_for_capacity is False
+            DeadlineExceededError: If the deadline passed before inference started
+        """
+        admission = _Admission(wait_for_capacity, priority, deadline)
+        if not self.coalesce or not isinstance(source, str):
+            return await self._extract(source, admission)
+        return await self._coalesced(
+            self._url_flights, _url_key(source), lambda: self._extract(source, admission), admission
+        )
+
+    async def _extract(self, source: Union[str, bytes], admission: _Admission) -> ExtractionResult:
+        """Load an image and extract it, joining an in-flight extraction of the same content."""
+        prepared = await self._load(source)
+        if prepared.cached is not None:
+            return ExtractionResult(
+                metadata=prepared.cached,
+                cache_hit=True,
+                near_duplicate=prepared.near_duplicate,
+            )
+        if not self.coalesce:
+            return await self._infer(prepared, admission)
+        return await self._coalesced(
+            self._content_flights,
+            prepared.cache_key,
+            lambda: self._infer(prepared, admission, recheck_cache=True),
+            admission,
+        )
+
+    async def _coalesced(self, flights: SingleFlight, key, work, admission: _Admission) -> ExtractionResult:
+        """Run work through a single-flight registry, retrying failures that belong only to the run joined."""
+        while True:
+            admission.joined = None
+            try:
+                return await flights.run(
+                    key, work, context=admission, on_join=functools.partial(self._join, admission)
+                )
+            except QueueFullError:
+                # Joined a request that did not wait for room in the queue;
+                # this one does, so it starts (or joins) a fresh attempt
+                if not admission.wait_for_capacity:
+                    raise
+                await asyncio.sleep(0.1)
+            except DeadlineExceededError:
+                # Likewise for a request with an earlier deadline
+                if admission.expired():
+                    raise
+
+    def _join(self, admission: _Admission, leader: _Admission):
+        """Remember the run a request joined and raise it to the request's priority class if that is higher."""
+        admission.joined = leader
+        rank = PRIORITIES.index(admission.priority)
+        # Along the chain of runs it waits on (a URL run may itself have joined a content run)
+        while leader is not None:
+            if rank < PRIORITIES.index(leader.priority):
+                leader.priority = admission.priority
+                if leader.future is not None and not leader.future.done():
+                    self.scheduler.raise_priority(leader.future, admission.priority)
+            leader = leader.joined
+
+    async def _infer(
+        self, prepared: _PreparedImage, admission: _Admission, recheck_cache: bool = False
+    ) -> ExtractionResult:
+        """
+        Run inference on a prepared image and cache the result.
+
+        Args:
+            prepared: Image that missed the cache
+            admission: How it enters the inference queue
+            recheck_cache: Look the image up again first; a run for the
+                same content may have stored its result and finished
+                between this request's lookup and its start
+        """
+        loop = asyncio.get_running_loop()
+        if recheck_cache:
+            cached = await loop.run_in_executor(
+                None, functools.partial(self.cache.get, prepared.cache_key, count_miss=False)
+            )
+            if cached is not None:
+                return ExtractionResult(metadata=cached, cache_hit=True)
+        metadata = await self._run_inference(prepared.image, admission)
+        await loop.run_in_executor(None, functools.partial(self._store, prepared, metadata))
+        return ExtractionResult(metadata=metadata, cache_hit=False)
+
+    async def open_stream(
+        self,
+        source: Union[str, bytes],
+        priority: str = PRIORITY_INTERACTIVE,
+        deadline: Optional[float] = None,
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Start a streamed extraction.
+
+        The image is loaded and admitted to the inference queue before this
+        returns, so a full queue surfaces as QueueFullError rather than as
+        an error event halfway through a response.
+
+        Streams are not coalesced with other requests: each one needs its
+        own generation to relay text as it is decoded.
+
+        Args:
+            source: Image URL or image bytes
+            priority: Scheduling class, PRIORITY_INTERACTIVE or PRIORITY_BULK
+            deadline: time.monotonic() value after which the image is no
+                longer sent to the model (an "error" event if it passes in
+                the queue)
+
+        Returns:
+            AsyncIterator: (event, data) pairs:
+                ("delta", {"text": ...}) for each decoded chunk,
+                ("section", {"key": ..., "value": ...}) for each completed
+                top-level member of the output object,
+                ("done", {"cached": ..., "metadata": ...}) at the end, or
+                ("error", {"detail": ...}) if extraction fails
+
+        Raises:
+            ImageFetchError: If the image URL cannot be downloaded
+            InvalidImageError: If the image data cannot be decoded
+            QueueFullError: If the inference queue is full
+            DeadlineExceededError: If the deadline has already passed
+        """
+        prepared = await self._load(source)
+        if prepared.cached is not None:
+            return self._replay_cached(prepared)
+
+        loop = asyncio.get_running_loop()
+        chunks: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+
+        def on_text(text: str):
+            loop.call_soon_threadsafe(chunks.put_nowait, text)
+
+        future = self.scheduler.submit(
+            prepared.image, on_text=on_text, priority=priority, deadline=deadline
+        )
+        # Text callbacks and completion happen on the same worker thread, so
+        # the end-of-stream marker always arrives after the last chunk
+        future.add_done_callback(
+            lambda _: loop.call_soon_threadsafe(chunks.put_nowait, None)
+        )
+        return self._stream_generation(prepared, future, chunks)
+
+    async def _replay_cached(self, prepared: _PreparedImage) -> AsyncIterator[Tuple[str, Any]]:
+        """Emit a cached result as if it had just been generated."""
+        for key, value in prepared.cached.items():
+            yield "section", {"key": key, "value": value}
+        yield "done", {
+            "cached": True,
+            "near_duplicate": prepared.near_duplicate,
+            "metadata": prepared.cached,
+        }
+
+    async def _stream_generation(self, prepared: _PreparedImage, future, chunks) -> AsyncIterator[Tuple[str, Any]]:
+        """Relay decoded text and completed sections, then the final result."""
+        parser = IncrementalSectionParser()
+        topic_context = None
+        try:
+            while True:
+                text = await chunks.get()
+                if text is None:
+                    break
+                yield "delta", {"text": text}
+                for key, value in parser.feed(text):
+                    value = _final_form(key, value, topic_context)
+                    if key == "topic_context":
+                        topic_context = value
+                    yield "section", {"key": key, "value": value}
+        finally:
+            # Client went away before generation started: drop the request
+            future.cancel()
+
+        try:
+            metadata = future.result()
+        except Exception as e:
+            yield "error", {"detail": f"Failed to extract metadata: {str(e)}"}
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, functools.partial(self._store, prepared, metadata))
+        yield "done", {"cached": False, "near_duplicate": False, "metadata": metadata}
+
+    def get_coalescing_stats(self) -> dict:
+        """
+        Get statistics on coalesced duplicate requests.
+
+        Returns:
+            dict: Per key kind ("url", "content"), runs started, requests
+                that joined one in flight, and keys in flight
+        """
+        return {
+            "enabled": self.coalesce,
+            "url": self._url_flights.get_stats(),
+            "content": self._content_flights.get_stats(),
+        }
+
+    def _store(self, prepared: _PreparedImage, metadata: dict):
+        """Cache a fresh result and index the image for near-duplicate lookup."""
+        if "error" in metadata or is_truncated(metadata):
+            # Regenerate next time rather than serve a failed or partial result
+            return
+        self.cache.put(prepared.cache_key, metadata)
+        if prepared.perceptual_hash is not None:
+            self.near_duplicates.add(
+                prepared.perceptual_hash, prepared.aspect_ratio, prepared.cache_key
+            )
+
+
+def _final_form(key: str, value: Any, topic_context: Any) -> Any:
+    """
+    Bring a streamed section into the form it has in the final result.
+
+    Sections are task1_v1 like the final result (deltas stay raw): compact
+    visuals are expanded and, in data-only mode, get their derived blocks.
+    global_semantics.extremes_summary is only in the final result.
+
+    Args:
+        key: Top-level key
+        value: Its parsed value
+        topic_context: The topic_context section if already streamed
+
+    Returns:
+        The section value, as parsed if post-processing it failed
+    """
+    try:
+        if COMPACT_OUTPUT:
+            value = expand_compact_section(key, value)
+        if DATA_ONLY_EXTRACTION:
+            value = fill_derived_fields_section(key, value, topic_context)
+    except Exception as e:
+        # The final result carries the failure as an extraction warning
+        print(f"Warning: failed to post-process streamed section {key}: {type(e).__name__}: {e}")
+    return value
+
+
+def _url_key(url: str) -> str:
+    """
+    Normalize a URL for in-flight deduplication.
+
+    Scheme and host are case-insensitive and default ports and fragments
+    never reach the server, so they do not make two requests different;
+    path and query are kept as they are.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if ":" in host:
+        host = f"[{host}]"
+    if parts.port is not None and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    if parts.username or parts.password:
+        host = f"{parts.username or ''}:{parts.password or ''}@{host}"
+    return urlunsplit((scheme, host, parts.path or "/", parts.query, ""))
+
+
+# Global instance
+_extraction_pipeline: Optional[ExtractionPipeline] = None
+_extraction_pipeline_lock = threading.Lock()
+
+
+def get_extraction_pipeline() -> ExtractionPipeline:
+    """
+    Get or create the global extraction pipeline instance.
+
+    Returns:
+        ExtractionPipeline: The global extraction pipeline instance
+    """
+    global _extraction_pipeline
+    if _extraction_pipeline is None:
+        with _extraction_pipeline_lock:
+            if _extraction_pipeline is None:
+                _extraction_pipeline = ExtractionPipeline(
+                    get_batch_scheduler(),
+                    get_result_cache(),
+                    get_near_duplicate_index() if PHASH_ENABLED else None,
+                    get_image_fetcher(),
+                )
+    return _extraction_pipeline
@@ -0,0 +1,337 @@
+"""
+Stand-in inference backend for load-testing without a GPU.
+
+Returns canned task1_v1 documents and sleeps for as long as the real model
+would roughly take to produce them: a prefill cost per image (prefill is
+compute-bound, so it grows with the batch) plus a per-token decode cost
+paid once per step for the whole batch (decode is memory-bound, so a batch
+of N advances N outputs per step). Batching, caching, queueing and the
+endpoints therefore behave as they would in front of the real model, on a
+plain CPU box.
+
+Outputs are picked deterministically from the image content, so the same
+image always gets the same metadata. Recorded real outputs can be used
+instead of the built-in samples by pointing FAKE_OUTPUTS_DIR at a folder
+of *.json files. With DATA_ONLY_EXTRACTION the derived blocks are removed
+from the canned outputs (so they are shorter, as the model's would be) and
+computed after "decoding", as with the real model; with COMPACT_OUTPUT the
+outputs are written in the compact format and expanded after "decoding".
+"""
+import glob
+import hashlib
+import json
+import math
+import os
+import random
+import time
+from typing import Callable, List, Optional
+
+import orjson
+from PIL import Image
+
+from services.inference_backend import InferenceBackend
+from services.metrics import observe_stage, record_generation
+from utils.compact_format import compact_document, expand_compact
+from utils.config import (
+    COMPACT_OUTPUT,
+    DATA_ONLY_EXTRACTION,
+    FAKE_OUTPUTS_DIR,
+    FAKE_PER_TOKEN_MS,
+    FAKE_PREFILL_MS,
+)
+from utils.derived_fields import fill_derived_fields, strip_derived_fields
+
+# Rough characters per BPE token for indented JSON output
+_CHARS_PER_TOKEN = 4
+
+# Built-in samples generated when no outputs directory is configured
+_BUILTIN_SAMPLES = 8
+
+_YEARS = [str(year) for year in range(1990, 2030, 5)]
+_COUNTRIES = ["Canada", "Australia", "Japan", "Brazil", "Germany", "India"]
+
+
+class FakeVisionBackend(InferenceBackend):
+    """Answers with canned metadata after a simulated prefill/decode delay."""
+
+    backend_name = "fake"
+
+    def __init__(
+        self,
+        prefill_ms: float = FAKE_PREFILL_MS,
+        per_token_ms: float = FAKE_PER_TOKEN_MS,
+        outputs_dir: Optional[str] = FAKE_OUTPUTS_DIR,
+        data_only: bool = DATA_ONLY_EXTRACTION,
+        compact: bool = COMPACT_OUTPUT,
+    ):
+        """
+        Initialize the backend and load its canned outputs.
+
+        Args:
+            prefill_ms: Simulated prefill time per image
+            per_token_ms: Simulated time per decoding step
+            outputs_dir: Folder of *.json task1_v1 documents to answer with
+                (None or "" uses built-in samples)
+            data_only: Answer with raw values only and compute the derived
+                blocks, like the data-only extraction mode
+            compact: Answer in the compact columnar format and expand it,
+                like the compact output mode
+        """
+        self.prefill_ms = max(0.0, prefill_ms)
+        self.per_token_ms = max(0.0, per_token_ms)
+        self.model_name = "fake"
+        self._outputs = _load_outputs(outputs_dir) if outputs_dir else []
+        if not self._outputs:
+            self._outputs = [
+                json.dumps(_sample_document(seed), indent=2, ensure_ascii=False)
+                for seed in range(_BUILTIN_SAMPLES)
+            ]
+        self.data_only = data_only
+        if data_only:
+            self._outputs = [
+                json.dumps(strip_derived_fields(json.loads(text)), indent=2, ensure_ascii=False)
+                for text in self._outputs
+            ]
+        self.compact = compact
+        if compact:
+            self._outputs = [
+                json.dumps(compact_document(json.loads(text)), indent=2, ensure_ascii=False)
+                for text in self._outputs
+            ]
+        print(f"Fake inference backend: {len(self._outputs)} canned output(s), "
+              f"{self.prefill_ms:g} ms prefill, {self.per_token_ms:g} ms/token")
+
+    def _pick_output(self, image_data) -> str:
+        """The canned output for an image, chosen by its content."""
+        digest = hashlib.blake2b(_image_bytes(image_data), digest_size=8).digest()
+        return self._outputs[int.from_bytes(digest, "big") % len(self._outputs)]
+
+    def extract_metadata_batch(
+        self,
+        images: List,
+        on_text: Optional[Callable[[str], None]] = None,
+    ) -> List[dict]:
+        """
+        Return canned metadata for each image after the simulated latency.
+
+        Args:
+            images: Image URLs, image bytes or decoded PIL images
+            on_text: Called with each simulated token of output text; only
+                supported for a single image
+
+        Returns:
+            list: Metadata for each image, in input order
+        """
+        if on_text is not None and len(images) != 1:
+            raise ValueError("Streaming output is only supported for a single image")
+        outputs = [self._pick_output(image) for image in images]
+        tokens = [math.ceil(len(text) / _CHARS_PER_TOKEN) for text in outputs]
+        started = time.perf_counter()
+        time.sleep(self.prefill_ms * len(images) / 1000)
+
+        prefill_done_at = time.perf_counter()
+        if on_text is None:
+            time.sleep(self.per_token_ms * max(tokens) / 1000)
+        else:
+            text = outputs[0]
+            for start in range(0, len(text), _CHARS_PER_TOKEN):
+                time.sleep(self.per_token_ms / 1000)
+                on_text(text[start:start + _CHARS_PER_TOKEN])
+        record_generation(prefill_done_at - started, time.perf_counter() - prefill_done_at, tokens)
+
+        with observe_stage("json_parse"):
+            results = [orjson.loads(text) for text in outputs]
+        if self.compact:
+            with observe_stage("expand_compact"):
+                for metadata in results:
+                    expand_compact(metadata)
+        if self.data_only:
+            with observe_stage("derive_fields"):
+                for metadata in results:
+                    fill_derived_fields(metadata)
+        return results
+
+
+def _image_bytes(image_data) -> bytes:
+    """Bytes identifying an image input."""
+    if isinstance(image_data, Image.Image):
+        return image_data.tobytes()
+    if isinstance(image_data, str):
+        return image_data.encode("utf-8")
+    return bytes(image_data)
+
+
+def _load_outputs(outputs_dir: str) -> List[str]:
+    """Read every valid JSON document in a folder, sorted by file name."""
+    outputs = []
+    for path in sorted(glob.glob(os.path.join(outputs_dir, "*.json"))):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                outputs.append(json.dumps(json.load(f), indent=2, ensure_ascii=False))
+        except (OSError, ValueError) as e:
+            print(f"Warning: skipping fake output {path}: {e}")
+    return outputs
+
+
+def _sample_document(seed: int) -> dict:
+    """A plausible task1_v1 document for a bar chart (even seeds) or line graph (odd seeds)."""
+    rng = random.Random(seed)
+    years = _YEARS[: rng.randint(4, len(_YEARS))]
+    countries = rng.sample(_COUNTRIES, rng.randint(2, 4))
+    values = {
+        country: [round(rng.uniform(5, 95), 1) for _ in years]
+        for country in countries
+    }
+    highest = max(
+        ((country, year, value) for country, row in values.items() for year, value in zip(years, row)),
+        key=lambda item: item[2],
+    )
+    bar_chart = seed % 2 == 0
+    visual_type = "bar_chart" if bar_chart else "line_graph"
+    title = f"Households with internet access in {len(countries)} countries, {years[0]}-{years[-1]}"
+
+    if bar_chart:
+        structure = {
+            "bar_chart_type": "grouped",
+            "orientation": "vertical",
+            "axes": {
+                "category_axis": {
+                    "label": "Year",
+                    "unit": None,
+                    "categories": [
+                        {"category_id": f"c{i + 1}", "label": year, "order_index": i, "group_label": None}
+                        for i, year in enumerate(years)
+                    ],
+                },
+                "value_axis": {
+                    "label": "Percentage of households",
+                    "unit": "percent",
+                    "min_value": 0,
+                    "max_value": 100,
+                    "scale": "linear",
+                },
+            },
+            "series": [
+                {
+                    "series_id": f"s{n + 1}",
+                    "label": country,
+                    "legend_label": country,
+                    "notes": None,
+                    "data_points": [
+                        {"category_id": f"c{i + 1}", "value": value, "approximate": True,
+                         "value_range": {"min": round(value - 1, 1), "max": round(value + 1, 1)},
+                         "raw_value_label": None}
+                        for i, value in enumerate(values[country])
+                    ],
+                    "series_pattern_summary": None,
+                }
+                for n, country in enumerate(countries)
+            ],
+            "stacking_info": {"is_stacked": False, "stack_groups": []},
+            "extremes": {
+                "highest_bars": [f"{highest[0]} in {highest[1]} ({highest[2]}%)"],
+                "lowest_bars": [],
+            },
+            "patterns_and_trends": {"overall_pattern": [], "group_comparisons": [], "notable_outliers": []},
+        }
+    else:
+        structure = {
+            "axes": {
+                "x_axis": {
+                    "type": "time",
+                    "label": "Year",
+                    "unit": None,
+                    "ticks": [
+                        {"tick_id": f"t{i + 1}", "label": year, "numeric_value": int(year), "order_index": i}
+                        for i, year in enumerate(years)
+                    ],
+                },
+                "y_axis": {
+                    "label": "Percentage of households",
+                    "unit": "percent",
+                    "min_value": 0,
+                    "max_value": 100,
+                    "scale": "linear",
+                },
+            },
+            "line_series": [
+                {
+                    "series_id": f"s{n + 1}",
+                    "label": country,
+                    "legend_label": country,
+                    "data_points": [
+                        {"x_tick_id": f"t{i + 1}", "x_label": year, "x_numeric_value": int(year),
+                         "y_value": value, "approximate": True,
+                         "value_range": {"min": round(value - 1, 1), "max": round(value + 1, 1)},
+                         "raw_value_label": None}
+                        for i, (year, value) in enumerate(zip(years, values[country]))
+                    ],
+                    "series_trend_summary": None,
+                }
+                for n, country in enumerate(countries)
+            ],
+            "extremes": {
+                "overall_max_points": [f"{highest[0]} in {highest[1]} ({highest[2]}%)"],
+                "overall_min_points": [],
+                "per_series_max": [],
+                "per_series_min": [],
+            },
+            "patterns_and_trends": {
+                "overall_trend_description": [],
+                "cross_series_comparisons": [],
+                "crossing_points": [],
+                "stability_and_fluctuation": [],
+            },
+        }
+
+    return {
+        "schema_version": "task1_v1",
+        "task_visual_category": visual_type,
+        "topic_context": {
+            "title": title,
+            "subtitle": None,
+            "caption": None,
+            "task_instruction": None,
+            "topic_summary": f"Internet access in {', '.join(countries)}",
+            "time_dimension": {
+                "has_time_dimension": True,
+                "time_unit": "year",
+                "start": years[0],
+                "end": years[-1],
+                "raw_time_labels": years,
+            },
+            "measurement_description": "Percentage of households",
+            "main_entities_description": "Countries",
+        },
+        "global_semantics": {
+            "primary_overview": f"Internet access changed in all {len(countries)} countries.",
+            "primary_features": [
+                {"feature_id": "f1", "description": f"{highest[0]} reached the highest share, "
+                 f"{highest[2]}% in {highest[1]}.", "importance_level": "high"},
+            ],
+            "secondary_features": [],
+            "extremes_summary": [f"Highest: {highest[0]}, {highest[1]}"],
+            "notable_comparisons_summary": [],
+        },
+        "visuals": [
+            {
+                "visual_id": "v1",
+                "visual_type": visual_type,
+                "role": "primary",
+                "panel_label": None,
+                "title": title,
+                "caption": None,
+                "local_overview": {"main_message": None, "key_features": []},
+                "structure": structure,
+            }
+        ],
+        "relationships_between_visuals": [],
+        "raw_text_elements": [
+            {"element_id": "t1", "role": "title", "text": title, "approx_location": "top"},
+        ],
+        "extraction_notes": {
+            "model_confidence_overall": None,
+            "warnings": [],
+            "assumptions": [],
+        },
+    }
@@ -0,0 +1,244 @@
+"""
+Concurrent image downloading through a pooled async HTTP client.
+
+Downloads run on the event loop instead of blocking a worker thread each,
+share keep-alive connections, are limited per host so one slow CDN cannot
+take every connection, and are capped in size. Transient failures
+(timeouts, connection resets, 429/5xx) are retried with backoff.
+"""
+import asyncio
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from utils.config import (
+    FETCH_CONNECT_TIMEOUT_SECONDS,
+    FETCH_MAX_BYTES,
+    FETCH_MAX_CONNECTIONS,
+    FETCH_MAX_PER_HOST,
+    FETCH_RETRIES,
+    FETCH_TIMEOUT_SECONDS,
+)
+
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+_MAX_BACKOFF_SECONDS = 5.0
+
+
+class ImageFetchError(Exception):
+    """An image URL could not be downloaded."""
+
+    def __init__(self, url: str, message: str, status_code: int = 502):
+        """
+        Args:
+            url: URL that failed
+            message: What went wrong
+            status_code: HTTP status to report to our own client (400 when
+                the URL or the image is at fault, 502 when the remote server is)
+        """
+        super().__init__(f"Failed to download image from {url}: {message}")
+        self.url = url
+        self.status_code = status_code
+
+
+class ImageFetcher:
+    """Async downloader with connection pooling, per-host limits and retries."""
+
+    def __init__(
+        self,
+        timeout: float = FETCH_TIMEOUT_SECONDS,
+        connect_timeout: float = FETCH_CONNECT_TIMEOUT_SECONDS,
+        max_bytes: int = FETCH_MAX_BYTES,
+        max_connections: int = FETCH_MAX_CONNECTIONS,
+        max_per_host: int = FETCH_MAX_PER_HOST,
+        retries: int = FETCH_RETRIES,
+        backoff_seconds: float = 0.25,
+    ):
+        """
+        Initialize the fetcher; the HTTP client is created on first use.
+
+        Args:
+            timeout: Read/write/pool timeout per attempt in seconds
+            connect_timeout: Connection timeout per attempt in seconds
+            max_bytes: Largest accepted response body
+            max_connections: Connections across all hosts
+            max_per_host: Concurrent downloads per host
+            retries: Extra attempts after a transient failure
+            backoff_seconds: Delay before the first retry, doubled each time
+        """
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.max_bytes = max_bytes
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {
+            "downloads": 0,
+            "bytes": 0,
+            "retries": 0,
+            "failures": 0,
+            "in_flight": 0,
+        }
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """The pooled client for the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            # Connections and semaphores belong to one loop; a new loop
+            # (e.g. a restarted test client) gets fresh ones
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                follow_redirects=True,
+                headers={"User-Agent": "ielts-metadata-api"},
+            )
+            self._client_loop = loop
+            self._host_slots = {}
+        return self._client
+
+    def _host_slot(self, host: str) -> asyncio.Semaphore:
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = asyncio.Semaphore(self.max_per_host)
+        return slot
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    async def fetch(self, url: str) -> bytes:
+        """
+        Download an image.
+
+        Args:
+            url: HTTP(S) URL of the image
+
+        Returns:
+            bytes: Response body
+
+        Raises:
+            ImageFetchError: If the URL is invalid, the body is too large, the
+                server answers with an error, or all attempts fail
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ImageFetchError(url, "only http(s) URLs are supported", status_code=400)
+
+        client = self._get_client()
+        self._count("in_flight")
+        try:
+            async with self._host_slot(parts.hostname):
+                for attempt in range(self.retries + 1):
+                    try:
+                        body = await self._fetch_once(client, url)
+                    except _RetryableFetch as e:
+                        if attempt == self.retries:
+                            raise ImageFetchError(url, e.message) from None
+                        self._count("retries")
+                        delay = self.backoff_seconds * (2 ** attempt)
+                        if e.retry_after is not None:
+                            delay = max(delay, e.retry_after)
+                        await asyncio.sleep(min(delay, _MAX_BACKOFF_SECONDS))
+                        continue
+                    self._count("downloads")
+                    self._count("bytes", len(body))
+                    return body
+        except ImageFetchError:
+            self._count("failures")
+            raise
+        finally:
+            self._count("in_flight", -1)
+
+    async def _fetch_once(self, client: httpx.AsyncClient, url: str) -> bytes:
+        """One download attempt, streamed so oversized bodies are cut off early."""
+        try:
+            async with client.stream("GET", url) as response:
+                if response.status_code in _RETRYABLE_STATUS:
+                    raise _RetryableFetch(
+                        f"HTTP {response.status_code}",
+                        _parse_retry_after(response.headers.get("Retry-After")),
+                    )
+                if response.status_code >= 400:
+                    raise ImageFetchError(url, f"HTTP {response.status_code}", status_code=400)
+
+                declared = response.headers.get("Content-Length")
+                if declared and declared.isdigit() and int(declared) > self.max_bytes:
+                    raise ImageFetchError(url, f"image is larger than {self.max_bytes} bytes", status_code=400)
+
+                chunks = []
+                received = 0
+                async for chunk in response.aiter_bytes():
+                    received += len(chunk)
+                    if received > self.max_bytes:
+                        raise ImageFetchError(url, f"image is larger than {self.max_bytes} bytes", status_code=400)
+                    chunks.append(chunk)
+                return b"".join(chunks)
+        except httpx.TransportError as e:
+            # Timeouts, refused/reset connections, protocol errors
+            raise _RetryableFetch(f"{type(e).__name__}: {e}" if str(e) else type(e).__name__) from None
+
+    async def aclose(self):
+        """Close pooled connections."""
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
+
+    def get_stats(self) -> dict:
+        """
+        Report download counters.
+
+        Returns:
+            dict: Fetcher statistics
+        """
+        with self._lock:
+            return {
+                **self._counters,
+                "max_connections": self.max_connections,
+                "max_per_host": self.max_per_host,
+            }
+
+
+class _RetryableFetch(Exception):
+    """A transient failure worth another attempt."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = retry_after
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After in seconds (HTTP-date values are ignored)."""
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+# Global instance
+_image_fetcher: Optional[ImageFetcher] = None
+_image_fetcher_lock = threading.Lock()
+
+
+def get_image_fetcher() -> ImageFetcher:
+    """
+    Get or create the global image fetcher instance.
+
+    Returns:
+        ImageFetcher: The global image fetcher instance
+    """
+    global _image_fetcher
+    if _image_fetcher is None:
+        with _image_fetcher_lock:
+            if _image_fetcher is None:
+                _image_fetcher = ImageFetcher()
+    return _image_fetcher
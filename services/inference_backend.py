@@ -0,0 +1,149 @@
+"""
+Inference backend interface and the configured global backend.
+
+The serving path (scheduler, cache, pipeline, endpoints) only needs
+something that turns a batch of images into task1_v1 metadata dicts.
+INFERENCE_BACKEND selects the implementation: "qwen" loads Qwen2.5-VL
+(services.vision_service), "fake" answers with canned outputs after a
+simulated prefill/decode delay (services.fake_backend) so everything
+around the model can be load-tested without a GPU. With WORKER_POOL_SIZE
+set, the selected backend runs in that many worker processes instead
+(services.worker_pool). Backend modules are imported only when selected,
+so the fake backend does not need torch.
+"""
+import threading
+from typing import Any, Callable, List, Optional
+
+from utils.config import INFERENCE_BACKEND, WORKER_POOL_SIZE
+
+
+class InferenceBackend:
+    """Turns images into task1_v1 metadata dicts."""
+
+    # Short backend identifier reported by /health and /api/stats
+    backend_name = "base"
+
+    # Identifies the backend's outputs, e.g. in result cache keys
+    model_name: str = ""
+
+    # Batches the backend can run at the same time
+    concurrency = 1
+
+    # Draft acceptance totals (SpeculativeStats) when speculative decoding is on
+    speculative_stats = None
+
+    # Constrained-decoding mask cache (GrammarTokenTables) when CONSTRAINED_DECODING is on
+    grammar_tables = None
+
+    @property
+    def is_loaded(self) -> bool:
+        """Whether the backend can serve requests."""
+        return True
+
+    def warm_up(self, images: List[Any], max_new_tokens: int):
+        """
+        Run a short generation so the first real request does not pay for
+        kernel selection and allocator growth. No-op unless overridden.
+
+        Args:
+            images: Preprocessed images, one per batch row
+            max_new_tokens: Tokens to generate
+        """
+
+    def close(self):
+        """Release processes or other resources held by the backend."""
+
+    def extract_metadata(self, image_data: Any) -> dict:
+        """
+        Extract structured metadata from one image.
+
+        Args:
+            image_data: Image URL, image bytes or decoded PIL image
+
+        Returns:
+            dict: Structured metadata as JSON
+        """
+        return self.extract_metadata_batch([image_data])[0]
+
+    def extract_metadata_batch(
+        self,
+        images: List[Any],
+        on_text: Optional[Callable[[str], None]] = None,
+    ) -> List[dict]:
+        """
+        Extract structured metadata from several images in one call.
+
+        Args:
+            images: Image URLs, image bytes or decoded PIL images
+            on_text: Called with each newly generated chunk of output text;
+                only supported for a single image
+
+        Returns:
+            list: Structured metadata for each image, in input order
+        """
+        raise NotImplementedError
+
+
+def create_backend(
+    name: str = INFERENCE_BACKEND,
+    on_phase: Optional[Callable[[str], None]] = None,
+    pool_size: int = WORKER_POOL_SIZE,
+) -> InferenceBackend:
+    """
+    Build an inference backend by name.
+
+    Args:
+        name: "qwen" or "fake"
+        on_phase: Called with the name of each loading phase the backend
+            enters ("loading_model", "preparing")
+        pool_size: Run the backend in this many worker processes
+            (0 runs it in this process)
+
+    Returns:
+        InferenceBackend: The new backend
+
+    Raises:
+        ValueError: If the name is unknown
+    """
+    if pool_size > 0:
+        from services.worker_pool import WorkerPool
+        return WorkerPool(name, pool_size, on_phase=on_phase)
+    if name == "qwen":
+        from services.vision_service import VisionService
+        return VisionService(on_phase=on_phase)
+    if name == "fake":
+        from services.fake_backend import FakeVisionBackend
+        return FakeVisionBackend()
+    raise ValueError(f"Unknown INFERENCE_BACKEND {name!r} (expected 'qwen' or 'fake')")
+
+
+# Global instance
+_vision_service: Optional[InferenceBackend] = None
+_vision_service_lock = threading.Lock()
+
+
+def get_vision_service(on_phase: Optional[Callable[[str], None]] = None) -> InferenceBackend:
+    """
+    Get or create the global inference backend selected by INFERENCE_BACKEND.
+
+    Args:
+        on_phase: Loading phase callback, used if this call creates the backend
+
+    Returns:
+        InferenceBackend: The global backend instance
+    """
+    global _vision_service
+    if _vision_service is None:
+        with _vision_service_lock:
+            if _vision_service is None:
+                _vision_service = create_backend(on_phase=on_phase)
+    return _vision_service
+
+
+def close_vision_service():
+    """Close the global backend if it was created."""
+    global _vision_service
+    with _vision_service_lock:
+        backend, _vision_service = _vision_service, None
+    if backend is not None:
+        backend.close()
@@ -0,0 +1,124 @@
+"""
+Background workers that drain the batch job store.
+
+Each worker claims one pending item at a time and runs it through the
+extraction pipeline. With several workers in flight, downloads for the
+next images overlap with generation and the scheduler always has enough
+queued images to fill its batches, so a large job keeps the GPU busy
+without one HTTP request having to stay open for it. Job items are
+scheduled as bulk work, behind interactive requests.
+"""
+import asyncio
+import threading
+from typing import List, Optional
+
+from services.batch_scheduler import PRIORITY_BULK
+from services.extraction_pipeline import ExtractionPipeline, get_extraction_pipeline
+from services.job_store import JobStore, get_job_store
+from utils.config import JOBS_CONCURRENCY
+
+
+class JobRunner:
+    """Pulls job items from the store and extracts them on the event loop."""
+
+    def __init__(
+        self,
+        store: JobStore,
+        pipeline: ExtractionPipeline,
+        concurrency: int = JOBS_CONCURRENCY,
+        poll_interval: float = 1.0,
+    ):
+        """
+        Initialize the runner (workers start with start()).
+
+        Args:
+            store: Job store to pull items from
+            pipeline: Pipeline used for each image
+            concurrency: Items processed at the same time
+            poll_interval: Seconds an idle worker waits before checking the
+                store again without being notified
+        """
+        self.store = store
+        self.pipeline = pipeline
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self):
+        """Start the worker tasks on the running event loop."""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._work(), name=f"job-worker-{n}")
+            for n in range(self.concurrency)
+        ]
+
+    def notify(self):
+        """Wake idle workers after new items were added."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self):
+        """Cancel the workers; items they were running are re-queued on the next start."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _work(self):
+        """Claim and process items until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                claimed = await loop.run_in_executor(None, self.store.claim, 1)
+            except Exception as e:
+                print(f"Warning: failed to claim job items: {e}")
+                claimed = []
+            if not claimed:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            item_id, url = claimed[0]
+            try:
+                result = await self.pipeline.extract(
+                    url, wait_for_capacity=True, priority=PRIORITY_BULK
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await loop.run_in_executor(None, self.store.fail, item_id, str(e))
+                continue
+            await loop.run_in_executor(
+                None,
+                self.store.complete,
+                item_id,
+                result.metadata,
+                result.cache_hit,
+                result.near_duplicate,
+            )
+
+
+# Global instance
+_job_runner: Optional[JobRunner] = None
+_job_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> JobRunner:
+    """
+    Get or create the global job runner instance.
+
+    Returns:
+        JobRunner: The global job runner instance
+    """
+    global _job_runner
+    if _job_runner is None:
+        with _job_runner_lock:
+            if _job_runner is None:
+                _job_runner = JobRunner(get_job_store(), get_extraction_pipeline())
+    return _job_runner
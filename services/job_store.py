@@ -0,0 +1,318 @@
+"""
+Persistent store for asynchronous batch jobs.
+
+A job is a list of image URLs; every URL is an item row in SQLite that
+moves from pending to running to done/failed. Workers claim pending items
+in submission order, so a restart loses at most the items that were in
+flight, and those are put back to pending when the store is reopened.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from utils.config import JOBS_DB_PATH, JOBS_RETENTION_HOURS
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    total INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    cached INTEGER,
+    near_duplicate INTEGER,
+    result TEXT,
+    error TEXT,
+    finished_at REAL,
+    UNIQUE (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS job_items_status ON job_items (status, id);
+"""
+
+# Item states
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobStore:
+    """SQLite-backed jobs and their per-image items."""
+
+    def __init__(
+        self,
+        path: str = JOBS_DB_PATH,
+        retention_seconds: float = JOBS_RETENTION_HOURS * 3600,
+    ):
+        """
+        Open (or create) the store and recover from an unclean shutdown.
+
+        Args:
+            path: SQLite database file (":memory:" for a throwaway store)
+            retention_seconds: Finished jobs older than this are deleted
+                when the store is opened
+        """
+        self.path = path
+        self.retention_seconds = retention_seconds
+        directory = os.path.dirname(path)
+        if directory and path != ":memory:":
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(_SCHEMA)
+
+        recovered = self._requeue_running()
+        if recovered:
+            print(f"Job store: re-queued {recovered} interrupted item(s)")
+        self.purge_finished(self.retention_seconds)
+
+    def _requeue_running(self) -> int:
+        """Put items that were in flight when the process stopped back to pending."""
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE job_items SET status = ? WHERE status = ?", (PENDING, RUNNING)
+            )
+            return cursor.rowcount
+
+    def create_job(self, urls: List[str]) -> str:
+        """
+        Record a new job.
+
+        Args:
+            urls: Image URLs, in the order results are indexed
+
+        Returns:
+            str: Job id
+        """
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "INSERT INTO jobs (id, created_at, total) VALUES (?, ?, ?)",
+                    (job_id, time.time(), len(urls)),
+                )
+                self._db.executemany(
+                    "INSERT INTO job_items (job_id, idx, url) VALUES (?, ?, ?)",
+                    [(job_id, idx, url) for idx, url in enumerate(urls)],
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def claim(self, limit: int = 1) -> List[Tuple[int, str]]:
+        """
+        Take the oldest pending items and mark them running.
+
+        Args:
+            limit: Maximum number of items to claim
+
+        Returns:
+            list: (item_id, url) pairs, oldest first
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT id, url FROM job_items WHERE status = ? ORDER BY id LIMIT ?",
+                    (PENDING, limit),
+                ).fetchall()
+                self._db.executemany(
+                    "UPDATE job_items SET status = ? WHERE id = ?",
+                    [(RUNNING, row["id"]) for row in rows],
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return [(row["id"], row["url"]) for row in rows]
+
+    def complete(self, item_id: int, metadata: dict, cached: bool, near_duplicate: bool):
+        """
+        Record an item's metadata.
+
+        Args:
+            item_id: Item id from claim()
+            metadata: Extracted metadata
+            cached: Whether it came from the result cache
+            near_duplicate: Whether it was reused from a near-duplicate image
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE job_items SET status = ?, cached = ?, near_duplicate = ?, result = ?, "
+                "error = NULL, finished_at = ? WHERE id = ?",
+                (DONE, int(cached), int(near_duplicate),
+                 json.dumps(metadata, ensure_ascii=False), time.time(), item_id),
+            )
+
+    def fail(self, item_id: int, error: str):
+        """
+        Record that an item could not be processed.
+
+        Args:
+            item_id: Item id from claim()
+            error: Error message reported to the client
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE job_items SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (FAILED, error, time.time(), item_id),
+            )
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        """
+        Report a job's status and progress.
+
+        Args:
+            job_id: Job id
+
+        Returns:
+            dict or None: Job status, or None if the job does not exist
+        """
+        with self._lock:
+            job = self._db.execute(
+                "SELECT id, created_at, total FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            counts = dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status",
+                (job_id,),
+            ).fetchall())
+            finished_at = self._db.execute(
+                "SELECT MAX(finished_at) FROM job_items WHERE job_id = ?", (job_id,)
+            ).fetchone()[0]
+
+        pending, running = counts.get(PENDING, 0), counts.get(RUNNING, 0)
+        successful, failed = counts.get(DONE, 0), counts.get(FAILED, 0)
+        if pending + running == 0:
+            status = "completed"
+        elif running or successful or failed:
+            status = "running"
+        else:
+            status = "queued"
+        total = job["total"]
+        return {
+            "job_id": job["id"],
+            "status": status,
+            "total_images": total,
+            "pending": pending,
+            "running": running,
+            "successful": successful,
+            "failed": failed,
+            "progress": round((successful + failed) / total, 4) if total else 1.0,
+            "created_at": job["created_at"],
+            "finished_at": finished_at if status == "completed" else None,
+        }
+
+    def get_results(self, job_id: str, offset: int = 0, limit: int = 50) -> List[dict]:
+        """
+        Page through a job's items in index order.
+
+        Pages are by image index, so they stay stable while the job runs;
+        items that have not finished yet carry only their status.
+
+        Args:
+            job_id: Job id
+            offset: First image index to return
+            limit: Maximum number of items to return
+
+        Returns:
+            list: Entries shaped like /api/extract/batch results, plus a
+                "status" of pending, running, done or failed
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT idx, url, status, cached, near_duplicate, result, error FROM job_items "
+                "WHERE job_id = ? AND idx >= ? ORDER BY idx LIMIT ?",
+                (job_id, offset, limit),
+            ).fetchall()
+        results = []
+        for row in rows:
+            entry = {"image_url": row["url"], "index": row["idx"], "status": row["status"]}
+            if row["status"] == DONE:
+                entry.update({
+                    "success": True,
+                    "cached": bool(row["cached"]),
+                    "near_duplicate": bool(row["near_duplicate"]),
+                    "metadata": json.loads(row["result"]),
+                })
+            elif row["status"] == FAILED:
+                entry.update({"success": False, "error": row["error"]})
+            results.append(entry)
+        return results
+
+    def purge_finished(self, older_than_seconds: float) -> int:
+        """
+        Delete completed jobs whose last item finished long enough ago.
+
+        Args:
+            older_than_seconds: Minimum age since the last item finished
+
+        Returns:
+            int: Number of jobs deleted
+        """
+        cutoff = time.time() - older_than_seconds
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM jobs WHERE id IN ("
+                " SELECT job_id FROM job_items GROUP BY job_id"
+                " HAVING SUM(status IN (?, ?)) = 0 AND MAX(finished_at) < ?)",
+                (PENDING, RUNNING, cutoff),
+            )
+            return cursor.rowcount
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Count jobs and items by state.
+
+        Returns:
+            dict: Job store statistics
+        """
+        with self._lock:
+            counts = dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM job_items GROUP BY status"
+            ).fetchall())
+            jobs = self._db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+        return {
+            "jobs": jobs,
+            "pending_items": counts.get(PENDING, 0),
+            "running_items": counts.get(RUNNING, 0),
+            "done_items": counts.get(DONE, 0),
+            "failed_items": counts.get(FAILED, 0),
+        }
+
+
+# Global instance
+_job_store: Optional[JobStore] = None
+_job_store_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    """
+    Get or create the global job store instance.
+
+    Returns:
+        JobStore: The global job store instance
+    """
+    global _job_store
+    if _job_store is None:
+        with _job_store_lock:
+            if _job_store is None:
+                _job_store = JobStore()
+    return _job_store
@@ -0,0 +1,187 @@
+"""
+Prometheus metrics for the serving path.
+
+Every stage an image passes through is timed into one histogram labelled
+by stage, so a single query shows where request time goes:
+
+    fetch, decode_image, cache_lookup, preprocess     (extraction pipeline)
+    queue_wait, inference                             (batch scheduler)
+    chat_template, vision_info, tensorize, to_device,
+    classify, prefill, decode, batch_decode,
+    json_parse, expand_compact, derive_fields         (inference backend)
+
+Token counts, decode throughput, batch sizes, parse failures, cache
+outcomes, coalesced duplicate requests, draft token acceptance, readiness,
+queue depth, per-priority queue waits and deadline rejections, and GPU
+memory high-water marks are exported alongside and served in the text
+exposition format on /metrics.
+
+With a worker pool the model runs in other processes; when
+PROMETHEUS_MULTIPROC_DIR points at an empty directory (set before start),
+every process writes its samples there and /metrics aggregates them.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+_SECONDS_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+)
+_TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+STAGE_SECONDS = Histogram(
+    "ielts_stage_seconds",
+    "Time spent in each processing stage (per batch for model stages)",
+    ["stage"],
+    buckets=_SECONDS_BUCKETS,
+)
+PROMPT_TOKENS = Histogram(
+    "ielts_prompt_tokens",
+    "Prompt tokens per image, including vision tokens",
+    buckets=_TOKEN_BUCKETS,
+)
+VISION_TOKENS = Histogram(
+    "ielts_vision_tokens",
+    "Vision tokens per image",
+    buckets=_TOKEN_BUCKETS,
+)
+GENERATED_TOKENS = Histogram(
+    "ielts_generated_tokens",
+    "Generated tokens per image",
+    buckets=_TOKEN_BUCKETS,
+)
+DECODE_TOKENS_PER_SECOND = Histogram(
+    "ielts_decode_tokens_per_second",
+    "Generated tokens per second of decode time, summed over a batch",
+    buckets=(1, 2, 5, 10, 15, 20, 30, 40, 60, 80, 120, 160, 240, 320),
+)
+BATCH_SIZE = Histogram(
+    "ielts_batch_size",
+    "Images per generate call",
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16, 24, 32),
+)
+PARSE_FAILURES = Counter(
+    "ielts_parse_failures_total",
+    "Model outputs that were not valid JSON even after repair",
+)
+JSON_REPAIRS = Counter(
+    "ielts_json_repairs_total",
+    "Fixes applied to malformed model output, by kind",
+    ["kind"],
+)
+CLASSIFICATIONS = Counter(
+    "ielts_classifications_total",
+    "Images classified by the two-stage classification pass, by category",
+    ["category"],
+)
+CACHE_LOOKUPS = Counter(
+    "ielts_cache_lookups_total",
+    "Result cache lookups by outcome (hit, near_hit, miss)",
+    ["outcome"],
+)
+DRAFT_TOKENS = Counter(
+    "ielts_draft_tokens_total",
+    "Tokens proposed by the speculative decoding draft model, by outcome (accepted, rejected)",
+    ["outcome"],
+)
+COALESCED_REQUESTS = Counter(
+    "ielts_coalesced_requests_total",
+    "Requests that joined an identical extraction already in flight instead of running their own, "
+    "by key (url, content)",
+    ["kind"],
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "ielts_queue_wait_seconds",
+    "Time an image waited for the inference worker, by priority class",
+    ["priority"],
+    buckets=_SECONDS_BUCKETS,
+)
+DEADLINE_REJECTIONS = Counter(
+    "ielts_deadline_rejections_total",
+    "Images rejected because their deadline passed before inference started, by priority class",
+    ["priority"],
+)
+QUEUE_REJECTIONS = Counter(
+    "ielts_queue_rejections_total",
+    "Images rejected because the inference queue was full",
+)
+MODEL_READY = Gauge(
+    "ielts_model_ready",
+    "1 once the inference backend is loaded and warmed up",
+    multiprocess_mode="livemax",
+)
+QUEUE_DEPTH = Gauge(
+    "ielts_queue_depth",
+    "Images waiting for the inference worker",
+    multiprocess_mode="livesum",
+)
+GPU_MEMORY_PEAK_BYTES = Gauge(
+    "ielts_gpu_memory_peak_bytes",
+    "Highest GPU memory allocated by tensors since startup",
+    ["device"],
+    multiprocess_mode="liveall",
+)
+GPU_MEMORY_RESERVED_PEAK_BYTES = Gauge(
+    "ielts_gpu_memory_reserved_peak_bytes",
+    "Highest GPU memory reserved by the caching allocator since startup",
+    ["device"],
+    multiprocess_mode="liveall",
+)
+
+
+@contextmanager
+def observe_stage(stage: str) -> Iterator[None]:
+    """
+    Time a block into ielts_stage_seconds.
+
+    Args:
+        stage: Stage label
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - started)
+
+
+def record_generation(prefill_seconds: float, decode_seconds: float, generated_tokens: list):
+    """
+    Record the prefill/decode split of one generate call.
+
+    Args:
+        prefill_seconds: Time until the first new token's logits were ready
+        decode_seconds: Time spent generating the remaining tokens
+        generated_tokens: Tokens generated for each image of the batch
+    """
+    STAGE_SECONDS.labels(stage="prefill").observe(prefill_seconds)
+    STAGE_SECONDS.labels(stage="decode").observe(decode_seconds)
+    for count in generated_tokens:
+        GENERATED_TOKENS.observe(count)
+    if decode_seconds > 0:
+        DECODE_TOKENS_PER_SECOND.observe(sum(generated_tokens) / decode_seconds)
+
+
+def render_metrics() -> tuple:
+    """
+    Render all metrics in the Prometheus text format.
+
+    Returns:
+        tuple: (body, content type)
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,195 @@
+"""
+Background model loading, warmup and readiness tracking.
+
+The API starts serving as soon as the process is up; the inference backend
+is imported, loaded and warmed up on a background thread. Loading moves
+through named phases so probes can tell a replica that is still starting
+(the current phase and how long it has been in it) from one that is stuck
+or has failed:
+
+    starting -> importing -> loading_model -> preparing -> warming_up -> ready
+
+("failed" if anything raises). Extraction endpoints answer 503 until the
+phase is "ready".
+"""
+import threading
+import time
+import traceback
+from typing import Callable, Optional
+
+from services.extraction_pipeline import get_extraction_pipeline
+from services.inference_backend import InferenceBackend, get_vision_service
+from services.metrics import MODEL_READY
+from utils.config import BATCH_MAX_SIZE, INFERENCE_BACKEND, WARMUP_ENABLED, WARMUP_MAX_NEW_TOKENS
+
+PHASES = ("starting", "importing", "loading_model", "preparing", "warming_up", "ready")
+READY = "ready"
+FAILED = "failed"
+
+# Suggested Retry-After while the model is still loading
+_LOADING_RETRY_AFTER_SECONDS = 10
+
+
+class ModelLoader:
+    """Loads the inference backend off the event loop and reports progress."""
+
+    def __init__(
+        self,
+        warmup: bool = WARMUP_ENABLED,
+        warmup_max_new_tokens: int = WARMUP_MAX_NEW_TOKENS,
+        warmup_batch_size: int = BATCH_MAX_SIZE,
+    ):
+        """
+        Initialize the loader (loading starts with start()).
+
+        Args:
+            warmup: Run a synthetic image through the model before going ready
+            warmup_max_new_tokens: Tokens generated per warmup pass
+            warmup_batch_size: Largest batch warmed up, besides batch size 1
+        """
+        self.warmup = warmup
+        self.warmup_max_new_tokens = max(1, warmup_max_new_tokens)
+        self.warmup_batch_size = max(1, warmup_batch_size)
+
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._phase = PHASES[0]
+        self._error: Optional[str] = None
+        self._started_at = time.monotonic()
+        self._phase_started_at = self._started_at
+        self._phase_seconds = {}
+
+    @property
+    def is_ready(self) -> bool:
+        """Whether the backend is loaded, warmed up and serving."""
+        return self._ready.is_set()
+
+    @property
+    def has_failed(self) -> bool:
+        """Whether loading raised an error."""
+        with self._lock:
+            return self._phase == FAILED
+
+    def start(self, on_ready: Optional[Callable[[], None]] = None):
+        """
+        Start loading on a background thread.
+
+        Args:
+            on_ready: Called from the loader thread once the backend is ready
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, args=(on_ready,), name="model-loader", daemon=True
+            )
+        self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the backend is ready.
+
+        Args:
+            timeout: Maximum seconds to wait (None waits forever)
+
+        Returns:
+            bool: Whether the backend is ready
+        """
+        return self._ready.wait(timeout)
+
+    def _set_phase(self, phase: str):
+        now = time.monotonic()
+        with self._lock:
+            self._phase_seconds[self._phase] = round(now - self._phase_started_at, 3)
+            self._phase = phase
+            self._phase_started_at = now
+        print(f"Model loader: {phase}")
+
+    def _run(self, on_ready: Optional[Callable[[], None]]):
+        """Import, load and warm up the backend, then build the pipeline around it."""
+        try:
+            self._set_phase("importing")
+            backend = get_vision_service(on_phase=self._set_phase)
+            if self.warmup:
+                self._set_phase("warming_up")
+                self._warm_up(backend)
+            # Scheduler, result cache and near-duplicate index
+            get_extraction_pipeline()
+        except Exception as e:
+            traceback.print_exc()
+            with self._lock:
+                self._error = f"{type(e).__name__}: {e}"
+            self._set_phase(FAILED)
+            return
+
+        self._set_phase(READY)
+        MODEL_READY.set(1)
+        self._ready.set()
+        if on_ready is not None:
+            on_ready()
+
+    def _warm_up(self, backend: InferenceBackend):
+        """Generate a few tokens for a synthetic chart at batch size 1 and the maximum batch size."""
+        from utils.image_preprocessing import preprocess_image
+        from utils.synthetic_charts import make_bar_chart
+
+        image = preprocess_image(make_bar_chart(seed=0))
+        for batch_size in sorted({1, self.warmup_batch_size}):
+            started = time.perf_counter()
+            backend.warm_up([image] * batch_size, self.warmup_max_new_tokens)
+            print(f"Warmup at batch size {batch_size}: {time.perf_counter() - started:.2f} s")
+
+    def retry_after(self) -> int:
+        """
+        Suggested Retry-After while the backend is not ready.
+
+        Returns:
+            int: Seconds
+        """
+        return _LOADING_RETRY_AFTER_SECONDS
+
+    def get_status(self) -> dict:
+        """
+        Report the loading phase and progress.
+
+        Returns:
+            dict: Backend, phase, progress (0-1 over the loading phases),
+                elapsed times and the error if loading failed
+        """
+        now = time.monotonic()
+        with self._lock:
+            phase = self._phase
+            progress = 1.0 if phase == READY else (
+                PHASES.index(phase) / (len(PHASES) - 1) if phase in PHASES else None
+            )
+            return {
+                "backend": INFERENCE_BACKEND,
+                "phase": phase,
+                "ready": phase == READY,
+                "progress": round(progress, 3) if progress is not None else None,
+                "phase_elapsed_seconds": round(now - self._phase_started_at, 1),
+                "elapsed_seconds": round(now - self._started_at, 1),
+                "phase_seconds": dict(self._phase_seconds),
+                "error": self._error,
+            }
+
+
+# Global instance
+_model_loader: Optional[ModelLoader] = None
+_model_loader_lock = threading.Lock()
+
+
+def get_model_loader() -> ModelLoader:
+    """
+    Get or create the global model loader instance.
+
+    Returns:
+        ModelLoader: The global model loader instance
+    """
+    global _model_loader
+    if _model_loader is None:
+        with _model_loader_lock:
+            if _model_loader is None:
+                _model_loader = ModelLoader()
+    return _model_loader
@@ -0,0 +1,399 @@
+"""
+Perceptual-hash index of already processed images.
+
+Maps perceptual hashes to result-cache keys so that re-encoded, resized or
+rescanned copies of a chart can reuse stored metadata. Lookups use a
+BK-tree, which prunes whole subtrees via the triangle inequality instead of
+scanning every entry.
+
+Entries are keyed by cache key: an image is indexed once, and an entry
+whose cached result turns out to be gone is removed so later lookups stop
+paying for it. The index keeps at most PHASH_INDEX_MAX_ENTRIES images,
+dropping the oldest first.
+
+Only in-memory bookkeeping happens under the index lock: file appends are
+made after it is released, and once removed entries make up most of the
+tree or file, a background thread rebuilds both from a snapshot and swaps
+them in.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.config import PHASH_INDEX_MAX_ENTRIES, PHASH_INDEX_PATH, PHASH_MAX_DISTANCE
+from utils.perceptual_hash import hamming_distance
+
+# Copies of the same chart keep their aspect ratio; a looser match would let
+# differently shaped visuals with similar layouts collide.
+_MAX_ASPECT_RATIO_DIFF = 0.05
+
+# Hashes with fewer set bits come from near-uniform images (blank scans,
+# a single filled shape) that carry too little structure to match safely.
+_MIN_HASH_BITS = 16
+
+# Entries added during a compaction that its new tree takes under the lock
+# when it is swapped in; earlier ones are added to it off the lock.
+_SWAP_CATCH_UP_ENTRIES = 64
+
+
+class BKTree:
+    """BK-tree over integer hashes under Hamming distance."""
+
+    def __init__(self):
+        # Node layout: [hash, values, {distance: child_node}]
+        self._root: Optional[list] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, hash_value: int, value):
+        """
+        Insert a value under a hash.
+
+        Args:
+            hash_value: Perceptual hash
+            value: Payload stored with the hash
+        """
+        self._size += 1
+        if self._root is None:
+            self._root = [hash_value, [value], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(hash_value, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [hash_value, [value], {}]
+                return
+            node = child
+
+    def search(self, hash_value: int, max_distance: int) -> List[Tuple[int, object]]:
+        """
+        Find all values within a Hamming distance of a hash.
+
+        Args:
+            hash_value: Query hash
+            max_distance: Maximum Hamming distance (inclusive)
+
+        Returns:
+            list: (distance, value) pairs, closest first
+        """
+        if self._root is None:
+            return []
+        matches = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(hash_value, node[0])
+            if distance <= max_distance:
+                matches.extend((distance, value) for value in node[1])
+            low, high = distance - max_distance, distance + max_distance
+            for child_distance, child in node[2].items():
+                if low <= child_distance <= high:
+                    stack.append(child)
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+class NearDuplicateIndex:
+    """Persistent perceptual-hash index of processed images."""
+
+    def __init__(
+        self,
+        index_path: Optional[str] = PHASH_INDEX_PATH,
+        max_distance: int = PHASH_MAX_DISTANCE,
+        max_entries: int = PHASH_INDEX_MAX_ENTRIES,
+    ):
+        """
+        Initialize the index, replaying any persisted entries.
+
+        Args:
+            index_path: Append-only file the index is persisted to
+                (None or "" keeps the index in memory only); it is
+                rewritten without removed or duplicate rows on load and,
+                in the background, whenever they make up most of it
+            max_distance: Maximum Hamming distance treated as a duplicate
+            max_entries: Maximum number of indexed images; the oldest are
+                dropped beyond it
+        """
+        self.index_path = index_path or None
+        self.max_distance = max_distance
+        self.max_entries = max(1, max_entries)
+        self._tree = BKTree()
+        self._lock = threading.Lock()
+        # cache_key -> (hash, aspect_ratio), oldest first. Removed entries
+        # stay in the tree until it is rebuilt; lookups skip them.
+        self._entries: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        # Rows in the index file or waiting to be appended, live or not
+        self._file_rows = 0
+        # Rows not yet appended; whoever holds _file_lock writes them
+        self._pending_rows: List[str] = []
+        self._file_lock = threading.Lock()
+        # Set while a background compaction runs; entries added meanwhile
+        # are also added to its new tree before it is swapped in
+        self._compacting = False
+        self._added_during_compaction: List[Tuple[int, str]] = []
+        self._counters: Dict[str, int] = {
+            "lookups": 0,
+            "near_hits": 0,
+            "added": 0,
+            "removed": 0,
+            "evicted": 0,
+            "compactions": 0,
+        }
+
+        if self.index_path and os.path.exists(self.index_path):
+            self._load()
+
+    @staticmethod
+    def is_indexable(hash_value: int) -> bool:
+        """Whether a hash carries enough structure for near-duplicate matching."""
+        return bin(hash_value).count("1") >= _MIN_HASH_BITS
+
+    def find(self, hash_value: int, aspect_ratio: float) -> List[Tuple[int, str]]:
+        """
+        Find cache keys of images that look like this one.
+
+        Args:
+            hash_value: Perceptual hash of the query image
+            aspect_ratio: Width / height of the query image's content
+
+        Returns:
+            list: (distance, cache_key) candidates, closest first
+        """
+        if not self.is_indexable(hash_value):
+            return []
+        with self._lock:
+            self._counters["lookups"] += 1
+            # Closest first; skip removed entries and stale copies of re-added ones
+            candidates: Dict[str, int] = {}
+            for distance, key in self._tree.search(hash_value, self.max_distance):
+                entry = self._entries.get(key)
+                if entry is not None and key not in candidates:
+                    if abs(entry[1] - aspect_ratio) <= _MAX_ASPECT_RATIO_DIFF * aspect_ratio:
+                        candidates[key] = distance
+        return [(distance, key) for key, distance in candidates.items()]
+
+    def record_hit(self):
+        """Count a lookup that was served from a near-duplicate."""
+        with self._lock:
+            self._counters["near_hits"] += 1
+
+    def add(self, hash_value: int, aspect_ratio: float, cache_key: str):
+        """
+        Index a processed image, unless its cache key is already indexed.
+
+        Args:
+            hash_value: Perceptual hash of the image
+            aspect_ratio: Width / height of the image's content
+            cache_key: Result-cache key its metadata is stored under
+        """
+        if not self.is_indexable(hash_value):
+            return
+        with self._lock:
+            if cache_key in self._entries:
+                return
+            self._entries[cache_key] = (hash_value, aspect_ratio)
+            self._tree.add(hash_value, cache_key)
+            if self._compacting:
+                self._added_during_compaction.append((hash_value, cache_key))
+            self._counters["added"] += 1
+            rows = [_entry_row(cache_key, hash_value, aspect_ratio)]
+            while len(self._entries) > self.max_entries:
+                oldest, _ = self._entries.popitem(last=False)
+                rows.append(_removal_row(oldest))
+                self._counters["evicted"] += 1
+            self._queue_rows(rows)
+        self._flush()
+
+    def remove(self, cache_key: str):
+        """
+        Forget an image whose cached result is gone (evicted or expired).
+
+        Args:
+            cache_key: Result-cache key that missed
+        """
+        with self._lock:
+            if self._entries.pop(cache_key, None) is None:
+                return
+            self._counters["removed"] += 1
+            self._queue_rows([_removal_row(cache_key)])
+        self._flush()
+
+    def get_stats(self) -> dict:
+        """
+        Report index size and lookup counters.
+
+        Returns:
+            dict: Near-duplicate index statistics
+        """
+        with self._lock:
+            return {
+                **self._counters,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "max_distance": self.max_distance,
+            }
+
+    def _load(self):
+        """Replay the persisted index file, then rewrite it if it held dead rows."""
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                self._file_rows += 1
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 3:
+                    continue
+                if parts[0] == "-":
+                    self._entries.pop(parts[2], None)
+                    continue
+                try:
+                    hash_value, aspect_ratio = int(parts[0], 16), float(parts[1])
+                except ValueError:
+                    continue
+                self._entries.setdefault(parts[2], (hash_value, aspect_ratio))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._tree = _build_tree(self._entries.items())
+        if self._file_rows > len(self._entries):
+            if self._write_tmp(_entry_rows(self._entries.items())) and self._replace_with_tmp():
+                self._file_rows = len(self._entries)
+
+    def _queue_rows(self, rows: List[str]):
+        """
+        Queue rows for the index file and start a compaction once most of
+        the tree or file is dead. Called with the lock held.
+        """
+        if self.index_path:
+            self._pending_rows.extend(rows)
+            self._file_rows += len(rows)
+        live = len(self._entries)
+        if not self._compacting and (len(self._tree) > 2 * live or self._file_rows > 2 * live):
+            self._compacting = True
+            threading.Thread(target=self._compact, name="near-duplicate-compaction", daemon=True).start()
+
+    def _flush(self):
+        """Append queued rows to the index file, unless another thread is writing it (it flushes them)."""
+        if not self.index_path:
+            return
+        while self._file_lock.acquire(blocking=False):
+            try:
+                with self._lock:
+                    rows, self._pending_rows = self._pending_rows, []
+                if rows:
+                    try:
+                        with open(self.index_path, "a", encoding="utf-8") as f:
+                            f.writelines(rows)
+                    except OSError as e:
+                        print(f"Warning: failed to persist near-duplicate index entries: {e}")
+            finally:
+                self._file_lock.release()
+            # Rows queued while the file was being written
+            with self._lock:
+                if not self._pending_rows:
+                    return
+
+    def _compact(self):
+        """Rebuild the tree and rewrite the file from a snapshot of the live entries, then swap them in."""
+        try:
+            with self._file_lock:
+                with self._lock:
+                    snapshot = list(self._entries.items())
+                    # Queued rows are reflected in the snapshot
+                    snapshotted_rows = len(self._pending_rows)
+                tree = _build_tree(snapshot)
+                written = self.index_path is not None and self._write_tmp(_entry_rows(snapshot))
+
+                # Catch up with entries added meanwhile, off the lock until few are left
+                while True:
+                    with self._lock:
+                        added, self._added_during_compaction = self._added_during_compaction, []
+                        if len(added) <= _SWAP_CATCH_UP_ENTRIES:
+                            for hash_value, cache_key in added:
+                                tree.add(hash_value, cache_key)
+                            self._tree = tree
+                            # Rows queued since the snapshot follow it in the new file
+                            rows = self._pending_rows[snapshotted_rows:]
+                            break
+                    for hash_value, cache_key in added:
+                        tree.add(hash_value, cache_key)
+                if written and self._write_tmp(rows, "a") and self._replace_with_tmp():
+                    with self._lock:
+                        del self._pending_rows[:snapshotted_rows + len(rows)]
+                        self._file_rows = len(snapshot) + len(rows) + len(self._pending_rows)
+                with self._lock:
+                    self._counters["compactions"] += 1
+        except Exception as e:
+            print(f"Warning: near-duplicate index compaction failed: {e}")
+        finally:
+            with self._lock:
+                self._compacting = False
+                self._added_during_compaction = []
+        self._flush()
+
+    def _write_tmp(self, rows: Iterable[str], mode: str = "w") -> bool:
+        """Write (or, with mode "a", add) rows to the temporary file next to the index file."""
+        directory = os.path.dirname(self.index_path)
+        try:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(f"{self.index_path}.tmp", mode, encoding="utf-8") as f:
+                f.writelines(rows)
+        except OSError as e:
+            print(f"Warning: failed to compact near-duplicate index: {e}")
+            return False
+        return True
+
+    def _replace_with_tmp(self) -> bool:
+        """Atomically replace the index file with the temporary file."""
+        try:
+            os.replace(f"{self.index_path}.tmp", self.index_path)
+        except OSError as e:
+            print(f"Warning: failed to compact near-duplicate index: {e}")
+            return False
+        return True
+
+def _build_tree(entries: Iterable[Tuple[str, Tuple[int, float]]]) -> BKTree:
+    """BK-tree over (cache_key, (hash, aspect_ratio)) entries."""
+    tree = BKTree()
+    for cache_key, (hash_value, _) in entries:
+        tree.add(hash_value, cache_key)
+    return tree
+
+
+def _entry_rows(entries: Iterable[Tuple[str, Tuple[int, float]]]) -> Iterable[str]:
+    """Index file rows adding (cache_key, (hash, aspect_ratio)) entries."""
+    return (_entry_row(cache_key, hash_value, aspect_ratio) for cache_key, (hash_value, aspect_ratio) in entries)
+
+def _entry_row(cache_key: str, hash_value: int, aspect_ratio: float) -> str:
+    """Index file row adding an entry."""
+    return f"{hash_value:x}\t{aspect_ratio:.6f}\t{cache_key}\n"
+
+
+def _removal_row(cache_key: str) -> str:
+    """Index file row removing an entry."""
+    return f"-\t\t{cache_key}\n"
+
+
+# Global instance
+_near_duplicate_index: Optional[NearDuplicateIndex] = None
+_near_duplicate_index_lock = threading.Lock()
+
+
+def get_near_duplicate_index() -> NearDuplicateIndex:
+    """
+    Get or create the global near-duplicate index instance.
+
+    Returns:
+        NearDuplicateIndex: The global near-duplicate index instance
+    """
+    global _near_duplicate_index
+    if _near_duplicate_index is None:
+        with _near_duplicate_index_lock:
+            if _near_duplicate_index is None:
+                _near_duplicate_index = NearDuplicateIndex()
+    return _near_duplicate_index
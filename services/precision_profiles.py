@@ -0,0 +1,154 @@
+"""
+Named precision profiles for loading the Qwen2.5-VL weights.
+
+    gpu-nf4    4-bit NF4 weights (bitsandbytes), bf16 compute; ~7GB for 7B
+    gpu-int8   8-bit LLM.int8 weights (bitsandbytes); ~9GB, closer to bf16 quality
+    gpu-bf16   unquantized bf16; ~16GB, fastest decode where it fits
+    cpu-int8   fp32 weights with the text decoder's linear layers dynamically
+               quantized to int8 (PyTorch's native fbgemm/onednn kernels)
+    cpu-bf16   bf16 weights on CPU; fast on CPUs with AVX512-BF16 or AMX
+
+"auto" picks gpu-nf4 when a GPU is visible and cpu-int8 otherwise. GPU
+profiles spill layers that do not fit to CPU memory. CPU profiles never go
+through bitsandbytes and size torch's thread pool to the cores available to
+the process (or CPU_THREADS).
+"""
+import os
+import time
+
+import torch
+from transformers import BitsAndBytesConfig, Qwen2_5_VLForConditionalGeneration
+
+from utils.config import CPU_THREADS
+
+PROFILES = ("gpu-nf4", "gpu-int8", "gpu-bf16", "cpu-int8", "cpu-bf16")
+
+
+def resolve_profile(name: str) -> str:
+    """
+    Resolve "auto" and validate a profile name.
+
+    Args:
+        name: Profile name or "auto"
+
+    Returns:
+        str: One of PROFILES
+
+    Raises:
+        ValueError: If the name is unknown, or a GPU profile is requested
+            without a visible GPU
+    """
+    if name == "auto":
+        return "gpu-nf4" if torch.cuda.is_available() else "cpu-int8"
+    if name not in PROFILES:
+        raise ValueError(f"Unknown PRECISION_PROFILE {name!r} (expected 'auto' or one of {', '.join(PROFILES)})")
+    if name.startswith("gpu-") and not torch.cuda.is_available():
+        raise ValueError(f"PRECISION_PROFILE {name!r} needs a CUDA GPU; use cpu-int8 or cpu-bf16")
+    return name
+
+
+def cpu_thread_count(threads: int = CPU_THREADS) -> int:
+    """
+    Intra-op threads for CPU inference.
+
+    Args:
+        threads: Explicit thread count (0 picks automatically)
+
+    Returns:
+        int: CPU_THREADS if set, else OMP_NUM_THREADS (set per worker by the
+            worker pool), else the number of cores this process may run on
+    """
+    if threads > 0:
+        return threads
+    omp_threads = os.getenv("OMP_NUM_THREADS", "")
+    if omp_threads.isdigit() and int(omp_threads) > 0:
+        return int(omp_threads)
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _configure_cpu_threads():
+    """Size torch's thread pools for CPU decoding."""
+    threads = cpu_thread_count()
+    torch.set_num_threads(threads)
+    try:
+        # Decoding is one op after another; extra inter-op threads only contend
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only allowed before any parallel work has run in this process
+        pass
+    print(f"CPU inference with {threads} thread(s)")
+
+
+def _text_decoder(model):
+    """The text decoder (its location moved between transformers releases)."""
+    decoder = getattr(model, "language_model", None)
+    return decoder if decoder is not None else model.model
+
+
+def load_model(model_name: str, profile: str):
+    """
+    Load a Qwen2.5-VL checkpoint with a precision profile.
+
+    Args:
+        model_name: Hugging Face model name or local path
+        profile: One of PROFILES (already resolved)
+
+    Returns:
+        Qwen2_5_VLForConditionalGeneration: The loaded model
+    """
+    if profile == "gpu-nf4":
+        return Qwen2_5_VLForConditionalGeneration.from_pretrained(
+            model_name,
+            quantization_config=BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_compute_dtype=torch.bfloat16,
+                bnb_4bit_use_double_quant=True,
+                bnb_4bit_quant_type="nf4",
+                llm_int8_enable_fp32_cpu_offload=True,
+            ),
+            device_map="auto",
+            low_cpu_mem_usage=True,
+        )
+    if profile == "gpu-int8":
+        return Qwen2_5_VLForConditionalGeneration.from_pretrained(
+            model_name,
+            quantization_config=BitsAndBytesConfig(
+                load_in_8bit=True,
+                llm_int8_enable_fp32_cpu_offload=True,
+            ),
+            device_map="auto",
+            low_cpu_mem_usage=True,
+        )
+    if profile == "gpu-bf16":
+        return Qwen2_5_VLForConditionalGeneration.from_pretrained(
+            model_name,
+            torch_dtype=torch.bfloat16,
+            device_map="auto",
+            low_cpu_mem_usage=True,
+        )
+
+    _configure_cpu_threads()
+    if profile == "cpu-bf16":
+        return Qwen2_5_VLForConditionalGeneration.from_pretrained(
+            model_name,
+            torch_dtype=torch.bfloat16,
+            low_cpu_mem_usage=True,
+        ).eval()
+
+    # cpu-int8: int8 weights with fp32 activations. The vision tower runs
+    # once per image and keeps fp32, as do the embeddings and lm_head (so
+    # the vocabulary can still be resized for a draft model).
+    model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
+        model_name,
+        torch_dtype=torch.float32,
+        low_cpu_mem_usage=True,
+    ).eval()
+    started = time.perf_counter()
+    torch.ao.quantization.quantize_dynamic(
+        _text_decoder(model), {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+    )
+    print(f"Quantized decoder linear layers to int8 in {time.perf_counter() - started:.1f} s")
+    return model
+
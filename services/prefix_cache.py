@@ -0,0 +1,236 @@
+"""
+Precomputed key/value cache for the constant system-prompt prefix.
+
+Every extraction request starts with the same long system prompt. Its
+tokens are encoded once and its attention key/value states computed once;
+each generation then starts from a copy of those states and only prefills
+the image and user turn.
+
+Qwen2.5-VL's `generate` cannot be handed a partial cache directly: it drops
+`pixel_values` and mis-positions image tokens whenever the cache is not
+empty. The remainder of the prompt is therefore prefilled here, with
+explicit 3D rotary positions, and `generate` is given a cache that already
+covers everything but the final prompt token. The same path accepts image
+embeddings computed earlier (encode_images), so two passes over one image
+run the vision encoder once.
+"""
+import copy
+import hashlib
+from typing import Optional
+
+import torch
+from transformers import DynamicCache
+
+
+class PrefixKVCache:
+    """Key/value states of the system prompt, shared by all generations."""
+
+    def __init__(self, model, processor, system_prompt: str):
+        """
+        Tokenize the system prompt and compute its key/value states.
+
+        Args:
+            model: Loaded Qwen2.5-VL model
+            processor: Matching processor
+            system_prompt: System prompt every request starts with
+        """
+        self.model = model
+        self.processor = processor
+        self.fingerprint = self.make_fingerprint(model, system_prompt)
+
+        prefix_text = processor.apply_chat_template(
+            [{"role": "system", "content": system_prompt}],
+            tokenize=False,
+            add_generation_prompt=False,
+        )
+        self.input_ids = processor.tokenizer(
+            prefix_text, add_special_tokens=False, return_tensors="pt"
+        ).input_ids.to(model.device)
+        self.length = self.input_ids.shape[1]
+        self._cache = self._compute()
+
+    @staticmethod
+    def make_fingerprint(model, system_prompt: str) -> str:
+        """
+        Identify the model and prompt a prefix cache was built for.
+
+        Args:
+            model: Loaded model
+            system_prompt: System prompt text
+
+        Returns:
+            str: Fingerprint that changes with the model or the prompt
+        """
+        material = f"{model.config.name_or_path}\n{id(model)}\n{system_prompt}"
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _decoder(self):
+        """The text decoder (its location moved between transformers releases)."""
+        decoder = getattr(self.model, "language_model", None)
+        return decoder if decoder is not None else self.model.model
+
+    def _rope_owner(self):
+        """The module that owns get_rope_index and the cached rope_deltas."""
+        inner = self.model.model
+        return inner if hasattr(inner, "rope_deltas") else self.model
+
+    def _compute(self) -> DynamicCache:
+        """Run the decoder over the prefix once and keep its cache."""
+        cache = DynamicCache()
+        positions = torch.arange(self.length, device=self.model.device)
+        # Text-only prefix: all three rotary sections share the same position
+        positions = positions.view(1, 1, -1).expand(3, 1, -1)
+        with torch.no_grad():
+            self._decoder()(
+                inputs_embeds=self.model.get_input_embeddings()(self.input_ids),
+                position_ids=positions,
+                past_key_values=cache,
+                use_cache=True,
+            )
+        return cache
+
+    def matches(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> bool:
+        """
+        Check that every (left-padded) row of a batch starts with the prefix.
+
+        Args:
+            input_ids: Tokenized prompts
+            attention_mask: Matching attention mask
+
+        Returns:
+            bool: Whether the prefix cache applies to this batch
+        """
+        for row, mask in zip(input_ids, attention_mask):
+            tokens = row[mask.bool()]
+            # The final prompt token is always fed through generate itself
+            if tokens.shape[0] <= self.length + 1:
+                return False
+            if not torch.equal(tokens[:self.length], self.input_ids[0]):
+                return False
+        return True
+
+    def _move_padding_after_prefix(self, input_ids: torch.Tensor, attention_mask: torch.Tensor):
+        """
+        Rearrange left-padded rows to prefix + padding + remainder.
+
+        The shared prefix then sits at the same positions in every row, so a
+        single copy of its cache serves the whole batch.
+        """
+        pad_token_id = self.processor.tokenizer.pad_token_id
+        rows, masks = [], []
+        for row, mask in zip(input_ids, attention_mask):
+            tokens = row[mask.bool()]
+            padding = row.shape[0] - tokens.shape[0]
+            rows.append(torch.cat([
+                tokens[:self.length],
+                torch.full((padding,), pad_token_id, dtype=row.dtype, device=row.device),
+                tokens[self.length:],
+            ]))
+            masks.append(torch.cat([
+                torch.ones(self.length, dtype=mask.dtype, device=mask.device),
+                torch.zeros(padding, dtype=mask.dtype, device=mask.device),
+                torch.ones(tokens.shape[0] - self.length, dtype=mask.dtype, device=mask.device),
+            ]))
+        return torch.stack(rows), torch.stack(masks)
+
+    def _embed(self, input_ids: torch.Tensor, pixel_values, image_grid_thw, image_embeds=None) -> torch.Tensor:
+        """Token embeddings with the vision encoder output scattered into image slots."""
+        embeds = self.model.get_input_embeddings()(input_ids)
+        if image_embeds is None:
+            if pixel_values is None:
+                return embeds
+            image_embeds = encode_images(self.model, pixel_values, image_grid_thw)
+        mask = (input_ids == self.model.config.image_token_id).unsqueeze(-1).expand_as(embeds)
+        return embeds.masked_scatter(mask, image_embeds.to(embeds.device, embeds.dtype))
+
+    def generate(self, inputs, image_embeds: Optional[torch.Tensor] = None, **generate_kwargs) -> torch.Tensor:
+        """
+        Generate for a batch, reusing the prefix key/value states.
+
+        Args:
+            inputs: Processor output (input_ids, attention_mask, pixel_values,
+                image_grid_thw)
+            image_embeds: Vision encoder output for the batch's images, from
+                encode_images (computed from pixel_values when omitted)
+            **generate_kwargs: Forwarded to model.generate
+
+        Returns:
+            torch.Tensor: Prompt plus generated token ids, one row per image
+        """
+        input_ids, attention_mask = self._move_padding_after_prefix(
+            inputs["input_ids"], inputs["attention_mask"]
+        )
+        image_grid_thw = inputs.get("image_grid_thw")
+        batch_size, total_length = input_ids.shape
+
+        rope_owner = self._rope_owner()
+        position_ids, rope_deltas = rope_owner.get_rope_index(
+            input_ids=input_ids,
+            image_grid_thw=image_grid_thw,
+            attention_mask=attention_mask,
+        )
+
+        cache = copy.deepcopy(self._cache)
+        if batch_size > 1:
+            cache.batch_repeat_interleave(batch_size)
+
+        # Prefill everything after the prefix except the last prompt token
+        end = total_length - 1
+        with torch.no_grad():
+            self._decoder()(
+                inputs_embeds=self._embed(
+                    input_ids[:, self.length:end], inputs.get("pixel_values"), image_grid_thw, image_embeds
+                ),
+                attention_mask=attention_mask[:, :end],
+                position_ids=position_ids[:, :, self.length:end],
+                past_key_values=cache,
+                cache_position=torch.arange(self.length, end, device=input_ids.device),
+                use_cache=True,
+            )
+        # Decoding continues from these deltas once the cache is non-empty
+        rope_owner.rope_deltas = rope_deltas
+
+        return self.model.generate(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            past_key_values=cache,
+            **generate_kwargs,
+        )
+
+
+def encode_images(model, pixel_values: torch.Tensor, image_grid_thw: torch.Tensor) -> torch.Tensor:
+    """
+    Run the vision encoder over a batch's images.
+
+    Args:
+        model: Loaded Qwen2.5-VL model
+        pixel_values: Flattened image patches from the processor
+        image_grid_thw: Patch grid (t, h, w) of each image
+
+    Returns:
+        torch.Tensor: One embedding per image token, images in batch order
+    """
+    visual = model.visual
+    with torch.no_grad():
+        return visual(pixel_values.type(visual.dtype), grid_thw=image_grid_thw)
+
+
+def build_prefix_cache(model, processor, system_prompt: str) -> Optional[PrefixKVCache]:
+    """
+    Build a prefix cache, falling back to plain generation if it fails.
+
+    Args:
+        model: Loaded Qwen2.5-VL model
+        processor: Matching processor
+        system_prompt: System prompt every request starts with
+
+    Returns:
+        PrefixKVCache or None: The cache, or None if it could not be built
+    """
+    try:
+        prefix_cache = PrefixKVCache(model, processor, system_prompt)
+    except Exception as e:
+        print(f"Warning: could not build system-prompt KV cache: {e}")
+        return None
+    print(f"System-prompt KV cache ready ({prefix_cache.length} tokens)")
+    return prefix_cache
@@ -0,0 +1,339 @@
+"""
+Content-addressed cache for extraction results.
+
+Entries are keyed by the decoded image content, the model name, the
+system prompt and the image preprocessing settings, so changing any of the
+latter invalidates old results.
+A bounded in-memory LRU tier sits in front of a persistent on-disk tier
+that survives restarts. The lock only guards the in-memory structures;
+disk entries are read, written and deleted outside it, so one slow file
+operation does not stall every other lookup.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from utils.config import (
+    CACHE_DIR,
+    CACHE_DISK_MAX_MB,
+    CACHE_MAX_AGE_HOURS,
+    CACHE_MEMORY_MAX_ENTRIES,
+    COMPACT_OUTPUT,
+    DATA_ONLY_EXTRACTION,
+    INFERENCE_BACKEND,
+    MODEL_NAME,
+    TWO_STAGE_EXTRACTION,
+)
+from utils.image_preprocessing import preprocessing_signature
+from utils.json_repair import is_truncated
+from utils.prompts import IELTS_TASK1_CLASSIFICATION_PROMPT, get_system_prompt
+
+
+class ResultCache:
+    """Two-tier (memory LRU + disk) cache of metadata dicts."""
+
+    def __init__(
+        self,
+        memory_max_entries: int = CACHE_MEMORY_MAX_ENTRIES,
+        disk_dir: Optional[str] = CACHE_DIR,
+        disk_max_bytes: int = CACHE_DISK_MAX_MB * 1024 * 1024,
+        max_age_seconds: float = CACHE_MAX_AGE_HOURS * 3600,
+        model_name: Optional[str] = None,
+        system_prompt: Optional[str] = None,
+        preprocessing: Optional[str] = None,
+    ):
+        """
+        Initialize the cache and index any existing on-disk entries.
+
+        Args:
+            memory_max_entries: Maximum number of entries kept in memory
+            disk_dir: Directory for the persistent tier (None or "" disables it)
+            disk_max_bytes: Size budget of the persistent tier
+            max_age_seconds: Entries older than this are treated as misses
+            model_name: Model name mixed into every key (defaults to
+                MODEL_NAME, or the backend name for a non-Qwen backend so
+                its outputs never mix with real ones)
+            system_prompt: System prompt whose hash is mixed into every key
+                (defaults to the one for the configured extraction mode, plus
+                the classification prompt with two-stage extraction)
+            preprocessing: Image preprocessing settings mixed into every key
+                (defaults to the configured ones)
+        """
+        self.memory_max_entries = max(0, memory_max_entries)
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = disk_max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.model_name = model_name or (MODEL_NAME if INFERENCE_BACKEND == "qwen" else INFERENCE_BACKEND)
+        if system_prompt is None:
+            system_prompt = get_system_prompt(DATA_ONLY_EXTRACTION, COMPACT_OUTPUT)
+            if TWO_STAGE_EXTRACTION:
+                # The extraction prompts are cut from the same sections, so
+                # the full prompt already covers them
+                system_prompt += IELTS_TASK1_CLASSIFICATION_PROMPT
+        self.prompt_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+        self.preprocessing = preprocessing or preprocessing_signature()
+
+        self._lock = threading.Lock()
+        # key -> (stored_at, metadata)
+        self._memory: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        # key -> (mtime, size) for the disk tier, oldest first
+        self._disk_index: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+        self._disk_bytes = 0
+        self._counters: Dict[str, int] = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+            "expired": 0,
+        }
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def make_key(self, content_hash: str) -> str:
+        """
+        Build the cache key for an image.
+
+        Args:
+            content_hash: Hash of the decoded image content
+
+        Returns:
+            str: Cache key
+        """
+        material = f"{self.model_name}\n{self.prompt_hash}\n{self.preprocessing}\n{content_hash}"
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, count_miss: bool = True) -> Optional[dict]:
+        """
+        Look up a cached result.
+
+        Args:
+            key: Cache key from make_key()
+            count_miss: Whether a miss counts towards the miss counter
+                (speculative lookups such as near-duplicate candidates
+                should not skew the hit rate)
+
+        Returns:
+            dict or None: Cached metadata, or None on a miss
+        """
+        now = time.time()
+        disk_entry = None
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, metadata = entry
+                if now - stored_at <= self.max_age_seconds:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return metadata
+                del self._memory[key]
+                self._counters["expired"] += 1
+
+            if key in self._disk_index:
+                disk_entry = self._disk_index[key]
+                if now - disk_entry[0] > self.max_age_seconds:
+                    self._forget_disk_entry(key)
+                    self._counters["expired"] += 1
+                    expired = True
+                else:
+                    expired = False
+
+        if disk_entry is not None:
+            if expired:
+                self._unlink(self._entry_path(key))
+            else:
+                metadata = self._read_disk_entry(key)
+                with self._lock:
+                    if metadata is not None:
+                        self._counters["disk_hits"] += 1
+                        self._store_in_memory(key, disk_entry[0], metadata)
+                        return metadata
+                    # Unreadable; forget it unless it was rewritten meanwhile
+                    if self._disk_index.get(key) == disk_entry:
+                        self._forget_disk_entry(key)
+
+        if count_miss:
+            with self._lock:
+                self._counters["misses"] += 1
+        return None
+
+    def record_miss(self):
+        """Count a miss for a lookup made with count_miss=False."""
+        with self._lock:
+            self._counters["misses"] += 1
+
+    def put(self, key: str, metadata: dict):
+        """
+        Store a result in both tiers.
+
+        Error results (e.g. unparseable model output) and results cut off
+        before they were complete are not cached.
+
+        Args:
+            key: Cache key from make_key()
+            metadata: Extracted metadata
+        """
+        if "error" in metadata or is_truncated(metadata):
+            return
+        now = time.time()
+        with self._lock:
+            self._counters["stores"] += 1
+            self._store_in_memory(key, now, metadata)
+        if not self.disk_dir:
+            return
+
+        size = self._write_disk_entry(key, metadata)
+        if size is None:
+            return
+        with self._lock:
+            self._forget_disk_entry(key)
+            self._disk_index[key] = (time.time(), size)
+            self._disk_bytes += size
+            evicted = self._evict_disk()
+        for evicted_key in evicted:
+            self._unlink(self._entry_path(evicted_key))
+
+    def get_stats(self) -> dict:
+        """
+        Report hit/miss/eviction counters and tier sizes.
+
+        Returns:
+            dict: Cache statistics
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            hits = counters["memory_hits"] + counters["disk_hits"]
+            lookups = hits + counters["misses"]
+            return {
+                **counters,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_max_entries": self.memory_max_entries,
+                "disk_enabled": self.disk_dir is not None,
+                "disk_entries": len(self._disk_index),
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes,
+            }
+
+    def _store_in_memory(self, key: str, stored_at: float, metadata: dict):
+        """Insert into the LRU tier, evicting the least recently used entries."""
+        if self.memory_max_entries == 0:
+            return
+        self._memory[key] = (stored_at, metadata)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_max_entries:
+            self._memory.popitem(last=False)
+            self._counters["memory_evictions"] += 1
+
+    def _entry_path(self, key: str) -> str:
+        """Path of a disk entry, sharded by key prefix."""
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _load_disk_index(self):
+        """Index existing disk entries, dropping any that have expired."""
+        now = time.time()
+        entries = []
+        for shard in os.listdir(self.disk_dir):
+            shard_dir = os.path.join(self.disk_dir, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(shard_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if now - stat.st_mtime > self.max_age_seconds:
+                    self._unlink(path)
+                    continue
+                entries.append((stat.st_mtime, name[:-len(".json")], stat.st_size))
+
+        for mtime, key, size in sorted(entries):
+            self._disk_index[key] = (mtime, size)
+            self._disk_bytes += size
+        for key in self._evict_disk():
+            self._unlink(self._entry_path(key))
+
+    def _read_disk_entry(self, key: str) -> Optional[dict]:
+        """Read a disk entry (None if it is missing or unreadable)."""
+        try:
+            with open(self._entry_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk_entry(self, key: str, metadata: dict) -> Optional[int]:
+        """Atomically write a disk entry; returns its size, or None if writing failed."""
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(metadata, ensure_ascii=False).encode("utf-8")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: failed to write cache entry {key}: {e}")
+            self._unlink(tmp_path)
+            return None
+        return len(data)
+
+    def _evict_disk(self) -> List[str]:
+        """
+        Drop the oldest disk entries from the index until the tier fits its budget.
+
+        Must be called with the lock held.
+
+        Returns:
+            list: Evicted keys, whose files the caller deletes after
+                releasing the lock
+        """
+        evicted = []
+        while self._disk_index and self._disk_bytes > self.disk_max_bytes:
+            key = next(iter(self._disk_index))
+            self._forget_disk_entry(key)
+            self._counters["disk_evictions"] += 1
+            evicted.append(key)
+        return evicted
+
+    def _forget_disk_entry(self, key: str):
+        """Drop a disk entry from the index (the caller deletes its file)."""
+        _, size = self._disk_index.pop(key, (0.0, 0))
+        self._disk_bytes -= size
+
+    @staticmethod
+    def _unlink(path: str):
+        """Remove a file, ignoring errors."""
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# Global instance
+_result_cache: Optional[ResultCache] = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """
+    Get or create the global result cache instance.
+
+    Returns:
+        ResultCache: The global result cache instance
+    """
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = ResultCache()
+    return _result_cache
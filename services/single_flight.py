@@ -0,0 +1,122 @@
+"""
+Single-flight coalescing of identical in-flight work.
+
+When the same image is requested many times at once (a class opening the
+same exam), every copy would otherwise run its own download and generation
+before the first result reaches the cache. A SingleFlight runs the work
+once per key and hands its result, or its exception, to every caller that
+asked for the same key while it was running. Once it finishes the key is
+released, so later callers go through the result cache as usual.
+
+The shared work runs in its own task: a caller that goes away (client
+disconnect, cancelled batch) stops waiting without affecting the others,
+and the work is cancelled only when nobody is waiting for it any more.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from services.metrics import COALESCED_REQUESTS
+
+
+class _Call:
+    """One running computation, what its starter attached to it and the number of callers awaiting it."""
+
+    def __init__(self, task: "asyncio.Task", context: Any = None):
+        self.task = task
+        self.context = context
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Registry of in-flight computations keyed by what they compute."""
+
+    def __init__(self, kind: str):
+        """
+        Initialize an empty registry.
+
+        Args:
+            kind: Label for metrics and stats (e.g. "url", "content")
+        """
+        self.kind = kind
+        self._calls: Dict[Hashable, _Call] = {}
+        self._started = 0
+        self._coalesced = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Number of keys currently being computed."""
+        return len(self._calls)
+
+    async def run(
+        self,
+        key: Hashable,
+        work: Callable[[], Awaitable[Any]],
+        context: Any = None,
+        on_join: Optional[Callable[[Any], None]] = None,
+    ) -> Any:
+        """
+        Run work() for key, or join the run already in flight for it.
+
+        Must be called from the event loop that runs the work.
+
+        Args:
+            key: Identity of the result (equal keys must mean equal results)
+            work: Coroutine function producing the result; only called when
+                no run for key is in flight
+            context: Kept with the run this call starts, for later callers
+            on_join: Called with the context of the run this call joins
+                (e.g. to raise its priority)
+
+        Returns:
+            Any: The result of the (possibly shared) run
+
+        Raises:
+            Exception: Whatever the shared run raised, for every caller
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(work()), context)
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._release(key, call))
+            self._started += 1
+        else:
+            self._coalesced += 1
+            COALESCED_REQUESTS.labels(kind=self.kind).inc()
+            if on_join is not None:
+                on_join(call.context)
+
+        call.waiters += 1
+        try:
+            # Shielded so one caller's cancellation leaves the run to the others
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Nobody wants the result any more; later callers start anew
+                # rather than joining a run that is being cancelled
+                self._release(key, call)
+                call.task.cancel()
+
+    def _release(self, key: Hashable, call: _Call):
+        """Forget a finished run so the next caller starts afresh."""
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # The exception was delivered to every waiter; mark it retrieved
+        if call.task.done() and not call.task.cancelled():
+            call.task.exception()
+
+    def get_stats(self) -> dict:
+        """
+        Get coalescing statistics.
+
+        Returns:
+            dict: Runs started, callers that joined a running one, and keys
+                in flight
+        """
+        total = self._started + self._coalesced
+        return {
+            "started": self._started,
+            "coalesced": self._coalesced,
+            "coalesced_rate": self._coalesced / total if total else 0.0,
+            "in_flight": self.in_flight,
+        }
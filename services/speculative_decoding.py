@@ -0,0 +1,151 @@
+"""
+Speculative (assisted) decoding with a smaller draft model.
+
+A task1_v1 document is thousands of tokens of mostly predictable JSON
+(keys, quotes, brackets, repeated structure). A small draft model that
+shares the main model's tokenizer proposes several tokens at a time, and
+the main model checks all of them in a single forward pass, keeping the
+longest prefix it agrees with plus one token of its own. With greedy
+decoding the output is exactly what the main model would have produced
+alone; only the number of main-model forward passes changes.
+
+transformers' assisted generation does the proposing and verifying; this
+module prepares the draft model and measures how many drafted tokens were
+accepted, which is what decides whether the draft pays for itself.
+"""
+import threading
+import time
+from typing import Optional
+
+import torch
+
+from services.metrics import DRAFT_TOKENS
+
+
+def prepare_draft_model(draft_model, draft_tokenizer, model, tokenizer, num_tokens: int):
+    """
+    Check that a draft model can assist the main model and configure it.
+
+    Qwen2.5-VL checkpoints of different sizes share one tokenizer but pad
+    their embedding matrices to different sizes (151936 rows for 3B, 152064
+    for 7B); the draft's embeddings are padded to the main model's size so
+    transformers treats them as the same vocabulary.
+
+    Args:
+        draft_model: Loaded draft model
+        draft_tokenizer: The draft model's tokenizer
+        model: Loaded main model
+        tokenizer: The main model's tokenizer
+        num_tokens: Tokens drafted per round to start with
+
+    Raises:
+        ValueError: If the two models do not share a tokenizer
+    """
+    if draft_tokenizer.get_vocab() != tokenizer.get_vocab():
+        raise ValueError("The draft model must use the same tokenizer as the main model")
+
+    vocab_size = model.config.get_text_config().vocab_size
+    if draft_model.config.get_text_config().vocab_size != vocab_size:
+        draft_model.resize_token_embeddings(vocab_size)
+        # resize_token_embeddings only updates the text config on some versions
+        draft_model.config.vocab_size = vocab_size
+
+    # Draft more after fully accepted rounds, fewer after rejections
+    draft_model.generation_config.num_assistant_tokens = max(1, num_tokens)
+    draft_model.generation_config.num_assistant_tokens_schedule = "heuristic"
+
+
+class ForwardCounter:
+    """Counts a module's forward passes while active, and notes when the first one finished."""
+
+    def __init__(self, module: Optional[torch.nn.Module]):
+        """
+        Initialize the counter (counting starts on entering the context).
+
+        Args:
+            module: Module whose forward calls are counted (None counts nothing)
+        """
+        self.module = module
+        self.calls = 0
+        self.first_done_at: Optional[float] = None
+        self._handle = None
+
+    def _hook(self, module, args, output):
+        if self.calls == 0:
+            logits = getattr(output, "logits", None)
+            if logits is not None and logits.is_cuda:
+                torch.cuda.synchronize(logits.device)
+            self.first_done_at = time.perf_counter()
+        self.calls += 1
+
+    def __enter__(self) -> "ForwardCounter":
+        if self.module is not None:
+            self._handle = self.module.register_forward_hook(self._hook)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._handle is not None:
+            self._handle.remove()
+            self._handle = None
+
+
+class SpeculativeStats:
+    """Running totals of drafted and accepted tokens."""
+
+    def __init__(self, draft_model_name: str):
+        """
+        Initialize empty totals.
+
+        Args:
+            draft_model_name: Name of the draft model, for reporting
+        """
+        self.draft_model_name = draft_model_name
+        self._lock = threading.Lock()
+        self._generations = 0
+        self._rounds = 0
+        self._proposed = 0
+        self._accepted = 0
+        self._generated = 0
+
+    def record(self, rounds: int, proposed: int, generated: int):
+        """
+        Record one assisted generate call.
+
+        Every verification round keeps the accepted draft tokens plus one
+        token from the main model, so accepted = generated - rounds.
+
+        Args:
+            rounds: Main-model forward passes (one per verification round)
+            proposed: Draft-model forward passes (one per drafted token)
+            generated: Tokens the call generated
+        """
+        accepted = max(0, min(proposed, generated - rounds))
+        DRAFT_TOKENS.labels(outcome="accepted").inc(accepted)
+        DRAFT_TOKENS.labels(outcome="rejected").inc(proposed - accepted)
+        with self._lock:
+            self._generations += 1
+            self._rounds += rounds
+            self._proposed += proposed
+            self._accepted += accepted
+            self._generated += generated
+
+    def get_stats(self) -> dict:
+        """
+        Report acceptance statistics.
+
+        Returns:
+            dict: Draft model, generate calls, verification rounds, drafted,
+                accepted and generated tokens, acceptance rate and tokens
+                per main-model forward pass
+        """
+        with self._lock:
+            return {
+                "draft_model": self.draft_model_name,
+                "generations": self._generations,
+                "rounds": self._rounds,
+                "draft_tokens": self._proposed,
+                "accepted_tokens": self._accepted,
+                "generated_tokens": self._generated,
+                "acceptance_rate": round(self._accepted / self._proposed, 3) if self._proposed else None,
+                "tokens_per_round": round(self._generated / self._rounds, 2) if self._rounds else None,
+            }
@@ -0,0 +1,157 @@
+"""
+Structural stopping criterion and per-category output token budgets.
+
+Generation stops for a row as soon as its top-level JSON object closes,
+instead of running on to max_new_tokens when the model keeps talking after
+the closing brace. Once the row has emitted its `task_visual_category`, the
+matching token budget applies, so a looping `data_points` array on a pie
+chart is cut off long before the global limit.
+
+Under speculative decoding the criterion is also asked about drafted tokens
+that the main model may then reject; when the next call does not extend the
+tokens seen last, the state from before that call is restored.
+"""
+import copy
+from typing import Dict, List, Optional
+
+import torch
+from transformers import StoppingCriteria
+
+from utils.incremental_json import IncrementalSectionParser
+
+
+class StructuralStoppingCriteria(StoppingCriteria):
+    """Stop each row when its JSON object closes or its budget is spent."""
+
+    def __init__(
+        self,
+        tokenizer,
+        prompt_length: int,
+        batch_size: int,
+        budgets: Dict[str, int],
+        default_budget: int,
+    ):
+        """
+        Initialize per-row tracking state.
+
+        Args:
+            tokenizer: Tokenizer used to decode generated tokens
+            prompt_length: Length of the (padded) prompt in tokens
+            batch_size: Number of rows being generated
+            budgets: Token budget per task_visual_category
+            default_budget: Budget while the category is not yet known
+        """
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.budgets = budgets
+        self.default_budget = default_budget
+        self._parsers = [IncrementalSectionParser() for _ in range(batch_size)]
+        self._categories: List[Optional[str]] = [None] * batch_size
+        self._stop_reasons: List[Optional[str]] = [None] * batch_size
+        self._seen = 0
+        self._token_text: Dict[int, str] = {}
+        # Generated tokens of the last call, and the state from before it
+        self._last_tokens: Optional[torch.Tensor] = None
+        self._snapshot = None
+
+    def _decode(self, token_id: int) -> str:
+        """Decode a single token, memoized (braces and quotes are ASCII, so
+        per-token decoding is exact for structural characters)."""
+        text = self._token_text.get(token_id)
+        if text is None:
+            text = self.tokenizer.decode([token_id], skip_special_tokens=True)
+            self._token_text[token_id] = text
+        return text
+
+    def _extends_last(self, input_ids: torch.LongTensor) -> bool:
+        """Whether input_ids continue the tokens of the previous call."""
+        last = self._last_tokens
+        if last is None:
+            return True
+        end = self.prompt_length + last.shape[1]
+        return input_ids.shape[1] >= end and torch.equal(input_ids[:, self.prompt_length:end], last)
+
+    def _save_snapshot(self):
+        self._snapshot = (
+            self._last_tokens,
+            self._seen,
+            [copy.copy(parser) for parser in self._parsers],
+            list(self._categories),
+            list(self._stop_reasons),
+        )
+
+    def _rewind(self, input_ids: torch.LongTensor):
+        """Drop the state built from rejected draft tokens."""
+        if self._snapshot is not None:
+            (self._last_tokens, self._seen, self._parsers,
+             self._categories, self._stop_reasons) = self._snapshot
+            self._snapshot = None
+        if not self._extends_last(input_ids):
+            # Not a one-step rollback; start over from the prompt
+            batch_size = len(self._parsers)
+            self._parsers = [IncrementalSectionParser() for _ in range(batch_size)]
+            self._categories = [None] * batch_size
+            self._stop_reasons = [None] * batch_size
+            self._seen = 0
+            self._last_tokens = None
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        if not self._extends_last(input_ids):
+            self._rewind(input_ids)
+        self._save_snapshot()
+        self._last_tokens = input_ids[:, self.prompt_length:].clone()
+
+        generated = input_ids.shape[1] - self.prompt_length
+        new_tokens = input_ids[:, self.prompt_length + self._seen:].tolist()
+        self._seen = generated
+
+        done = []
+        for row, tokens in enumerate(new_tokens):
+            if self._stop_reasons[row] is not None:
+                done.append(True)
+                continue
+            parser = self._parsers[row]
+            for token_id in tokens:
+                for key, value in parser.feed(self._decode(token_id)):
+                    if key == "task_visual_category" and isinstance(value, str):
+                        self._categories[row] = value
+                if parser.finished:
+                    break
+            if parser.finished:
+                self._stop_reasons[row] = "complete"
+            elif generated >= self.budget_for(row):
+                self._stop_reasons[row] = "budget"
+            done.append(self._stop_reasons[row] is not None)
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+    def budget_for(self, row: int) -> int:
+        """Token budget currently in force for a row."""
+        category = self._categories[row]
+        if category is None:
+            return self.default_budget
+        return self.budgets.get(category, self.default_budget)
+
+    def truncation_warning(self, row: int, generated_tokens: int) -> Optional[str]:
+        """
+        Describe how a row's output was cut short, if it was.
+
+        Args:
+            row: Row index in the batch
+            generated_tokens: Number of tokens the row generated
+
+        Returns:
+            str or None: Warning text, or None if the JSON object closed
+        """
+        reason = self._stop_reasons[row]
+        if reason == "complete":
+            return None
+        category = self._categories[row] or "unknown"
+        if reason == "budget":
+            return (
+                f"Output truncated at the {self.budget_for(row)}-token budget for "
+                f"task_visual_category '{category}'; later fields may be missing"
+            )
+        return (
+            f"Output ended after {generated_tokens} tokens before the JSON object "
+            f"was closed; later fields may be missing"
+        )
@@ -3,79 +3,233 @@ Vision service for extracting IELTS Task 1 image metadata using Qwen2.5-VL model
 """
 import torch
 import json
-from typing import Optional, Union
-from transformers import Qwen2_5_VLForConditionalGeneration, AutoProcessor, BitsAndBytesConfig
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from transformers import AutoProcessor, BatchFeature, LogitsProcessor, TextStreamer
 from qwen_vl_utils import process_vision_info
-from utils.prompts import IELTS_TASK1_VISION_SYSTEM_PROMPT
+from PIL import Image
+from services.constrained_decoding import GrammarTokenTables, JSONGrammarLogitsProcessor, build_grammar_tables
+from services.inference_backend import InferenceBackend
+from services.metrics import (
+    CLASSIFICATIONS,
+    GPU_MEMORY_PEAK_BYTES,
+    GPU_MEMORY_RESERVED_PEAK_BYTES,
+    JSON_REPAIRS,
+    PARSE_FAILURES,
+    PROMPT_TOKENS,
+    VISION_TOKENS,
+    observe_stage,
+    record_generation,
+)
+from services.precision_profiles import load_model, resolve_profile
+from services.prefix_cache import PrefixKVCache, build_prefix_cache, encode_images
+from services.speculative_decoding import ForwardCounter, SpeculativeStats, prepare_draft_model
+from services.stopping import StructuralStoppingCriteria
+from utils.config import (
+    COMPACT_OUTPUT,
+    CONSTRAINED_DECODING,
+    DATA_ONLY_EXTRACTION,
+    DRAFT_MODEL_NAME,
+    DRAFT_NUM_TOKENS,
+    IMAGE_MAX_PIXELS,
+    IMAGE_MIN_PIXELS,
+    MAX_NEW_TOKENS,
+    MODEL_NAME,
+    PRECISION_PROFILE,
+    PREFIX_CACHE_ENABLED,
+    TOKEN_BUDGETS,
+    TWO_STAGE_EXTRACTION,
+)
+from utils.compact_format import expand_compact
+from utils.derived_fields import fill_derived_fields
+from utils.json_repair import describe_repairs, parse_model_output
+from utils.prompts import (
+    IELTS_TASK1_CLASSIFICATION_PROMPT,
+    IELTS_TASK1_CLASSIFICATION_USER_PROMPT,
+    IELTS_TASK1_USER_PROMPT,
+    VISUAL_TYPES,
+    get_classified_prompts,
+    get_system_prompt,
+    parse_classification,
+)
 
 
-class VisionService:
+# Anything qwen_vl_utils can turn into an image
+ImageInput = Union[str, bytes, Image.Image]
+
+# Number of distinct system prompts whose KV caches are kept at once (the
+# full prompt, plus the classification prompt and the six single-type
+# prompts with two-stage extraction)
+_MAX_PREFIX_CACHES = 8
+
+# Generation limit of the two-stage classification pass; its JSON answer
+# takes about 30 tokens
+_CLASSIFY_MAX_TOKENS = 64
+
+# (task_visual_category, visual types) from the classification pass
+Classification = Tuple[str, Tuple[str, ...]]
+
+
+class _CallbackStreamer(TextStreamer):
+    """Forwards newly decoded text to a callback while generation runs."""
+    
+    def __init__(self, tokenizer, on_text: Callable[[str], None]):
+        super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        self._on_text = on_text
+    
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        if text:
+            self._on_text(text)
+
+
+class _PrefillTimer(LogitsProcessor):
+    """Notes when the first new token's logits are ready, i.e. when prefill ends."""
+    
+    def __init__(self):
+        self.prefill_done_at: Optional[float] = None
+    
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        if self.prefill_done_at is None:
+            if scores.is_cuda:
+                torch.cuda.synchronize(scores.device)
+            self.prefill_done_at = time.perf_counter()
+        return scores
+
+
+class VisionService(InferenceBackend):
     """Service for processing IELTS Task 1 images and extracting metadata."""
     
-    def __init__(self, model_name: str = "Qwen/Qwen2.5-VL-7B-Instruct"):
+    backend_name = "qwen"
+    
+    def __init__(
+        self,
+        model_name: str = MODEL_NAME,
+        on_phase: Optional[Callable[[str], None]] = None,
+        draft_model_name: str = DRAFT_MODEL_NAME,
+        precision_profile: str = PRECISION_PROFILE,
+    ):
         """
         Initialize the vision service with the Qwen2.5-VL model.
         
         Args:
             model_name: The name of the model to use
+            on_phase: Called with "loading_model" and then "preparing" (prefix
+                cache and grammar tables) as initialization progresses
+            draft_model_name: Smaller model drafting tokens for speculative
+                decoding (empty disables it)
+            precision_profile: Weight precision and device profile, see
+                services.precision_profiles ("auto" picks by hardware)
         """
         self.model_name = model_name
+        self.precision_profile = resolve_profile(precision_profile)
         self.model = None
         self.processor = None
+        self.data_only = DATA_ONLY_EXTRACTION
+        self.compact = COMPACT_OUTPUT
+        self.system_prompt = get_system_prompt(self.data_only, self.compact)
+        self.two_stage = TWO_STAGE_EXTRACTION
+        self.use_prefix_cache = PREFIX_CACHE_ENABLED
+        self.min_pixels = IMAGE_MIN_PIXELS
+        self.max_pixels = IMAGE_MAX_PIXELS
+        self._prefix_caches: "OrderedDict[str, Optional[PrefixKVCache]]" = OrderedDict()
+        self.grammar_tables: Optional[GrammarTokenTables] = None
+        self.draft_model = None
+        self.speculative_stats: Optional[SpeculativeStats] = None
+        if on_phase is not None:
+            on_phase("loading_model")
         self._initialize_model()
+        if draft_model_name:
+            if CONSTRAINED_DECODING:
+                print("Warning: DRAFT_MODEL_NAME is ignored while CONSTRAINED_DECODING is enabled")
+            else:
+                self._initialize_draft_model(draft_model_name)
+        if on_phase is not None:
+            on_phase("preparing")
+        if self.use_prefix_cache:
+            self._get_prefix_cache(self.system_prompt)
+            if self.two_stage:
+                self._get_prefix_cache(IELTS_TASK1_CLASSIFICATION_PROMPT)
+                for visual_type in VISUAL_TYPES:
+                    self._get_prefix_cache(
+                        get_classified_prompts((visual_type, (visual_type,)), self.data_only, self.compact)[0]
+                    )
+        elif self.two_stage:
+            print("Warning: without the prefix cache, two-stage extraction encodes each image twice")
+        if CONSTRAINED_DECODING:
+            self.grammar_tables = build_grammar_tables(self.model, self.processor, self.system_prompt)
     
     def _initialize_model(self):
-        """Initialize the model with 4-bit quantization for efficient inference."""
-        print(f"Initializing {self.model_name}...")
+        """Initialize the model with the configured precision profile."""
+        print(f"Initializing {self.model_name} ({self.precision_profile})...")
         
         # Check GPU availability
         if torch.cuda.is_available():
             print(f"GPU: {torch.cuda.get_device_name(0)}")
             print(f"VRAM: {torch.cuda.get_device_properties(0).total_memory / 1e9:.2f} GB")
         else:
-            print("Warning: No GPU detected. Model will run on CPU (very slow).")
-        
-        # Configure 4-bit quantization with CPU offloading
-        quantization_config = BitsAndBytesConfig(
-            load_in_4bit=True,
-            bnb_4bit_compute_dtype=torch.bfloat16,
-            bnb_4bit_use_double_quant=True,
-            bnb_4bit_quant_type="nf4",
-            llm_int8_enable_fp32_cpu_offload=True
-        )
+            print("No GPU detected; running on CPU.")
         
-        # Load model with CPU offloading
-        self.model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
-            self.model_name,
-            quantization_config=quantization_config,
-            device_map="auto",
-            low_cpu_mem_usage=True,
-        )
+        self.model = self._load_model(self.model_name)
         
-        # Load processor
+        # Load processor; batched generation needs left padding so every
+        # prompt ends right where its generated tokens begin
         self.processor = AutoProcessor.from_pretrained(self.model_name)
+        self.processor.tokenizer.padding_side = "left"
         
-        print("Model loaded successfully with 4-bit quantization!")
+        print(f"Model loaded successfully with the {self.precision_profile} profile!")
     
-    def extract_metadata(self, image_data: Union[str, bytes]) -> dict:
+    def _load_model(self, model_name: str):
         """
-        Extract structured metadata from IELTS Task 1 image.
+        Load a Qwen2.5-VL checkpoint with the service's precision profile.
         
         Args:
-            image_data: Image URL or image bytes
+            model_name: Hugging Face model name or local path
             
         Returns:
-            dict: Structured metadata as JSON
+            Qwen2_5_VLForConditionalGeneration: The loaded model
         """
-        print("Extracting metadata from image...")
-        if self.model is None or self.processor is None:
-            raise RuntimeError("Model not initialized")
+        return load_model(model_name, self.precision_profile)
+    
+    def _initialize_draft_model(self, draft_model_name: str):
+        """Load the speculative decoding draft model next to the main model."""
+        print(f"Initializing draft model {draft_model_name}...")
+        draft_model = self._load_model(draft_model_name)
+        draft_tokenizer = AutoProcessor.from_pretrained(draft_model_name).tokenizer
+        prepare_draft_model(
+            draft_model, draft_tokenizer, self.model, self.processor.tokenizer, DRAFT_NUM_TOKENS
+        )
+        self.draft_model = draft_model
+        self.speculative_stats = SpeculativeStats(draft_model_name)
+        print(f"Speculative decoding enabled with {draft_model_name}")
+    
+    @property
+    def is_loaded(self) -> bool:
+        """Whether the model and processor are loaded."""
+        return self.model is not None and self.processor is not None
+    
+    def _build_messages(
+        self,
+        image_data: ImageInput,
+        system_prompt: Optional[str] = None,
+        user_text: str = IELTS_TASK1_USER_PROMPT,
+    ) -> List[dict]:
+        """
+        Build the chat messages for a single IELTS Task 1 image.
         
-        # Prepare messages for the model
-        messages = [
+        Args:
+            image_data: Image URL, image bytes or decoded PIL image
+            system_prompt: System prompt (defaults to the extraction prompt
+                for the configured mode)
+            user_text: Instruction following the image
+            
+        Returns:
+            list: Chat messages in the Qwen2.5-VL format
+        """
+        return [
             {
                 "role": "system",
-                "content": IELTS_TASK1_VISION_SYSTEM_PROMPT
+                "content": system_prompt or self.system_prompt
             },
             {
                 "role": "user",
@@ -83,81 +237,525 @@ class VisionService:
                     {
                         "type": "image",
                         "image": image_data,
+                        # Also bounds images that skipped preprocess_image()
+                        # (URLs and bytes passed straight to the service)
+                        "min_pixels": self.min_pixels,
+                        "max_pixels": self.max_pixels,
                     },
                     {
                         "type": "text",
-                        "text": "Analyze this IELTS Task 1 image and provide the complete JSON metadata as specified."
+                        "text": user_text
                     },
                 ],
             }
         ]
+    
+    def _get_prefix_cache(self, system_prompt: str) -> Optional[PrefixKVCache]:
+        """
+        Get the KV cache for a system prompt, building it on first use.
         
-        # Prepare for inference
-        text = self.processor.apply_chat_template(
-            messages, tokenize=False, add_generation_prompt=True
-        )
-        image_inputs, video_inputs = process_vision_info(messages)
-        inputs = self.processor(
-            text=[text],
-            images=image_inputs,
-            videos=video_inputs,
-            padding=True,
-            return_tensors="pt",
-        )
-        inputs = inputs.to(self.model.device)
+        Caches are keyed by model and prompt, so editing the prompt or
+        reloading the model transparently triggers a rebuild.
         
-        # Generate output with increased token limit
-        with torch.no_grad():
-            generated_ids = self.model.generate(**inputs, max_new_tokens=40960)
-            generated_ids_trimmed = [
-                out_ids[len(in_ids):] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
-            ]
-            output_text = self.processor.batch_decode(
-                generated_ids_trimmed, 
-                skip_special_tokens=True, 
-                clean_up_tokenization_spaces=False
+        Args:
+            system_prompt: System prompt the requests start with
+            
+        Returns:
+            PrefixKVCache or None: The cache, or None if it is unavailable
+        """
+        fingerprint = PrefixKVCache.make_fingerprint(self.model, system_prompt)
+        if fingerprint not in self._prefix_caches:
+            self._prefix_caches[fingerprint] = build_prefix_cache(
+                self.model, self.processor, system_prompt
             )
+            while len(self._prefix_caches) > _MAX_PREFIX_CACHES:
+                self._prefix_caches.popitem(last=False)
+        self._prefix_caches.move_to_end(fingerprint)
+        return self._prefix_caches[fingerprint]
+    
+    def _generate(
+        self,
+        inputs,
+        system_prompt: Optional[str] = None,
+        image_embeds: Optional[torch.Tensor] = None,
+        **generate_kwargs,
+    ) -> torch.Tensor:
+        """
+        Run generation, starting from the system-prompt KV cache when possible.
         
-        # Parse JSON output
-        try:
-            output = output_text[0]
-            
-            # Strip markdown code blocks if present
-            if output.startswith("```json"):
-                output = output[7:]  # Remove ```json
-            elif output.startswith("```"):
-                output = output[3:]   # Remove ```
-            
-            if output.endswith("```"):
-                output = output[:-3]  # Remove trailing ```
+        Args:
+            inputs: Processor output already moved to the model device
+            system_prompt: System prompt the inputs start with (defaults to
+                the extraction prompt for the configured mode)
+            image_embeds: Vision encoder output for the batch's images, reused
+                instead of encoding pixel_values again (prefix-cache path only)
+            **generate_kwargs: Forwarded to model.generate (max_new_tokens,
+                streamer, assistant_model, ...)
             
-            output = output.strip()  # Remove whitespace
+        Returns:
+            torch.Tensor: Prompt plus generated token ids
+        """
+        if self.use_prefix_cache:
+            prefix_cache = self._get_prefix_cache(system_prompt or self.system_prompt)
+            if prefix_cache is not None and prefix_cache.matches(
+                inputs["input_ids"], inputs["attention_mask"]
+            ):
+                if "assistant_model" in generate_kwargs:
+                    # The draft model has no prefix cache and encodes the image itself
+                    generate_kwargs["pixel_values"] = inputs.get("pixel_values")
+                    generate_kwargs["image_grid_thw"] = inputs.get("image_grid_thw")
+                return prefix_cache.generate(inputs, image_embeds=image_embeds, **generate_kwargs)
+        return self.model.generate(**inputs, **generate_kwargs)
+    
+    def _parse_output(self, output_text: str) -> dict:
+        """
+        Parse the raw model output into a metadata dict, repairing malformed JSON.
+        
+        Args:
+            output_text: Decoded model output
             
-            metadata = json.loads(output)
-            print("metadata = ", metadata)
-            return metadata
+        Returns:
+            dict: Parsed metadata (with any repairs noted in
+                extraction_notes.warnings, and extraction_notes.truncated set
+                if the output was cut off), or an error dict carrying the raw
+                output
+        """
+        try:
+            metadata, repairs = parse_model_output(output_text)
         except json.JSONDecodeError as e:
-            # If JSON parsing fails, return the raw output with error info
-            print("error output_text[0] = ", output_text[0])
+            # Not recoverable: return the raw output with error info
+            print("error output_text = ", output_text)
             return {
                 "error": "Failed to parse JSON output",
                 "error_details": str(e),
-                "raw_output": output_text[0]
+                "raw_output": output_text
             }
-
-
-# Global instance
-_vision_service: Optional[VisionService] = None
-
-
-def get_vision_service() -> VisionService:
-    """
-    Get or create the global vision service instance.
-    
-    Returns:
-        VisionService: The global vision service instance
-    """
-    global _vision_service
-    if _vision_service is None:
-        _vision_service = VisionService()
-    return _vision_service
+        if not isinstance(metadata, dict):
+            print("error output_text = ", output_text)
+            return {
+                "error": "Failed to parse JSON output",
+                "error_details": f"Expected a JSON object, got {type(metadata).__name__}",
+                "raw_output": output_text
+            }
+        if repairs:
+            for kind, count in repairs.items():
+                JSON_REPAIRS.labels(kind=kind).inc(count)
+            self._add_warning(metadata, describe_repairs(repairs))
+            if repairs.get("truncated"):
+                self._mark_truncated(metadata)
+        return metadata
+    
+    def _prepare_inputs(
+        self,
+        images: List[ImageInput],
+        system_prompt: Optional[str] = None,
+        user_text: str = IELTS_TASK1_USER_PROMPT,
+    ):
+        """
+        Template, load and tensorize a batch of images for generation.
+        
+        Args:
+            images: Image URLs, image bytes or decoded PIL images
+            system_prompt: System prompt (defaults to the extraction prompt
+                for the configured mode)
+            user_text: Instruction following each image
+            
+        Returns:
+            BatchFeature: Left-padded model inputs on the model device
+        """
+        # Prepare messages for the model
+        conversations = [
+            self._build_messages(image_data, system_prompt, user_text) for image_data in images
+        ]
+        
+        # Prepare for inference
+        with observe_stage("chat_template"):
+            texts = [
+                self.processor.apply_chat_template(
+                    messages, tokenize=False, add_generation_prompt=True
+                )
+                for messages in conversations
+            ]
+        with observe_stage("vision_info"):
+            image_inputs, video_inputs = process_vision_info(conversations)
+        with observe_stage("tensorize"):
+            inputs = self.processor(
+                text=texts,
+                images=image_inputs,
+                videos=video_inputs,
+                padding=True,
+                return_tensors="pt",
+            )
+        with observe_stage("to_device"):
+            return inputs.to(self.model.device)
+    
+    def _retemplate_inputs(self, inputs, rows: List[int], system_prompt: str, user_text: str) -> BatchFeature:
+        """
+        Re-prompt some rows of an already tensorized batch, keeping their images.
+        
+        Only the text is templated and tokenized again; the image pad tokens
+        are expanded from image_grid_thw the way the processor does it, and
+        the rows' patches are carried over, so images are neither reloaded
+        nor resized.
+        
+        Args:
+            inputs: Tensorized batch with one image per row
+            rows: Rows to keep, in order
+            system_prompt: New system prompt
+            user_text: New instruction following each image
+            
+        Returns:
+            BatchFeature: Left-padded model inputs for the rows on the model device
+        """
+        image_grid_thw = inputs["image_grid_thw"]
+        merge_size = getattr(self.processor.image_processor, "merge_size", 2)
+        patches = image_grid_thw.prod(dim=1)
+        image_tokens = (patches // (merge_size * merge_size)).tolist()
+        patch_starts = [0] + torch.cumsum(patches, dim=0).tolist()
+        image_token = self.processor.image_token
+        
+        with observe_stage("chat_template"):
+            # The template only emits a placeholder for the image
+            text = self.processor.apply_chat_template(
+                self._build_messages(None, system_prompt, user_text),
+                tokenize=False,
+                add_generation_prompt=True,
+            )
+            texts = [text.replace(image_token, image_token * image_tokens[row], 1) for row in rows]
+        with observe_stage("tensorize"):
+            tokenized = self.processor.tokenizer(texts, padding=True, return_tensors="pt")
+            rows_index = torch.tensor(rows, device=image_grid_thw.device)
+            group_inputs = BatchFeature({
+                "input_ids": tokenized["input_ids"],
+                "attention_mask": tokenized["attention_mask"],
+                "pixel_values": torch.cat(
+                    [inputs["pixel_values"][patch_starts[row]:patch_starts[row + 1]] for row in rows]
+                ),
+                "image_grid_thw": image_grid_thw.index_select(0, rows_index),
+            })
+        with observe_stage("to_device"):
+            return group_inputs.to(self.model.device)
+    
+    @staticmethod
+    def _select_image_embeds(
+        image_embeds: Optional[torch.Tensor], image_grid_thw: torch.Tensor, merge_size: int, rows: List[int]
+    ) -> Optional[torch.Tensor]:
+        """The embeddings of some rows' images, out of the whole batch's."""
+        if image_embeds is None:
+            return None
+        counts = (image_grid_thw.prod(dim=1) // (merge_size * merge_size)).tolist()
+        starts = [0]
+        for count in counts:
+            starts.append(starts[-1] + count)
+        return torch.cat([image_embeds[starts[row]:starts[row + 1]] for row in rows])
+    
+    def _classify(
+        self, images: List[ImageInput]
+    ) -> Tuple[BatchFeature, Optional[torch.Tensor], List[Optional[Classification]]]:
+        """
+        Run the two-stage classification pass over a batch.
+        
+        The images are encoded once here and the embeddings returned for the
+        extraction pass. Without the prefix cache, generate encodes them
+        itself and they are encoded again for extraction.
+        
+        Args:
+            images: Image URLs, image bytes or decoded PIL images
+            
+        Returns:
+            tuple: (classification inputs, image embeddings or None, one
+                classification per image; None where the output was unusable)
+        """
+        inputs = self._prepare_inputs(
+            images, IELTS_TASK1_CLASSIFICATION_PROMPT, IELTS_TASK1_CLASSIFICATION_USER_PROMPT
+        )
+        prompt_length = inputs.input_ids.shape[1]
+        stopping = StructuralStoppingCriteria(
+            self.processor.tokenizer,
+            prompt_length=prompt_length,
+            batch_size=len(images),
+            budgets={},
+            default_budget=_CLASSIFY_MAX_TOKENS,
+        )
+        with observe_stage("classify"), torch.no_grad():
+            image_embeds = None
+            if self.use_prefix_cache:
+                image_embeds = encode_images(self.model, inputs["pixel_values"], inputs["image_grid_thw"])
+            generated_ids = self._generate(
+                inputs,
+                system_prompt=IELTS_TASK1_CLASSIFICATION_PROMPT,
+                image_embeds=image_embeds,
+                max_new_tokens=_CLASSIFY_MAX_TOKENS,
+                stopping_criteria=[stopping],
+            )
+            output_text = self.processor.batch_decode(
+                [out_ids[prompt_length:] for out_ids in generated_ids],
+                skip_special_tokens=True,
+                clean_up_tokenization_spaces=False,
+            )
+        
+        classifications = []
+        for output in output_text:
+            try:
+                classification = parse_classification(parse_model_output(output)[0])
+            except json.JSONDecodeError:
+                classification = None
+            if classification is None:
+                print("Warning: unusable classification output, using the full prompt: ", output)
+            CLASSIFICATIONS.labels(category=classification[0] if classification else "unclassified").inc()
+            classifications.append(classification)
+        return inputs, image_embeds, classifications
+    
+    def _extraction_groups(
+        self, classifications: List[Optional[Classification]]
+    ) -> Dict[Tuple[str, str], List[int]]:
+        """Rows grouped by the (system prompt, user text) their extraction pass uses, in first-seen order."""
+        groups: Dict[Tuple[str, str], List[int]] = {}
+        for row, classification in enumerate(classifications):
+            if classification is None:
+                prompts = (self.system_prompt, IELTS_TASK1_USER_PROMPT)
+            else:
+                prompts = get_classified_prompts(classification, self.data_only, self.compact)
+            groups.setdefault(prompts, []).append(row)
+        return groups
+    
+    def warm_up(self, images: List[ImageInput], max_new_tokens: int):
+        """
+        Run a short generation through the same path as real requests.
+        
+        Args:
+            images: Preprocessed images, one per batch row
+            max_new_tokens: Tokens to generate
+        """
+        system_prompt, image_embeds = None, None
+        if self.two_stage:
+            classify_inputs, classify_embeds, classifications = self._classify(images)
+            (system_prompt, user_text), rows = next(iter(self._extraction_groups(classifications).items()))
+            inputs = self._retemplate_inputs(classify_inputs, rows, system_prompt, user_text)
+            image_embeds = self._select_image_embeds(
+                classify_embeds, classify_inputs["image_grid_thw"],
+                getattr(self.processor.image_processor, "merge_size", 2), rows,
+            )
+            images = [images[row] for row in rows]
+        else:
+            inputs = self._prepare_inputs(images)
+        generate_kwargs = {}
+        if self.grammar_tables is not None:
+            generate_kwargs["logits_processor"] = [
+                JSONGrammarLogitsProcessor(self.grammar_tables, inputs.input_ids.shape[1], len(images))
+            ]
+        if self.draft_model is not None and len(images) == 1:
+            generate_kwargs["assistant_model"] = self.draft_model
+        with torch.no_grad():
+            self._generate(
+                inputs, system_prompt=system_prompt, image_embeds=image_embeds,
+                max_new_tokens=max_new_tokens, **generate_kwargs
+            )
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+    
+    def extract_metadata_batch(
+        self,
+        images: List[ImageInput],
+        on_text: Optional[Callable[[str], None]] = None,
+    ) -> List[dict]:
+        """
+        Extract structured metadata from several IELTS Task 1 images with a
+        single padded generate call.
+        
+        Args:
+            images: Image URLs, image bytes or decoded PIL images
+            on_text: Called with each newly decoded chunk of output text;
+                only supported for a single image
+            
+        Returns:
+            list: Structured metadata for each image, in input order
+        """
+        print(f"Extracting metadata from {len(images)} image(s)...")
+        if not self.is_loaded:
+            raise RuntimeError("Model not initialized")
+        if on_text is not None and len(images) != 1:
+            raise ValueError("Streaming output is only supported for a single image")
+        
+        if not self.two_stage:
+            results = self._extract(self._prepare_inputs(images), on_text)
+        else:
+            # Classify, then extract each group of same-typed images with the
+            # schema sections for its types, reusing the encoded images
+            classify_inputs, image_embeds, classifications = self._classify(images)
+            merge_size = getattr(self.processor.image_processor, "merge_size", 2)
+            results: List[Optional[dict]] = [None] * len(images)
+            for (system_prompt, user_text), rows in self._extraction_groups(classifications).items():
+                group_inputs = self._retemplate_inputs(classify_inputs, rows, system_prompt, user_text)
+                group_embeds = self._select_image_embeds(
+                    image_embeds, classify_inputs["image_grid_thw"], merge_size, rows
+                )
+                group_results = self._extract(group_inputs, on_text, system_prompt, group_embeds)
+                for row, metadata in zip(rows, group_results):
+                    results[row] = metadata
+        
+        if self.compact:
+            self._post_process(
+                results, "expand_compact", expand_compact,
+                "Could not expand the compact output ({error}); parts may still be in compact form",
+            )
+        if self.data_only:
+            self._post_process(
+                results, "derive_fields", fill_derived_fields,
+                "Could not compute the derived fields ({error}); extremes and trends may be missing",
+            )
+        return results
+    
+    @classmethod
+    def _post_process(cls, results: List[dict], stage: str, process: Callable[[dict], Any], warning: str):
+        """
+        Apply a post-processing step to every parsed result.
+        
+        A failure on one result (malformed or cut-off output the step does
+        not handle) becomes a warning on that result instead of failing the
+        whole batch, which the scheduler would otherwise retry image by image.
+        
+        Args:
+            results: Metadata dicts (error dicts are skipped)
+            stage: Stage name for timing and logs
+            process: Step modifying a metadata dict in place
+            warning: Warning text, with {error} for the exception
+        """
+        with observe_stage(stage):
+            for metadata in results:
+                if "error" in metadata:
+                    continue
+                try:
+                    process(metadata)
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                    print(f"Warning: {stage} failed: {error}")
+                    cls._add_warning(metadata, warning.format(error=error))
+    
+    def _extract(
+        self,
+        inputs,
+        on_text: Optional[Callable[[str], None]] = None,
+        system_prompt: Optional[str] = None,
+        image_embeds: Optional[torch.Tensor] = None,
+    ) -> List[dict]:
+        """
+        Generate and parse the metadata for one tensorized batch.
+        
+        Args:
+            inputs: Model inputs on the model device
+            on_text: Called with each newly decoded chunk of output text
+            system_prompt: System prompt the inputs start with (defaults to
+                the extraction prompt for the configured mode)
+            image_embeds: Already encoded images of the batch, if any
+            
+        Returns:
+            list: Parsed metadata for each row, in batch order
+        """
+        batch_size = inputs.input_ids.shape[0]
+        prompt_length = inputs.input_ids.shape[1]
+        self._record_prompt_tokens(inputs)
+        stopping = StructuralStoppingCriteria(
+            self.processor.tokenizer,
+            prompt_length=prompt_length,
+            batch_size=batch_size,
+            budgets=TOKEN_BUDGETS,
+            default_budget=MAX_NEW_TOKENS,
+        )
+        prefill_timer = _PrefillTimer()
+        generate_kwargs = {"stopping_criteria": [stopping], "logits_processor": [prefill_timer]}
+        # Assisted generation handles one sequence at a time; larger batches decode normally
+        speculative = self.draft_model is not None and batch_size == 1
+        if speculative:
+            # Logits processors also run on the draft model, so prefill is
+            # timed from the main model's first forward pass instead
+            generate_kwargs = {"stopping_criteria": [stopping], "assistant_model": self.draft_model}
+        if self.grammar_tables is not None:
+            generate_kwargs["logits_processor"].append(
+                JSONGrammarLogitsProcessor(self.grammar_tables, prompt_length, batch_size)
+            )
+        if on_text is not None:
+            generate_kwargs["streamer"] = _CallbackStreamer(self.processor.tokenizer, on_text)
+        
+        # Generate until each JSON object closes or its budget runs out
+        with torch.no_grad(), ForwardCounter(self.model if speculative else None) as main_passes, \
+                ForwardCounter(self.draft_model if speculative else None) as draft_passes:
+            started = time.perf_counter()
+            generated_ids = self._generate(
+                inputs, system_prompt=system_prompt, image_embeds=image_embeds,
+                max_new_tokens=MAX_NEW_TOKENS, **generate_kwargs
+            )
+            if generated_ids.is_cuda:
+                torch.cuda.synchronize(generated_ids.device)
+            finished = time.perf_counter()
+            generated_ids_trimmed = [out_ids[prompt_length:] for out_ids in generated_ids]
+            with observe_stage("batch_decode"):
+                output_text = self.processor.batch_decode(
+                    generated_ids_trimmed, 
+                    skip_special_tokens=True, 
+                    clean_up_tokenization_spaces=False
+                )
+        
+        pad_token_id = self.processor.tokenizer.pad_token_id
+        generated_tokens = [int((ids != pad_token_id).sum()) for ids in generated_ids_trimmed]
+        prefill_done_at = prefill_timer.prefill_done_at or finished
+        if speculative:
+            prefill_done_at = main_passes.first_done_at or finished
+            self.speculative_stats.record(main_passes.calls, draft_passes.calls, generated_tokens[0])
+        record_generation(prefill_done_at - started, finished - prefill_done_at, generated_tokens)
+        self._record_gpu_memory()
+        
+        # Parse JSON output, recording any truncation
+        results = []
+        with observe_stage("json_parse"):
+            for row, output in enumerate(output_text):
+                metadata = self._parse_output(output)
+                if "error" in metadata:
+                    PARSE_FAILURES.inc()
+                warning = stopping.truncation_warning(row, generated_tokens[row])
+                if warning is not None:
+                    self._add_warning(metadata, warning)
+                    self._mark_truncated(metadata)
+                results.append(metadata)
+        return results
+    
+    def _record_prompt_tokens(self, inputs):
+        """Export prompt and vision token counts for each image of a batch."""
+        merge_size = getattr(self.processor.image_processor, "merge_size", 2)
+        for count in inputs["attention_mask"].sum(dim=1).tolist():
+            PROMPT_TOKENS.observe(count)
+        image_grid_thw = inputs.get("image_grid_thw")
+        if image_grid_thw is not None:
+            for count in (image_grid_thw.prod(dim=1) // (merge_size * merge_size)).tolist():
+                VISION_TOKENS.observe(count)
+    
+    @staticmethod
+    def _record_gpu_memory():
+        """Export the allocator's high-water marks for every visible GPU."""
+        if not torch.cuda.is_available():
+            return
+        for device in range(torch.cuda.device_count()):
+            GPU_MEMORY_PEAK_BYTES.labels(device=str(device)).set(torch.cuda.max_memory_allocated(device))
+            GPU_MEMORY_RESERVED_PEAK_BYTES.labels(device=str(device)).set(torch.cuda.max_memory_reserved(device))
+    
+    @staticmethod
+    def _add_warning(metadata: dict, warning: str):
+        """Append a warning to extraction_notes.warnings (or to an error dict)."""
+        if "error" in metadata:
+            metadata.setdefault("warnings", []).append(warning)
+            return
+        notes = metadata.get("extraction_notes")
+        if not isinstance(notes, dict):
+            notes = metadata["extraction_notes"] = {}
+        warnings = notes.get("warnings")
+        if not isinstance(warnings, list):
+            warnings = notes["warnings"] = []
+        warnings.append(warning)
+    
+    @staticmethod
+    def _mark_truncated(metadata: dict):
+        """Set extraction_notes.truncated so the result is not cached or indexed."""
+        notes = metadata.get("extraction_notes")
+        if "error" in metadata or not isinstance(notes, dict):
+            return
+        notes["truncated"] = True
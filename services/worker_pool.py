@@ -0,0 +1,513 @@
+"""
+Pool of model worker processes, one model copy per device.
+
+Each worker is a spawned process pinned to one device (through
+CUDA_VISIBLE_DEVICES, or CPU with its share of the cores) that loads the
+configured backend and serves batches sent over a pipe. The pool is itself
+an InferenceBackend: the batch scheduler runs one batch per worker at a
+time and every batch goes to the worker with the fewest images in flight.
+
+Decoded images cross the process boundary through shared memory; only a
+small descriptor (segment name, mode, size) is pickled. Streamed text is
+relayed back over the same pipe, and so are the speculative and
+constrained decoding stats of each worker after every request; the pool
+reports their totals. A worker that dies fails its in-flight batches and
+is restarted.
+
+In pool mode, model-stage metrics are recorded in the worker processes;
+set PROMETHEUS_MULTIPROC_DIR so /metrics aggregates them.
+"""
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from services.inference_backend import InferenceBackend
+from utils.config import WORKER_DEVICES
+
+# Seconds a worker gets to exit after being asked to
+_STOP_TIMEOUT_SECONDS = 10.0
+
+# (segment name, mode, width, height) of an image in shared memory
+_ImageDescriptor = Tuple[str, str, int, int]
+
+
+def _default_devices(backend_name: str) -> List[str]:
+    """One entry per visible GPU, or "cpu" without GPUs (or for the fake backend)."""
+    if backend_name == "fake":
+        return ["cpu"]
+    import torch
+    count = torch.cuda.device_count()
+    return [f"cuda:{index}" for index in range(count)] or ["cpu"]
+
+
+def _to_shared(image: Image.Image) -> Tuple[shared_memory.SharedMemory, _ImageDescriptor]:
+    """Copy an image's pixels into a new shared memory segment."""
+    data = image.tobytes()
+    segment = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    segment.buf[:len(data)] = data
+    return segment, (segment.name, image.mode, image.width, image.height)
+
+
+def _from_shared(descriptor: _ImageDescriptor) -> Image.Image:
+    """Rebuild an image from a shared memory segment (the creator unlinks it)."""
+    name, mode, width, height = descriptor
+    segment = shared_memory.SharedMemory(name=name)
+    try:
+        # Decoding copies the pixels, so the segment can be closed right after
+        return Image.frombytes(mode, (width, height), segment.buf)
+    finally:
+        segment.close()
+
+
+def _worker_main(conn, backend_name: str, device: str, threads: Optional[int]):
+    """
+    Entry point of a worker process: pin the device, load the backend, serve requests.
+
+    Messages in: (kind, request_id, payload) with kind "extract" or
+    "warm_up", or None to stop. Messages out: ("ready", None, info),
+    ("text", request_id, chunk), ("result", request_id, value),
+    ("error", request_id, message) or, after each reply,
+    ("stats", None, decoding stats).
+    """
+    # Must happen before torch is imported in this process
+    if device.startswith("cuda"):
+        os.environ["CUDA_VISIBLE_DEVICES"] = device.partition(":")[2] or "0"
+    else:
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""
+        if threads:
+            os.environ["OMP_NUM_THREADS"] = str(threads)
+
+    from services.inference_backend import create_backend
+
+    try:
+        backend = create_backend(backend_name, pool_size=0)
+    except Exception as e:
+        conn.send(("error", None, f"{type(e).__name__}: {e}"))
+        return
+    conn.send(("ready", None, {
+        "pid": os.getpid(),
+        "model_name": backend.model_name,
+        "decoding_stats": _decoding_stats(backend),
+    }))
+
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            backend.close()
+            return
+        kind, request_id, payload = message
+        try:
+            images = [
+                _from_shared(image) if isinstance(image, tuple) else image
+                for image in payload["images"]
+            ]
+            if kind == "warm_up":
+                backend.warm_up(images, payload["max_new_tokens"])
+                result = None
+            else:
+                on_text = None
+                if payload["stream"]:
+                    on_text = lambda text: send(("text", request_id, text))
+                result = backend.extract_metadata_batch(images, on_text=on_text)
+            send(("result", request_id, result))
+        except Exception as e:
+            send(("error", request_id, f"{type(e).__name__}: {e}"))
+        send(("stats", None, _decoding_stats(backend)))
+
+
+def _decoding_stats(backend: InferenceBackend) -> Dict[str, Optional[dict]]:
+    """Speculative and constrained decoding stats of a worker's backend (None for what is off)."""
+    return {
+        "speculative": (
+            backend.speculative_stats.get_stats() if backend.speculative_stats is not None else None
+        ),
+        "constrained_decoding": (
+            backend.grammar_tables.get_stats() if backend.grammar_tables is not None else None
+        ),
+    }
+
+
+def _combine_speculative(reports: List[dict]) -> dict:
+    """Speculative decoding totals over workers' SpeculativeStats reports."""
+    totals = {
+        key: sum(report.get(key, 0) for report in reports)
+        for key in ("generations", "rounds", "draft_tokens", "accepted_tokens", "generated_tokens")
+    }
+    return {
+        "draft_model": reports[0].get("draft_model"),
+        **totals,
+        "acceptance_rate": (
+            round(totals["accepted_tokens"] / totals["draft_tokens"], 3) if totals["draft_tokens"] else None
+        ),
+        "tokens_per_round": (
+            round(totals["generated_tokens"] / totals["rounds"], 2) if totals["rounds"] else None
+        ),
+    }
+
+
+def _combine_constrained(reports: List[dict]) -> dict:
+    """Mask cache totals over workers' GrammarTokenTables reports (each worker has its own cache)."""
+    totals = {
+        key: sum(report.get(key, 0) for report in reports)
+        for key in ("cached_masks", "cached_mask_bytes", "mask_hits", "mask_misses")
+    }
+    lookups = totals["mask_hits"] + totals["mask_misses"]
+    return {
+        **totals,
+        "max_cached_masks": reports[0].get("max_cached_masks"),
+        "hit_rate": round(totals["mask_hits"] / lookups, 3) if lookups else 0.0,
+    }
+
+
+class _PooledStats:
+    """Stats combined from the workers' latest reports, in the shape app code expects (get_stats())."""
+
+    def __init__(self, stats: dict):
+        self._stats = stats
+
+    def get_stats(self) -> dict:
+        return self._stats
+
+
+class _Worker:
+    """Parent-side handle of one worker process."""
+
+    def __init__(self, index: int, backend_name: str, device: str, threads: Optional[int]):
+        self.index = index
+        self.backend_name = backend_name
+        self.device = device
+        self.threads = threads
+        self.process = None
+        self.pid: Optional[int] = None
+        self.model_name = ""
+        self.ready = threading.Event()
+        self.error: Optional[str] = None
+        self.restarts = 0
+        self.batches = 0
+        self.in_flight = 0
+        # Latest speculative / constrained decoding stats the process sent
+        self.decoding_stats: Dict[str, Optional[dict]] = {}
+        self._conn = None
+        self._send_lock = threading.Lock()
+        self._lock = threading.Lock()
+        # request_id -> (future, on_text, image count)
+        self._pending: Dict[int, Tuple[Future, Optional[Callable[[str], None]], int]] = {}
+        self._request_ids = itertools.count()
+        self._stopping = False
+
+    def start(self):
+        """Spawn the process and the thread that reads its replies."""
+        context = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = context.Pipe()
+        self.ready.clear()
+        self.error = None
+        self._conn = parent_conn
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, self.backend_name, self.device, self.threads),
+            name=f"model-worker-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        threading.Thread(
+            target=self._receive, args=(parent_conn,), name=f"model-worker-{self.index}-reader", daemon=True
+        ).start()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def submit(
+        self,
+        kind: str,
+        payload: dict,
+        on_text: Optional[Callable[[str], None]] = None,
+    ) -> Future:
+        """Send a request; the future resolves with the worker's reply."""
+        future: Future = Future()
+        images = len(payload["images"])
+        with self._lock:
+            request_id = next(self._request_ids)
+            self._pending[request_id] = (future, on_text, images)
+            self.in_flight += images
+        try:
+            with self._send_lock:
+                self._conn.send((kind, request_id, payload))
+        except (OSError, ValueError) as e:
+            self._resolve(request_id, error=f"worker {self.index} is unavailable: {e}")
+        return future
+
+    def _resolve(self, request_id: int, result: Any = None, error: Optional[str] = None):
+        with self._lock:
+            entry = self._pending.pop(request_id, None)
+            if entry is None:
+                return
+            future, _, images = entry
+            self.in_flight -= images
+            if error is None:
+                self.batches += 1
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(RuntimeError(error))
+
+    def _receive(self, conn):
+        """Dispatch replies until the process exits, then fail what it had in flight."""
+        while True:
+            try:
+                kind, request_id, value = conn.recv()
+            except (EOFError, OSError):
+                break
+            if kind == "ready":
+                self.pid = value["pid"]
+                self.model_name = value["model_name"]
+                self.decoding_stats = value["decoding_stats"]
+                self.ready.set()
+            elif kind == "stats":
+                self.decoding_stats = value
+            elif kind == "text":
+                with self._lock:
+                    entry = self._pending.get(request_id)
+                if entry is not None and entry[1] is not None:
+                    entry[1](value)
+            elif kind == "result":
+                self._resolve(request_id, result=value)
+            elif request_id is None:
+                # Loading failed; the process exits next
+                self.error = value
+            else:
+                self._resolve(request_id, error=value)
+
+        self.ready.clear()
+        with self._lock:
+            pending = list(self._pending)
+        for request_id in pending:
+            self._resolve(request_id, error=f"model worker {self.index} exited")
+        if self.pid is not None:
+            _mark_metrics_process_dead(self.pid)
+        if not self._stopping and self.error is None:
+            print(f"Warning: model worker {self.index} ({self.device}) exited; restarting")
+            self.restarts += 1
+            self.start()
+
+    def stop(self):
+        """Ask the process to exit, terminating it if it does not."""
+        self._stopping = True
+        try:
+            with self._send_lock:
+                self._conn.send(None)
+        except (OSError, ValueError):
+            pass
+        if self.process is not None:
+            self.process.join(_STOP_TIMEOUT_SECONDS)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+
+
+def _mark_metrics_process_dead(pid: int):
+    """Drop a dead worker's live gauges from multiprocess metrics."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
+
+
+class WorkerPool(InferenceBackend):
+    """Runs the configured backend in several processes and dispatches batches to the least-loaded one."""
+
+    backend_name = "pool"
+
+    def __init__(
+        self,
+        backend_name: str,
+        size: int,
+        devices: Optional[List[str]] = None,
+        on_phase: Optional[Callable[[str], None]] = None,
+    ):
+        """
+        Start the worker processes and wait until every one has loaded its model.
+
+        Args:
+            backend_name: Backend each worker runs ("qwen" or "fake")
+            size: Number of worker processes
+            devices: Devices assigned round-robin (defaults to WORKER_DEVICES,
+                else one per visible GPU, else "cpu")
+            on_phase: Called with "loading_model" while the workers load
+
+        Raises:
+            RuntimeError: If a worker fails to load its backend
+        """
+        devices = devices or WORKER_DEVICES or _default_devices(backend_name)
+        cpu_workers = sum(1 for index in range(size) if devices[index % len(devices)] == "cpu")
+        threads = max(1, (os.cpu_count() or 1) // cpu_workers) if cpu_workers else None
+
+        self.inner_backend_name = backend_name
+        self.concurrency = max(1, size)
+        self._workers = [
+            _Worker(index, backend_name, devices[index % len(devices)], threads)
+            for index in range(self.concurrency)
+        ]
+        self._dispatch_lock = threading.Lock()
+
+        if on_phase is not None:
+            on_phase("loading_model")
+        for worker in self._workers:
+            print(f"Starting model worker {worker.index} on {worker.device}")
+            worker.start()
+        for worker in self._workers:
+            while not worker.ready.wait(1.0):
+                if worker.error is not None or not worker.alive:
+                    self.close()
+                    raise RuntimeError(
+                        f"Model worker {worker.index} ({worker.device}) failed to start: "
+                        f"{worker.error or 'process exited'}"
+                    )
+        self.model_name = self._workers[0].model_name
+        print(f"Worker pool ready: {len(self._workers)} x {backend_name}")
+
+    @property
+    def is_loaded(self) -> bool:
+        """Whether at least one worker can take requests."""
+        return any(worker.ready.is_set() for worker in self._workers)
+
+    @property
+    def speculative_stats(self) -> Optional[_PooledStats]:
+        """Speculative decoding totals over the workers (None when it is off)."""
+        return self._pooled("speculative", _combine_speculative)
+
+    @property
+    def grammar_tables(self) -> Optional[_PooledStats]:
+        """Constrained-decoding mask cache totals over the workers (None when it is off)."""
+        return self._pooled("constrained_decoding", _combine_constrained)
+
+    def _pooled(self, section: str, combine: Callable[[List[dict]], dict]) -> Optional[_PooledStats]:
+        """Combine one decoding stats section over the workers that reported it."""
+        reports = [
+            worker.decoding_stats[section] for worker in self._workers if worker.decoding_stats.get(section)
+        ]
+        if not reports:
+            return None
+        return _PooledStats({**combine(reports), "workers_reporting": len(reports)})
+
+    def _pick_worker(self) -> _Worker:
+        """The ready worker with the fewest images in flight."""
+        with self._dispatch_lock:
+            ready = [worker for worker in self._workers if worker.ready.is_set()]
+            if not ready:
+                raise RuntimeError("No model worker is available")
+            return min(ready, key=lambda worker: (worker.in_flight, worker.index))
+
+    def _run(
+        self,
+        worker: _Worker,
+        kind: str,
+        images: List[Any],
+        payload: dict,
+        on_text: Optional[Callable[[str], None]] = None,
+    ) -> Future:
+        """Send images (PIL ones through shared memory) to a worker."""
+        segments = []
+        descriptors = []
+        try:
+            for image in images:
+                if isinstance(image, Image.Image):
+                    segment, descriptor = _to_shared(image)
+                    segments.append(segment)
+                    descriptors.append(descriptor)
+                else:
+                    descriptors.append(image)
+            future = worker.submit(kind, {**payload, "images": descriptors}, on_text)
+        except Exception:
+            _release(segments)
+            raise
+        future.add_done_callback(lambda _: _release(segments))
+        return future
+
+    def extract_metadata_batch(
+        self,
+        images: List[Any],
+        on_text: Optional[Callable[[str], None]] = None,
+    ) -> List[dict]:
+        """
+        Run a batch on the least-loaded worker.
+
+        Args:
+            images: Image URLs, image bytes or decoded PIL images
+            on_text: Called with each newly decoded chunk of output text;
+                only supported for a single image
+
+        Returns:
+            list: Structured metadata for each image, in input order
+        """
+        if on_text is not None and len(images) != 1:
+            raise ValueError("Streaming output is only supported for a single image")
+        worker = self._pick_worker()
+        future = self._run(worker, "extract", images, {"stream": on_text is not None}, on_text)
+        return future.result()
+
+    def warm_up(self, images: List[Any], max_new_tokens: int):
+        """
+        Warm up every worker at once.
+
+        Args:
+            images: Preprocessed images, one per batch row
+            max_new_tokens: Tokens to generate
+        """
+        futures = [
+            self._run(worker, "warm_up", images, {"max_new_tokens": max_new_tokens})
+            for worker in self._workers
+        ]
+        for future in futures:
+            future.result()
+
+    def close(self):
+        """Stop every worker process."""
+        for worker in self._workers:
+            worker.stop()
+
+    def get_stats(self) -> List[dict]:
+        """
+        Report per-worker state and load.
+
+        Returns:
+            list: One entry per worker
+        """
+        return [
+            {
+                "index": worker.index,
+                "device": worker.device,
+                "pid": worker.pid,
+                "ready": worker.ready.is_set(),
+                "in_flight": worker.in_flight,
+                "batches": worker.batches,
+                "restarts": worker.restarts,
+                **{section: stats for section, stats in worker.decoding_stats.items() if stats is not None},
+            }
+            for worker in self._workers
+        ]
+
+
+def _release(segments: List[shared_memory.SharedMemory]):
+    """Close and unlink shared memory segments."""
+    for segment in segments:
+        segment.close()
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,564 @@
+"""
+Compact columnar output format and its expansion into task1_v1.
+
+In task1_v1 every bar, line point, table cell and pie slice is an object
+that repeats its key names, so on a chart with many series most decode
+tokens are spent on `"category_id"`, `"approximate"`, `"value_range"` and
+`"raw_value_label"`. With COMPACT_OUTPUT the model writes those parts as
+arrays in axis order instead (see the compact sections in
+utils/prompts.py):
+
+    bar_chart   categories as labels, one {"label", "values", ...} per series
+    line_graph  ticks as labels, one {"label", "values", ...} per series
+    table       row and column headers as labels, "values" as a row-major matrix
+    pie_chart   "slices" as {"labels", "percentages", ...} columns
+
+Ids are implied by position (c1, c2, ... for categories, s1, ... for
+series, t1, ... for ticks, r1, ... for rows, c1, ... for columns, sl1, ...
+for slices) and optional members default to null, false or an empty list.
+expand_compact() rebuilds the documented task1_v1 objects, keys in schema
+order, so API consumers never see the compact form. Anything already in
+task1_v1 form passes through unchanged, so a model that falls back to the
+verbose form for one series or visual is still handled.
+"""
+import copy
+import re
+from typing import Any, List, Optional
+
+SCHEMA_VERSION = "task1_v1"
+COMPACT_SCHEMA_VERSION = "task1_compact"
+
+_NUMBER_LABEL = re.compile(r"\s*-?\d+(?:\.\d+)?\s*")
+_LOCAL_OVERVIEW = {"main_message": None, "key_features": []}
+
+
+def expand_compact(metadata: dict) -> dict:
+    """
+    Rewrite a compact document into task1_v1, in place.
+
+    Args:
+        metadata: Parsed model output, compact or already task1_v1
+
+    Returns:
+        dict: The same dict, in task1_v1 form
+    """
+    for key in ("schema_version", "visuals"):
+        if key in metadata:
+            metadata[key] = expand_compact_section(key, metadata[key])
+    return metadata
+
+
+def expand_compact_section(key: str, value: Any) -> Any:
+    """
+    Expand one top-level member of a compact document (for streamed sections).
+
+    Args:
+        key: Top-level key
+        value: Its parsed value
+
+    Returns:
+        The value in task1_v1 form
+    """
+    if key == "schema_version" and value == COMPACT_SCHEMA_VERSION:
+        return SCHEMA_VERSION
+    if key == "visuals" and isinstance(value, list):
+        return [
+            _expand_visual(visual, index) if isinstance(visual, dict) else visual
+            for index, visual in enumerate(value)
+        ]
+    return value
+
+
+def compact_document(metadata: dict) -> dict:
+    """
+    Write a task1_v1 document in the compact form (for benchmarks and the fake backend).
+
+    Each visual is only compacted if expanding it gives back exactly the
+    original; visuals using ids or fields the compact form cannot express
+    are left in task1_v1 form.
+
+    Args:
+        metadata: task1_v1 document (not modified)
+
+    Returns:
+        dict: Compact document
+    """
+    compact = copy.deepcopy(metadata)
+    if compact.get("schema_version") == SCHEMA_VERSION:
+        compact["schema_version"] = COMPACT_SCHEMA_VERSION
+    visuals = compact.get("visuals")
+    if isinstance(visuals, list):
+        for index, visual in enumerate(visuals):
+            if not isinstance(visual, dict) or not isinstance(visual.get("structure"), dict):
+                continue
+            compactor = _COMPACTORS.get(visual.get("visual_type"))
+            if compactor is None:
+                continue
+            candidate = dict(visual, structure=compactor(copy.deepcopy(visual["structure"])))
+            if _expand_visual(copy.deepcopy(candidate), index) == visual:
+                visuals[index] = candidate
+    return compact
+
+
+# --- Expansion ---------------------------------------------------------------
+
+def _expand_visual(visual: dict, index: int) -> dict:
+    """A visual with implied members filled in and its structure expanded."""
+    structure = visual.get("structure")
+    visual_type = visual.get("visual_type")
+    # Only known type names select an expander (the model may write anything here)
+    expander = _EXPANDERS.get(visual_type) if isinstance(visual_type, str) else None
+    if expander is not None and isinstance(structure, dict):
+        structure = expander(structure)
+    expanded = {
+        "visual_id": visual.get("visual_id", f"v{index + 1}"),
+        "visual_type": visual.get("visual_type"),
+        "role": visual.get("role", "primary"),
+        "panel_label": visual.get("panel_label"),
+        "title": visual.get("title"),
+        "caption": visual.get("caption"),
+        "local_overview": visual.get("local_overview", copy.deepcopy(_LOCAL_OVERVIEW)),
+        "structure": structure if structure is not None else {},
+    }
+    for key, value in visual.items():
+        expanded.setdefault(key, value)
+    return expanded
+
+
+def _expand_bar_chart(structure: dict) -> dict:
+    """Categories and series of a compact bar chart as task1_v1 objects."""
+    axis = _member(_member(structure, "axes"), "category_axis")
+    categories = axis.get("categories") if axis is not None else None
+    if isinstance(categories, list):
+        axis["categories"] = [
+            category if _has(category, "category_id") else {
+                "category_id": f"c{i + 1}",
+                "label": _field(category, "label"),
+                "order_index": i,
+                "group_label": _field(category, "group", None),
+            }
+            for i, category in enumerate(categories)
+        ]
+        category_ids = [_field(category, "category_id", None) for category in axis["categories"]]
+    else:
+        category_ids = []
+
+    series = structure.get("series")
+    if isinstance(series, list):
+        structure["series"] = [
+            _expand_series(entry, n, category_ids) if _is_compact_series(entry) else entry
+            for n, entry in enumerate(series)
+        ]
+    return structure
+
+
+def _expand_series(entry: dict, n: int, category_ids: List[Any]) -> dict:
+    """One compact bar series as a task1_v1 series with data_points."""
+    values = entry["values"]
+    options = _ValueOptions(entry, len(values))
+    return {
+        "series_id": f"s{n + 1}",
+        "label": entry.get("label"),
+        "legend_label": entry.get("legend", entry.get("label")),
+        "notes": entry.get("notes"),
+        "data_points": [
+            {
+                "category_id": category_ids[j] if j < len(category_ids) else f"c{j + 1}",
+                "value": value,
+                "approximate": options.approximate[j],
+                "value_range": options.ranges[j],
+                "raw_value_label": options.raw[j],
+            }
+            for j, value in enumerate(values) if value is not None or options.raw[j] is not None
+        ],
+        "series_pattern_summary": entry.get("summary"),
+    }
+
+
+def _expand_line_graph(structure: dict) -> dict:
+    """Ticks and series of a compact line graph as task1_v1 objects."""
+    axis = _member(_member(structure, "axes"), "x_axis")
+    ticks = axis.get("ticks") if axis is not None else None
+    if isinstance(ticks, list):
+        axis["ticks"] = [
+            tick if _has(tick, "tick_id") else _expand_tick(tick, i)
+            for i, tick in enumerate(ticks)
+        ]
+        ticks = axis["ticks"]
+    else:
+        ticks = []
+
+    series = structure.get("line_series")
+    if isinstance(series, list):
+        structure["line_series"] = [
+            _expand_line_series(entry, n, ticks) if _is_compact_series(entry) else entry
+            for n, entry in enumerate(series)
+        ]
+    return structure
+
+
+def _expand_tick(tick: Any, i: int) -> dict:
+    """A tick from a label (or {"label", "value"}), its numeric value read from the label when omitted."""
+    label = _field(tick, "label")
+    if isinstance(label, (int, float)) and not isinstance(label, bool):
+        label, numeric_value = _number_text(label), label
+    else:
+        numeric_value = _number_from_label(label)
+    if isinstance(tick, dict) and "value" in tick:
+        numeric_value = tick["value"]
+    return {"tick_id": f"t{i + 1}", "label": label, "numeric_value": numeric_value, "order_index": i}
+
+
+def _expand_line_series(entry: dict, n: int, ticks: List[Any]) -> dict:
+    """One compact line series as a task1_v1 series with data_points."""
+    values = entry["values"]
+    options = _ValueOptions(entry, len(values))
+    data_points = []
+    for j, value in enumerate(values):
+        if value is None and options.raw[j] is None:
+            continue
+        tick = ticks[j] if j < len(ticks) and isinstance(ticks[j], dict) else {}
+        data_points.append({
+            "x_tick_id": tick.get("tick_id", f"t{j + 1}"),
+            "x_label": tick.get("label"),
+            "x_numeric_value": tick.get("numeric_value"),
+            "y_value": value,
+            "approximate": options.approximate[j],
+            "value_range": options.ranges[j],
+            "raw_value_label": options.raw[j],
+        })
+    return {
+        "series_id": f"s{n + 1}",
+        "label": entry.get("label"),
+        "legend_label": entry.get("legend", entry.get("label")),
+        "data_points": data_points,
+        "series_trend_summary": entry.get("summary"),
+    }
+
+
+def _expand_table(structure: dict) -> dict:
+    """Headers and the value matrix of a compact table as task1_v1 objects."""
+    rows = structure.get("row_headers")
+    if isinstance(rows, list):
+        structure["row_headers"] = [
+            row if _has(row, "row_id") else {
+                "row_id": f"r{i + 1}",
+                "label": _field(row, "label"),
+                "group_label": _field(row, "group", None),
+                "order_index": i,
+            }
+            for i, row in enumerate(rows)
+        ]
+    columns = structure.get("column_headers")
+    if isinstance(columns, list):
+        structure["column_headers"] = [
+            column if _has(column, "column_id") else {
+                "column_id": f"c{i + 1}",
+                "label": _field(column, "label"),
+                "unit": _field(column, "unit", None),
+                "group_label": _field(column, "group", None),
+                "order_index": i,
+            }
+            for i, column in enumerate(columns)
+        ]
+    matrix = structure.get("values")
+    if not isinstance(matrix, list):
+        return structure
+
+    rows, columns = structure.get("row_headers"), structure.get("column_headers")
+    row_ids = [_field(row, "row_id", None) for row in rows] if isinstance(rows, list) else []
+    column_ids = [_field(column, "column_id", None) for column in columns] if isinstance(columns, list) else []
+    cells = []
+    for r, row_values in enumerate(matrix):
+        if not isinstance(row_values, list):
+            continue
+        options = _ValueOptions(structure, len(row_values), row=r)
+        for c, value in enumerate(row_values):
+            if value is None and options.raw[c] is None:
+                continue
+            cells.append({
+                "row_id": row_ids[r] if r < len(row_ids) else f"r{r + 1}",
+                "column_id": column_ids[c] if c < len(column_ids) else f"c{c + 1}",
+                "value": value,
+                "approximate": options.approximate[c],
+                "value_range": options.ranges[c],
+                "raw_value_label": options.raw[c],
+            })
+    # "cells" takes the place of the matrix and its per-value options
+    expanded = {}
+    for key, value in structure.items():
+        if key == "values":
+            expanded["cells"] = cells
+        elif key not in _VALUE_OPTION_KEYS:
+            expanded[key] = value
+    return expanded
+
+
+def _expand_pie_chart(structure: dict) -> dict:
+    """Compact slice columns as task1_v1 slice objects."""
+    slices = structure.get("slices")
+    if not isinstance(slices, dict):
+        return structure
+    labels = slices.get("labels")
+    labels = labels if isinstance(labels, list) else []
+    count = len(labels)
+    options = _ValueOptions(slices, count)
+    percentages = _per_item(slices.get("percentages"), count, None)
+    values = _per_item(slices.get("values"), count, None)
+    categories = _per_item(slices.get("category"), count, None)
+    highlighted = _per_item(slices.get("highlighted"), count, False)
+    notes = _per_item(slices.get("notes"), count, None)
+    structure["slices"] = [
+        {
+            "slice_id": f"sl{i + 1}",
+            "label": label,
+            "category": categories[i],
+            "percentage": percentages[i],
+            "value": values[i],
+            "approximate": options.approximate[i],
+            "value_range": options.ranges[i],
+            "raw_value_label": options.raw[i],
+            "is_highlighted_on_chart": highlighted[i],
+            "notes": notes[i] if isinstance(notes[i], list) else [],
+        }
+        for i, label in enumerate(labels)
+    ]
+    return structure
+
+
+# Per-value options that sit next to a compact "values" array
+_VALUE_OPTION_KEYS = ("approx", "ranges", "raw")
+
+
+class _ValueOptions:
+    """The approximate flags, value ranges and raw labels of a compact value array."""
+
+    __slots__ = ("approximate", "ranges", "raw")
+
+    def __init__(self, entry: dict, count: int, row: Optional[int] = None):
+        """
+        Args:
+            entry: Dict holding "approx", "ranges" and "raw" (each a scalar
+                for all values, or one item per value)
+            count: Number of values
+            row: Row of a table, whose options are matrices (or one scalar
+                per row, or one for the whole table)
+        """
+        approx, ranges, raw = (entry.get(key) for key in _VALUE_OPTION_KEYS)
+        if row is not None:
+            approx, ranges, raw = (_row_of(option, row) for option in (approx, ranges, raw))
+        self.approximate = [bool(flag) for flag in _per_item(approx, count, False)]
+        self.ranges = [_value_range(item) for item in _per_item(ranges, count, None)]
+        self.raw = _per_item(raw, count, None)
+
+
+def _row_of(option: Any, row: int) -> Any:
+    """One table row's entry of a per-cell option matrix."""
+    if isinstance(option, list):
+        return option[row] if row < len(option) else None
+    return option
+
+
+def _per_item(option: Any, count: int, default: Any) -> List[Any]:
+    """A scalar option repeated for every value, or a list padded (or cut) to count."""
+    if isinstance(option, list):
+        return [option[i] if i < len(option) else default for i in range(count)]
+    return [default if option is None else option] * count
+
+
+def _value_range(item: Any) -> Optional[dict]:
+    """{"min", "max"} from a [min, max] pair (dicts pass through)."""
+    if isinstance(item, (list, tuple)) and len(item) == 2:
+        return {"min": item[0], "max": item[1]}
+    return item if isinstance(item, dict) else None
+
+
+def _is_compact_series(entry: Any) -> bool:
+    return isinstance(entry, dict) and isinstance(entry.get("values"), list) and "data_points" not in entry
+
+
+def _has(item: Any, key: str) -> bool:
+    return isinstance(item, dict) and key in item
+
+
+def _field(item: Any, key: str, scalar_default: Any = ...) -> Any:
+    """A member of a dict item; a bare scalar item stands for its label."""
+    if isinstance(item, dict):
+        return item.get(key)
+    return item if scalar_default is ... else scalar_default
+
+
+def _member(parent: Optional[dict], key: str) -> Optional[dict]:
+    value = parent.get(key) if isinstance(parent, dict) else None
+    return value if isinstance(value, dict) else None
+
+
+def _number_from_label(label: Any):
+    """The number a label such as "1967" or "2.5" spells, else None."""
+    if not isinstance(label, str) or not _NUMBER_LABEL.fullmatch(label):
+        return None
+    number = float(label)
+    return int(number) if "." not in label else number
+
+
+def _number_text(number) -> str:
+    return str(int(number)) if float(number).is_integer() else str(number)
+
+
+_EXPANDERS = {
+    "bar_chart": _expand_bar_chart,
+    "line_graph": _expand_line_graph,
+    "table": _expand_table,
+    "pie_chart": _expand_pie_chart,
+}
+
+
+# --- Compaction --------------------------------------------------------------
+
+def _compact_bar_chart(structure: dict) -> dict:
+    axis = _member(_member(structure, "axes"), "category_axis")
+    categories = axis.get("categories") if axis is not None else None
+    category_ids = []
+    if isinstance(categories, list):
+        axis["categories"] = [
+            _compact_header(category, {"label": "label", "group_label": "group"}) for category in categories
+        ]
+        category_ids = [_field(category, "category_id", None) for category in categories]
+    series = structure.get("series")
+    if isinstance(series, list):
+        structure["series"] = [
+            _compact_series(entry, "category_id", "value", category_ids, "series_pattern_summary", ("notes",))
+            for entry in series
+        ]
+    return structure
+
+
+def _compact_line_graph(structure: dict) -> dict:
+    axis = _member(_member(structure, "axes"), "x_axis")
+    ticks = axis.get("ticks") if axis is not None else None
+    tick_ids = []
+    if isinstance(ticks, list):
+        tick_ids = [_field(tick, "tick_id", None) for tick in ticks]
+        axis["ticks"] = [
+            tick.get("label") if isinstance(tick, dict) and isinstance(tick.get("label"), str)
+            and tick.get("numeric_value") == _number_from_label(tick["label"])
+            else {"label": _field(tick, "label"), "value": _field(tick, "numeric_value", None)}
+            for tick in ticks
+        ]
+    series = structure.get("line_series")
+    if isinstance(series, list):
+        structure["line_series"] = [
+            _compact_series(entry, "x_tick_id", "y_value", tick_ids, "series_trend_summary", ())
+            for entry in series
+        ]
+    return structure
+
+
+def _compact_series(entry: Any, id_key: str, value_key: str, axis_ids: List[Any],
+                    summary_key: str, optional_keys: tuple) -> Any:
+    """A series with one value per axis position, in the order of the axis ids."""
+    points = entry.get("data_points") if isinstance(entry, dict) else None
+    if not isinstance(points, list) or not all(isinstance(point, dict) for point in points):
+        return entry
+    by_id = {point.get(id_key): point for point in points}
+    ordered = [by_id.get(axis_id) for axis_id in axis_ids]
+    compact = {"label": entry.get("label")}
+    if entry.get("legend_label") != entry.get("label"):
+        compact["legend"] = entry.get("legend_label")
+    for key in optional_keys:
+        if entry.get(key) is not None:
+            compact[key] = entry[key]
+    compact["values"] = [point.get(value_key) if point else None for point in ordered]
+    compact.update(_compact_options(ordered))
+    if entry.get(summary_key) is not None:
+        compact["summary"] = entry[summary_key]
+    return compact
+
+
+def _compact_table(structure: dict) -> dict:
+    rows = structure.get("row_headers")
+    columns = structure.get("column_headers")
+    cells = structure.get("cells")
+    if not all(isinstance(items, list) for items in (rows, columns, cells)):
+        return structure
+    by_position = {
+        (cell.get("row_id"), cell.get("column_id")): cell for cell in cells if isinstance(cell, dict)
+    }
+    row_ids = [_field(row, "row_id", None) for row in rows]
+    column_ids = [_field(column, "column_id", None) for column in columns]
+    grid = [[by_position.get((row_id, column_id)) for column_id in column_ids] for row_id in row_ids]
+    row_options = [_compact_options(row) for row in grid]
+
+    compact = {}
+    for key, value in structure.items():
+        if key == "row_headers":
+            compact[key] = [_compact_header(row, {"label": "label", "group_label": "group"}) for row in rows]
+        elif key == "column_headers":
+            compact[key] = [
+                _compact_header(column, {"label": "label", "unit": "unit", "group_label": "group"})
+                for column in columns
+            ]
+        elif key == "cells":
+            compact["values"] = [[cell.get("value") if cell else None for cell in row] for row in grid]
+            for option in _VALUE_OPTION_KEYS:
+                per_row = [options.get(option) for options in row_options]
+                if any(item is not None for item in per_row):
+                    compact[option] = per_row if len(set(map(repr, per_row))) > 1 else per_row[0]
+        else:
+            compact[key] = value
+    return compact
+
+
+def _compact_pie_chart(structure: dict) -> dict:
+    slices = structure.get("slices")
+    if not isinstance(slices, list) or not all(isinstance(item, dict) for item in slices):
+        return structure
+    compact = {
+        "labels": [item.get("label") for item in slices],
+        "percentages": [item.get("percentage") for item in slices],
+    }
+    for key, compact_key, default in (("value", "values", None), ("category", "category", None),
+                                      ("is_highlighted_on_chart", "highlighted", False),
+                                      ("notes", "notes", [])):
+        column = [item.get(key) for item in slices]
+        if any(item != default for item in column):
+            compact[compact_key] = column if len(set(map(repr, column))) > 1 else column[0]
+    compact.update(_compact_options(slices))
+    structure["slices"] = compact
+    return structure
+
+
+def _compact_options(points: List[Optional[dict]]) -> dict:
+    """The "approx", "ranges" and "raw" options of a row of points (omitted when all default)."""
+    options = {}
+    approximate = [bool(point.get("approximate")) if point else False for point in points]
+    if any(approximate):
+        options["approx"] = approximate if not all(approximate) else True
+    ranges = [point.get("value_range") if point else None for point in points]
+    if any(item is not None for item in ranges):
+        options["ranges"] = [
+            [item.get("min"), item.get("max")] if isinstance(item, dict) and set(item) == {"min", "max"} else item
+            for item in ranges
+        ]
+    raw = [point.get("raw_value_label") if point else None for point in points]
+    if any(item is not None for item in raw):
+        options["raw"] = raw
+    return options
+
+
+def _compact_header(header: Any, fields: dict) -> Any:
+    """A header as its bare label when nothing else is set, else {label, unit, group}."""
+    if not isinstance(header, dict):
+        return header
+    compact = {short: header.get(key) for key, short in fields.items() if header.get(key) is not None}
+    if set(compact) == {"label"} and isinstance(compact["label"], str):
+        return compact["label"]
+    return compact
+
+
+_COMPACTORS = {
+    "bar_chart": _compact_bar_chart,
+    "line_graph": _compact_line_graph,
+    "table": _compact_table,
+    "pie_chart": _compact_pie_chart,
+}
@@ -0,0 +1,197 @@
+"""
+Runtime configuration for IELTS Metadata API, read from environment variables.
+"""
+import os
+from typing import Dict
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read an integer environment variable, falling back to a default."""
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name: str, default: float) -> float:
+    """Read a float environment variable, falling back to a default."""
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    """Read a boolean environment variable ("1", "true", "yes", "on")."""
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_budgets(name: str, default: Dict[str, int]) -> Dict[str, int]:
+    """Read "key=int,key=int" pairs, overriding entries of a default mapping."""
+    budgets = dict(default)
+    value = os.getenv(name)
+    if value:
+        for item in value.split(","):
+            key, _, number = item.partition("=")
+            if key.strip() and number.strip():
+                budgets[key.strip()] = int(number)
+    return budgets
+
+
+# Model
+MODEL_NAME = os.getenv("MODEL_NAME", "Qwen/Qwen2.5-VL-7B-Instruct")
+
+# Precision profile for the Qwen weights: "gpu-nf4", "gpu-int8",
+# "gpu-bf16", "cpu-int8" or "cpu-bf16"; "auto" picks gpu-nf4 with a GPU and
+# cpu-int8 without. CPU profiles use CPU_THREADS intra-op threads (0: every
+# core available to the process).
+PRECISION_PROFILE = os.getenv("PRECISION_PROFILE", "auto").strip().lower()
+CPU_THREADS = _env_int("CPU_THREADS", 0)
+
+# Inference backend: "qwen" runs MODEL_NAME; "fake" needs no GPU or model
+# and answers with canned task1_v1 outputs (the *.json files in
+# FAKE_OUTPUTS_DIR, or built-in samples) after sleeping FAKE_PREFILL_MS per
+# image plus FAKE_PER_TOKEN_MS per generated token, for load-testing the
+# serving path.
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "qwen").strip().lower()
+FAKE_PREFILL_MS = _env_float("FAKE_PREFILL_MS", 400.0)
+FAKE_PER_TOKEN_MS = _env_float("FAKE_PER_TOKEN_MS", 25.0)
+FAKE_OUTPUTS_DIR = os.getenv("FAKE_OUTPUTS_DIR", "")
+
+# Startup: the model loads on a background thread while the API already
+# answers liveness probes. Before readiness flips, WARMUP_ENABLED runs a
+# synthetic chart through the model at batch size 1 and BATCH_MAX_SIZE,
+# generating WARMUP_MAX_NEW_TOKENS tokens, so kernel selection and
+# allocator growth do not land on the first real request.
+WARMUP_ENABLED = _env_bool("WARMUP_ENABLED", True)
+WARMUP_MAX_NEW_TOKENS = _env_int("WARMUP_MAX_NEW_TOKENS", 32)
+
+# Worker pool: with WORKER_POOL_SIZE > 0 the backend runs in that many
+# model worker processes instead of the API process, each pinned to a device
+# from WORKER_DEVICES (comma-separated "cuda:N" or "cpu", assigned
+# round-robin; by default one per visible GPU, or "cpu" without GPUs).
+WORKER_POOL_SIZE = _env_int("WORKER_POOL_SIZE", 0)
+WORKER_DEVICES = [
+    device.strip() for device in os.getenv("WORKER_DEVICES", "").split(",") if device.strip()
+]
+
+# Micro-batching: requests arriving within BATCH_MAX_WAIT_MS of the first
+# queued request are grouped into a single generate call of at most
+# BATCH_MAX_SIZE images.
+BATCH_MAX_SIZE = _env_int("BATCH_MAX_SIZE", 4)
+BATCH_MAX_WAIT_MS = _env_float("BATCH_MAX_WAIT_MS", 50.0)
+
+# Backpressure: at most QUEUE_MAX_SIZE images may wait for the GPU; beyond
+# that, requests are rejected with 503 and a Retry-After header.
+QUEUE_MAX_SIZE = _env_int("QUEUE_MAX_SIZE", 64)
+
+# Priorities: interactive requests (single-image endpoints by default) are
+# batched before bulk ones (batch endpoints and jobs). While both classes are
+# waiting, SCHEDULER_BULK_SHARE of the images taken are bulk ones, so bulk
+# keeps moving under sustained interactive load, and bulk work may not take
+# the last QUEUE_INTERACTIVE_RESERVE slots of the queue.
+SCHEDULER_BULK_SHARE = _env_float("SCHEDULER_BULK_SHARE", 0.25)
+QUEUE_INTERACTIVE_RESERVE = _env_int("QUEUE_INTERACTIVE_RESERVE", max(1, QUEUE_MAX_SIZE // 4))
+
+# Result cache: an in-memory LRU of CACHE_MEMORY_MAX_ENTRIES results in
+# front of a persistent tier in CACHE_DIR (set to "" to disable it) that is
+# capped at CACHE_DISK_MAX_MB and drops entries older than CACHE_MAX_AGE_HOURS.
+CACHE_MEMORY_MAX_ENTRIES = _env_int("CACHE_MEMORY_MAX_ENTRIES", 1024)
+CACHE_DIR = os.getenv("CACHE_DIR", "cache/results")
+CACHE_DISK_MAX_MB = _env_int("CACHE_DISK_MAX_MB", 1024)
+CACHE_MAX_AGE_HOURS = _env_float("CACHE_MAX_AGE_HOURS", 24 * 30)
+
+# Near-duplicate lookup: images whose 256-bit perceptual hash is within
+# PHASH_MAX_DISTANCE bits of an already processed image reuse its result.
+# The index keeps the PHASH_INDEX_MAX_ENTRIES most recently processed images.
+PHASH_ENABLED = _env_bool("PHASH_ENABLED", True)
+PHASH_MAX_DISTANCE = _env_int("PHASH_MAX_DISTANCE", 4)
+PHASH_INDEX_PATH = os.getenv("PHASH_INDEX_PATH", "cache/phash_index.tsv")
+PHASH_INDEX_MAX_ENTRIES = _env_int("PHASH_INDEX_MAX_ENTRIES", 100000)
+
+# Asynchronous batch jobs: items are persisted in the SQLite database at
+# JOBS_DB_PATH and processed by JOBS_CONCURRENCY workers; finished jobs are
+# deleted JOBS_RETENTION_HOURS after their last item completed.
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "data/jobs.sqlite3")
+JOBS_CONCURRENCY = _env_int("JOBS_CONCURRENCY", 2 * BATCH_MAX_SIZE)
+JOBS_MAX_IMAGES = _env_int("JOBS_MAX_IMAGES", 10000)
+JOBS_RETENTION_HOURS = _env_float("JOBS_RETENTION_HOURS", 24 * 7)
+
+# Image downloads: all URLs of a request are fetched concurrently through a
+# pooled client, at most FETCH_MAX_PER_HOST at a time per host. Bodies over
+# FETCH_MAX_MB are rejected; timeouts and 429/5xx answers are retried
+# FETCH_RETRIES times with exponential backoff.
+FETCH_TIMEOUT_SECONDS = _env_float("FETCH_TIMEOUT_SECONDS", 30.0)
+FETCH_CONNECT_TIMEOUT_SECONDS = _env_float("FETCH_CONNECT_TIMEOUT_SECONDS", 10.0)
+FETCH_MAX_BYTES = int(_env_float("FETCH_MAX_MB", 20.0) * 1024 * 1024)
+FETCH_MAX_CONNECTIONS = _env_int("FETCH_MAX_CONNECTIONS", 32)
+FETCH_MAX_PER_HOST = _env_int("FETCH_MAX_PER_HOST", 6)
+FETCH_RETRIES = _env_int("FETCH_RETRIES", 2)
+
+# Uploads: each uploaded file may be at most UPLOAD_MAX_MB, enforced while
+# the request body is received; the multi-file endpoint takes at most
+# UPLOAD_MAX_FILES files per request.
+UPLOAD_MAX_BYTES = int(_env_float("UPLOAD_MAX_MB", 20.0) * 1024 * 1024)
+UPLOAD_MAX_FILES = _env_int("UPLOAD_MAX_FILES", 64)
+
+# Image preprocessing ahead of the vision encoder: uniform borders are
+# trimmed, optionally converted to grayscale, and the image is resized so
+# its area lies within [IMAGE_MIN_PIXELS, IMAGE_MAX_PIXELS]. Every 28x28
+# pixel block becomes one vision token, so the defaults bound an image to
+# 128-1280 tokens.
+IMAGE_MIN_PIXELS = _env_int("IMAGE_MIN_PIXELS", 128 * 28 * 28)
+IMAGE_MAX_PIXELS = _env_int("IMAGE_MAX_PIXELS", 1280 * 28 * 28)
+IMAGE_TRIM_BORDERS = _env_bool("IMAGE_TRIM_BORDERS", True)
+IMAGE_GRAYSCALE = _env_bool("IMAGE_GRAYSCALE", False)
+
+# Reuse precomputed key/value states for the constant system prompt instead
+# of re-running prefill over it for every image.
+PREFIX_CACHE_ENABLED = _env_bool("PREFIX_CACHE_ENABLED", True)
+
+# Output length: generation stops as soon as the top-level JSON object
+# closes. Until the model has emitted task_visual_category, MAX_NEW_TOKENS
+# applies; afterwards the category's budget from TOKEN_BUDGETS does
+# (override as "pie_chart=2048,line_graph=10000").
+MAX_NEW_TOKENS = _env_int("MAX_NEW_TOKENS", 16384)
+TOKEN_BUDGETS = _env_budgets("TOKEN_BUDGETS", {
+    "pie_chart": 3072,
+    "map": 4096,
+    "process_diagram": 4096,
+    "bar_chart": 6144,
+    "table": 6144,
+    "line_graph": 8192,
+    "multiple_graphs": 16384,
+})
+
+# Data-only extraction: the model outputs the raw values (bars, line points,
+# table cells, pie slices) but not the extremes, trends, totals and
+# rankings derived from them, which are computed server-side instead.
+# Fewer decode tokens per image, and the derived facts are exact.
+DATA_ONLY_EXTRACTION = _env_bool("DATA_ONLY_EXTRACTION", False)
+
+# Two-stage extraction: a short classification pass reads the visual types
+# first, then the extraction prompt carries only the schema sections for
+# those types (about half the system-prompt tokens for a single visual).
+# The image is encoded once and shared by both passes.
+TWO_STAGE_EXTRACTION = _env_bool("TWO_STAGE_EXTRACTION", False)
+
+# Compact output: the model writes bar, line, table and pie values as
+# columnar arrays with short keys and ids implied by position, and the
+# server expands them into the task1_v1 objects (utils/compact_format.py).
+# API responses keep the task1_v1 schema either way.
+COMPACT_OUTPUT = _env_bool("COMPACT_OUTPUT", False)
+
+# Schema-constrained decoding: mask tokens that would break JSON syntax or
+# put a value outside the enums documented in the task1_v1 schema. Costs a
+# few seconds at startup to index the vocabulary. Token masks of the
+# CONSTRAINED_MASK_CACHE_SIZE most recently seen grammar states are kept in
+# CPU memory (one byte per vocabulary entry each, ~150 KB for Qwen2.5-VL).
+CONSTRAINED_DECODING = _env_bool("CONSTRAINED_DECODING", False)
+CONSTRAINED_MASK_CACHE_SIZE = _env_int("CONSTRAINED_MASK_CACHE_SIZE", 1024)
+
+# Speculative (assisted) decoding: a smaller model sharing MODEL_NAME's
+# tokenizer (e.g. Qwen/Qwen2.5-VL-3B-Instruct) drafts up to DRAFT_NUM_TOKENS
+# tokens at a time that the main model verifies in one forward pass.
+# Greedy outputs are unchanged. Used for single-image generate calls; not
+# combined with CONSTRAINED_DECODING. Empty disables it.
+DRAFT_MODEL_NAME = os.getenv("DRAFT_MODEL_NAME", "")
+DRAFT_NUM_TOKENS = _env_int("DRAFT_NUM_TOKENS", 8)
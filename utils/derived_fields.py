@@ -0,0 +1,764 @@
+"""
+Extremes, changes, rankings and crossing points computed from extracted values.
+
+In data-only mode (DATA_ONLY_EXTRACTION) the model transcribes the raw
+values only, and the blocks below are filled in here from the numbers it
+emitted, instead of being written out token by token by the model:
+
+    bar_chart   structure.extremes, structure.patterns_and_trends
+    line_graph  structure.extremes, structure.patterns_and_trends
+    table       structure.derived_information
+    pie_chart   structure.percentage_sum_check, structure.extremes,
+                structure.patterns_and_trends
+
+plus global_semantics.extremes_summary. Every derived item carries the ids
+and labels it refers to, the numbers involved and a one-line `description`,
+and is flagged `approximate` when any value it rests on was estimated.
+Values are read into NumPy arrays (NaN where missing or not numeric), so a
+chart with many series costs no more than a few array operations.
+"""
+import math
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Highest and lowest bars and table cells listed (more when values tie)
+TOP_N = 3
+
+# Blocks filled by fill_derived_fields, per visual type
+DERIVED_KEYS = {
+    "bar_chart": ("extremes", "patterns_and_trends"),
+    "line_graph": ("extremes", "patterns_and_trends"),
+    "table": ("derived_information",),
+    "pie_chart": ("percentage_sum_check", "extremes", "patterns_and_trends"),
+}
+
+# A series whose range is within this share of its mean counts as stable
+_STABLE_SHARE = 0.05
+# Slice percentages this close to 100 add up, allowing for rounding
+_PERCENT_TOLERANCE = 1.0
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+_TIME_LABEL = re.compile(r"^\s*(?:1[5-9]|2[0-9])\d{2}s?\s*$")
+
+
+@dataclass
+class _Grid:
+    """Values of a visual as a rows x columns array, with the axes' ids and labels."""
+
+    row_ids: List[Any]
+    row_labels: List[str]
+    column_ids: List[Any]
+    column_labels: List[str]
+    values: np.ndarray
+    approximate: np.ndarray
+
+    def transpose(self) -> "_Grid":
+        return _Grid(self.column_ids, self.column_labels, self.row_ids, self.row_labels,
+                     self.values.T, self.approximate.T)
+
+
+def fill_derived_fields(metadata: dict) -> dict:
+    """
+    Fill the derived blocks of every supported visual from its raw values.
+
+    Existing derived blocks are replaced. Visual types without derived
+    blocks (maps, process diagrams) and malformed structures are left as
+    they are.
+
+    Args:
+        metadata: Parsed task1_v1 document (modified in place)
+
+    Returns:
+        dict: The same document
+    """
+    visuals = _dicts(metadata.get("visuals"))
+    time_labels = _time_labels(metadata)
+    summary: List[str] = []
+    pies: List[Tuple[dict, dict]] = []
+    for visual in visuals:
+        structure = visual.get("structure")
+        visual_type = visual.get("visual_type")
+        if not isinstance(structure, dict) or not isinstance(visual_type, str) or visual_type not in DERIVED_KEYS:
+            continue
+        if visual_type == "bar_chart":
+            highlights = _derive_bar_chart(structure, time_labels)
+        elif visual_type == "line_graph":
+            highlights = _derive_line_graph(structure)
+        elif visual_type == "table":
+            highlights = _derive_table(structure)
+        else:
+            highlights = _derive_pie_chart(structure)
+            pies.append((visual, structure))
+        panel = visual.get("panel_label") or visual.get("title")
+        prefix = f"{panel}: " if panel and len(visuals) > 1 else ""
+        summary.extend(prefix + highlight for highlight in highlights)
+
+    for (before, before_structure), (after, after_structure) in zip(pies, pies[1:]):
+        after_structure["patterns_and_trends"]["comparisons_with_other_pies"] = _compare_pies(
+            before, before_structure, after, after_structure
+        )
+
+    semantics = metadata.get("global_semantics")
+    if isinstance(semantics, dict) and summary:
+        semantics["extremes_summary"] = summary
+    return metadata
+
+
+def fill_derived_fields_section(key: str, value: Any, topic_context: Any = None) -> Any:
+    """
+    Fill the derived blocks of one top-level member (for streamed sections).
+
+    Only visuals carry derived blocks. global_semantics.extremes_summary
+    summarizes all visuals and is streamed before them, so it is only
+    filled in the complete document.
+
+    Args:
+        key: Top-level key
+        value: Its parsed value (visuals are modified in place)
+        topic_context: The document's topic_context if already parsed, for
+            its time labels
+
+    Returns:
+        The value with its derived blocks filled
+    """
+    if key == "visuals" and isinstance(value, list):
+        fill_derived_fields({"topic_context": topic_context, "visuals": value})
+    return value
+
+
+def strip_derived_fields(metadata: dict) -> dict:
+    """
+    Remove the blocks fill_derived_fields computes, leaving what a data-only extraction contains.
+
+    Args:
+        metadata: Parsed task1_v1 document (modified in place)
+
+    Returns:
+        dict: The same document
+    """
+    for visual in _dicts(metadata.get("visuals")):
+        structure = visual.get("structure")
+        visual_type = visual.get("visual_type")
+        if isinstance(structure, dict) and isinstance(visual_type, str):
+            for key in DERIVED_KEYS.get(visual_type, ()):
+                structure.pop(key, None)
+    semantics = metadata.get("global_semantics")
+    if isinstance(semantics, dict):
+        semantics.pop("extremes_summary", None)
+    return metadata
+
+
+# ---------------------------------------------------------------------------
+# Per visual type
+# ---------------------------------------------------------------------------
+
+def _derive_bar_chart(structure: dict, time_labels: set) -> List[str]:
+    """Fill extremes and patterns_and_trends of a bar chart; returns summary lines."""
+    axes = structure.get("axes") if isinstance(structure.get("axes"), dict) else {}
+    category_axis = axes.get("category_axis") if isinstance(axes.get("category_axis"), dict) else {}
+    value_axis = axes.get("value_axis") if isinstance(axes.get("value_axis"), dict) else {}
+    unit = value_axis.get("unit")
+    series = _dicts(structure.get("series"))
+    grid = _build_grid(
+        series, "series_id", _dicts(category_axis.get("categories")), "category_id",
+        ("category_id",), "value",
+    )
+
+    def bar(row: int, column: int) -> dict:
+        where = f"{grid.row_labels[row]}, {grid.column_labels[column]}" if len(series) > 1 \
+            else grid.column_labels[column]
+        return _point(grid, row, column, "series", "category", "value",
+                      f"{where}: {_format(grid.values[row, column], unit)}")
+
+    highest = [bar(*cell) for cell in _ranked_cells(grid.values, TOP_N, largest=True)]
+    lowest = [bar(*cell) for cell in _ranked_cells(grid.values, TOP_N, largest=False)]
+    structure["extremes"] = {"highest_bars": highest, "lowest_bars": lowest}
+
+    # Changes run along whichever axis is time (years as categories or as series)
+    overall_pattern = []
+    if _is_time_axis(grid.column_labels, time_labels):
+        overall_pattern = _changes(grid, "series", "category", unit)
+    elif _is_time_axis(grid.row_labels, time_labels):
+        overall_pattern = _changes(grid.transpose(), "category", "series", unit)
+    elif len(series) == 1:
+        overall_pattern = [_ranking(grid.transpose(), 0, "category", unit, "series")]
+
+    group_comparisons = []
+    if len(series) > 1:
+        group_comparisons = [
+            _ranking(grid, column, "series", unit, "category")
+            for column in range(len(grid.column_ids))
+            if np.count_nonzero(~np.isnan(grid.values[:, column])) > 1
+        ]
+
+    structure["patterns_and_trends"] = {
+        "overall_pattern": overall_pattern,
+        "group_comparisons": group_comparisons,
+        "notable_outliers": [
+            dict(bar(row, column), direction=direction)
+            for row, column, direction in _outliers(grid.values)
+        ],
+    }
+    return _highlights(highest, lowest)
+
+
+def _derive_line_graph(structure: dict) -> List[str]:
+    """Fill extremes and patterns_and_trends of a line graph; returns summary lines."""
+    axes = structure.get("axes") if isinstance(structure.get("axes"), dict) else {}
+    x_axis = axes.get("x_axis") if isinstance(axes.get("x_axis"), dict) else {}
+    y_axis = axes.get("y_axis") if isinstance(axes.get("y_axis"), dict) else {}
+    unit = y_axis.get("unit")
+    series = _dicts(structure.get("line_series"))
+    ticks = _dicts(x_axis.get("ticks"))
+    grid = _build_grid(series, "series_id", ticks, "tick_id", ("x_tick_id", "x_label"), "y_value")
+    tick_numbers = _tick_numbers(grid, ticks, series)
+
+    def point(row: int, column: int) -> dict:
+        item = _point(grid, row, column, "series", "x_tick", "y_value",
+                      f"{grid.row_labels[row]}, {grid.column_labels[column]}: "
+                      f"{_format(grid.values[row, column], unit)}")
+        item["x_label"] = item.pop("x_tick_label")
+        return item
+
+    overall_max = [point(*cell) for cell in _ranked_cells(grid.values, 1, largest=True)]
+    overall_min = [point(*cell) for cell in _ranked_cells(grid.values, 1, largest=False)]
+    per_series_max, per_series_min = [], []
+    for row in range(len(grid.row_ids)):
+        values = grid.values[row]
+        if np.isnan(values).all():
+            continue
+        per_series_max.extend(point(row, column) for column in np.flatnonzero(values == np.nanmax(values)))
+        per_series_min.extend(point(row, column) for column in np.flatnonzero(values == np.nanmin(values)))
+    structure["extremes"] = {
+        "overall_max_points": overall_max,
+        "overall_min_points": overall_min,
+        "per_series_max": per_series_max,
+        "per_series_min": per_series_min,
+    }
+
+    cross_series = []
+    if len(series) > 1:
+        observed = np.flatnonzero((~np.isnan(grid.values)).sum(axis=0) > 1)
+        for column in sorted({int(observed[0]), int(observed[-1])} if observed.size else ()):
+            cross_series.append(_ranking(grid, column, "series", unit, "x_tick"))
+
+    structure["patterns_and_trends"] = {
+        "overall_trend_description": _changes(grid, "series", "x_tick", unit),
+        "cross_series_comparisons": cross_series,
+        "crossing_points": _crossings(grid, tick_numbers),
+        "stability_and_fluctuation": _stability(grid, unit),
+    }
+    return _highlights(overall_max, overall_min)
+
+
+def _derive_table(structure: dict) -> List[str]:
+    """Fill derived_information of a table; returns summary lines."""
+    rows = _dicts(structure.get("row_headers"))
+    columns = _ordered(_dicts(structure.get("column_headers")))
+    cells = _dicts(structure.get("cells"))
+    # One "series" per row, so the generic grid builder can be reused
+    by_row: Dict[Any, List[dict]] = {}
+    for cell in cells:
+        key = _key(cell.get("row_id"))
+        if key is not None:
+            by_row.setdefault(key, []).append(cell)
+    row_entries = [
+        {"row_id": row.get("row_id"), "label": row.get("label"), "data_points": by_row.get(_key(row.get("row_id")), [])}
+        for row in _ordered(rows)
+    ]
+    known = {_key(row.get("row_id")) for row in rows}
+    row_entries.extend({"row_id": key, "label": None, "data_points": points}
+                       for key, points in by_row.items() if key not in known)
+    grid = _build_grid(row_entries, "row_id", columns, "column_id", ("column_id",), "value")
+    unit_by_column = {
+        _key(column.get("column_id")): column.get("unit") if isinstance(column.get("unit"), str) else None
+        for column in columns
+    }
+    units = [unit_by_column.get(column_id) for column_id in grid.column_ids]
+    # Values in different units cannot be added up or compared across columns
+    uniform = len({unit for unit in units if unit not in (None, "")}) <= 1
+    unit = next((unit for unit in units if unit not in (None, "")), None)
+
+    def cell(row: int, column: int) -> dict:
+        return _point(grid, row, column, "row", "column", "value",
+                      f"{grid.row_labels[row]}, {grid.column_labels[column]}: "
+                      f"{_format(grid.values[row, column], units[column])}")
+
+    observed = ~np.isnan(grid.values)
+    column_totals = [
+        {"column_id": grid.column_ids[column], "label": grid.column_labels[column],
+         "total": _number_out(np.nansum(grid.values[:, column])),
+         "approximate": bool(grid.approximate[:, column].any())}
+        for column in range(len(grid.column_ids)) if observed[:, column].any()
+    ]
+    row_totals, row_comparisons = [], []
+    if uniform:
+        row_totals = [
+            {"row_id": grid.row_ids[row], "label": grid.row_labels[row],
+             "total": _number_out(np.nansum(grid.values[row])),
+             "approximate": bool(grid.approximate[row].any())}
+            for row in range(len(grid.row_ids)) if observed[row].any()
+        ]
+        row_comparisons = [
+            _ranking(grid.transpose(), row, "column", unit, "row")
+            for row in range(len(grid.row_ids)) if observed[row].sum() > 1
+        ]
+        highest = [cell(*position) for position in _ranked_cells(grid.values, TOP_N, largest=True)]
+        lowest = [cell(*position) for position in _ranked_cells(grid.values, TOP_N, largest=False)]
+    else:
+        # Extremes per column instead
+        highest, lowest = [], []
+        for column in range(len(grid.column_ids)):
+            values = np.where(np.arange(len(grid.column_ids)) == column, grid.values, np.nan)
+            highest.extend(cell(*position) for position in _ranked_cells(values, 1, largest=True))
+            lowest.extend(cell(*position) for position in _ranked_cells(values, 1, largest=False))
+    column_comparisons = [
+        _ranking(grid, column, "row", units[column], "column")
+        for column in range(len(grid.column_ids)) if observed[:, column].sum() > 1
+    ]
+
+    structure["derived_information"] = {
+        "row_totals": row_totals,
+        "column_totals": column_totals,
+        "extremes": {"highest_cells": highest, "lowest_cells": lowest},
+        "row_comparisons": row_comparisons,
+        "column_comparisons": column_comparisons,
+    }
+    return _highlights(highest, lowest)
+
+
+def _derive_pie_chart(structure: dict) -> List[str]:
+    """Fill percentage_sum_check, extremes and patterns_and_trends of a pie chart; returns summary lines."""
+    slices = _dicts(structure.get("slices"))
+    percentages = np.array([_number(item.get("percentage")) for item in slices], dtype=float)
+    amounts = np.array([_number(item.get("value")) for item in slices], dtype=float)
+    given = not np.isnan(percentages).all()
+    if not given and not np.isnan(amounts).all() and np.nansum(amounts) > 0:
+        # Only absolute values were read: shares follow from them
+        percentages = amounts / np.nansum(amounts) * 100
+    labels = [str(item.get("label") or item.get("slice_id") or f"slice {i + 1}") for i, item in enumerate(slices)]
+
+    def slice_item(index: int) -> dict:
+        return {
+            "slice_id": slices[index].get("slice_id"),
+            "label": labels[index],
+            "percentage": _number_out(percentages[index]),
+            "approximate": bool(slices[index].get("approximate")) or not given,
+            "description": f"{labels[index]}: {_format(percentages[index], 'percent')}",
+        }
+
+    grid = percentages.reshape(1, -1)
+    largest = [slice_item(column) for _, column in _ranked_cells(grid, 1, largest=True)]
+    smallest = [slice_item(column) for _, column in _ranked_cells(grid, 1, largest=False)]
+    total = float(np.nansum(percentages)) if given else None
+    structure["percentage_sum_check"] = {
+        "total_percentage": _number_out(total) if total is not None else None,
+        "is_approximately_100": abs(total - 100) <= _PERCENT_TOLERANCE if total is not None else None,
+    }
+    structure["extremes"] = {"largest_slices": largest, "smallest_slices": smallest}
+
+    comparisons = []
+    order = [int(index) for index in np.argsort(-grid[0], kind="stable") if not np.isnan(grid[0, index])]
+    if len(order) > 1:
+        comparisons.append({
+            "ranking": [slices[index].get("slice_id") for index in order],
+            "description": " > ".join(
+                f"{labels[index]} ({_format(percentages[index], 'percent')})" for index in order
+            ),
+        })
+        top, bottom = percentages[order[0]], percentages[order[-1]]
+        if bottom > 0:
+            comparisons.append({
+                "largest_to_smallest_ratio": _number_out(top / bottom),
+                "description": f"{labels[order[0]]} is {top / bottom:.1f} times {labels[order[-1]]}",
+            })
+    structure["patterns_and_trends"] = {
+        "within_pie_comparisons": comparisons,
+        "comparisons_with_other_pies": [],
+    }
+    return _highlights(largest, smallest, ("Largest", "Smallest"))
+
+
+def _compare_pies(before: dict, before_structure: dict, after: dict, after_structure: dict) -> List[dict]:
+    """Change in share of every slice label present in two consecutive pies."""
+    def shares(structure: dict) -> Dict[str, Tuple[str, float]]:
+        found = {}
+        for item in _all_slices(structure):
+            label = str(item["label"])
+            found.setdefault(label.strip().lower(), (label, item["percentage"]))
+        return found
+
+    before_shares, after_shares = shares(before_structure), shares(after_structure)
+    before_name = before.get("panel_label") or before.get("title") or before.get("visual_id")
+    after_name = after.get("panel_label") or after.get("title") or after.get("visual_id")
+    comparisons = []
+    for key, (label, start) in before_shares.items():
+        if key not in after_shares or start is None or after_shares[key][1] is None:
+            continue
+        end = after_shares[key][1]
+        change = end - start
+        comparisons.append({
+            "from_visual_id": before.get("visual_id"),
+            "to_visual_id": after.get("visual_id"),
+            "label": label,
+            "from_percentage": start,
+            "to_percentage": end,
+            "change_points": _number_out(change),
+            "description": f"{label}: {_format(start, 'percent')} ({before_name}) to "
+                           f"{_format(end, 'percent')} ({after_name}), {_signed(change)} points",
+        })
+    return comparisons
+
+
+def _all_slices(structure: dict) -> List[dict]:
+    """Label and percentage of every slice, as computed for the extremes."""
+    slices = _dicts(structure.get("slices"))
+    percentages = [_number(item.get("percentage")) for item in slices]
+    if all(math.isnan(value) for value in percentages):
+        amounts = [_number(item.get("value")) for item in slices]
+        total = sum(value for value in amounts if not math.isnan(value))
+        percentages = [value / total * 100 if total > 0 else math.nan for value in amounts]
+    return [
+        {"label": item.get("label") or item.get("slice_id"), "percentage": _number_out(value)}
+        for item, value in zip(slices, percentages) if not math.isnan(value)
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Shared computations
+# ---------------------------------------------------------------------------
+
+def _build_grid(
+    rows: List[dict], row_id_key: str, columns: List[dict], column_id_key: str,
+    point_keys: Tuple[str, ...], value_key: str,
+) -> _Grid:
+    """
+    Read series (or table rows) into a rows x columns value array.
+
+    Columns come from the axis in order_index order; ids that data points
+    use but the axis does not list are appended. Points are matched to a
+    column by the first of point_keys that names one (by id or by label).
+    """
+    column_ids, column_labels, index = [], [], {}
+    for column in _ordered(columns):
+        key = _key(column.get(column_id_key))
+        if key is None or key in index:
+            continue
+        index[key] = len(column_ids)
+        column_ids.append(key)
+        column_labels.append(str(column.get("label") if column.get("label") is not None else key))
+    for position, label in enumerate(column_labels):
+        index.setdefault(label, position)
+
+    points_per_row = [_dicts(row.get("data_points")) for row in rows]
+    for points in points_per_row:
+        for point in points:
+            keys = [_key(point.get(name)) for name in point_keys]
+            if not any(key in index for key in keys if key is not None):
+                key = next((key for key in keys if key is not None), None)
+                if key is not None:
+                    index[key] = len(column_ids)
+                    column_ids.append(key)
+                    column_labels.append(str(point.get("x_label") or key))
+
+    values = np.full((len(rows), len(column_ids)), np.nan)
+    approximate = np.zeros(values.shape, dtype=bool)
+    for row, points in enumerate(points_per_row):
+        for point in points:
+            column = next((index[key] for key in (_key(point.get(name)) for name in point_keys)
+                           if key is not None and key in index), None)
+            if column is not None:
+                values[row, column] = _number(point.get(value_key))
+                approximate[row, column] = bool(point.get("approximate"))
+
+    row_ids = [row.get(row_id_key) for row in rows]
+    row_labels = [
+        str(row.get("label") or row.get("legend_label") or row_id or f"{row_id_key[:-3]} {i + 1}")
+        for i, (row, row_id) in enumerate(zip(rows, row_ids))
+    ]
+    return _Grid(row_ids, row_labels, column_ids, column_labels, values, approximate)
+
+
+def _ranked_cells(values: np.ndarray, count: int, largest: bool) -> List[Tuple[int, int]]:
+    """(row, column) of the `count` highest or lowest values, plus any tied with the last one."""
+    flat = values.ravel()
+    observed = np.flatnonzero(~np.isnan(flat))
+    if observed.size == 0:
+        return []
+    keys = -flat[observed] if largest else flat[observed]
+    order = observed[np.argsort(keys, kind="stable")]
+    cutoff = flat[order[min(count, order.size) - 1]]
+    kept = order[flat[order] >= cutoff] if largest else order[flat[order] <= cutoff]
+    return [tuple(int(i) for i in np.unravel_index(position, values.shape)) for position in kept]
+
+
+def _changes(grid: _Grid, row_kind: str, column_kind: str, unit: Optional[str]) -> List[dict]:
+    """Change of every row from its first to its last observed column."""
+    if grid.values.shape[1] == 0:
+        # Series without any columns (e.g. output cut off before the first point)
+        return []
+    observed = ~np.isnan(grid.values)
+    counts = observed.sum(axis=1)
+    first = observed.argmax(axis=1)
+    last = observed.shape[1] - 1 - observed[:, ::-1].argmax(axis=1)
+    rows = np.arange(len(grid.row_ids))
+    start, end = grid.values[rows, first], grid.values[rows, last]
+    delta = end - start
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percent = np.where(start != 0, delta / np.abs(start) * 100, np.nan)
+
+    changes = []
+    for row in np.flatnonzero(counts > 1):
+        a, b = int(first[row]), int(last[row])
+        direction = "increase" if delta[row] > 0 else "decrease" if delta[row] < 0 else "no_change"
+        verb = {"increase": "rose", "decrease": "fell", "no_change": "was unchanged"}[direction]
+        details = [_signed(delta[row]) + (" points" if unit == "percent" else "")]
+        if not np.isnan(percent[row]) and unit != "percent":
+            details.append(_signed(round(percent[row], 1)) + "%")
+        elif not np.isnan(percent[row]):
+            details.append(_signed(round(percent[row], 1)) + "% relative")
+        changes.append({
+            f"{row_kind}_id": grid.row_ids[row],
+            f"{row_kind}_label": grid.row_labels[row],
+            "from": {f"{column_kind}_id": grid.column_ids[a], "label": grid.column_labels[a],
+                     "value": _number_out(start[row])},
+            "to": {f"{column_kind}_id": grid.column_ids[b], "label": grid.column_labels[b],
+                   "value": _number_out(end[row])},
+            "change": _number_out(delta[row]),
+            "percent_change": _number_out(percent[row]) if not np.isnan(percent[row]) else None,
+            "direction": direction,
+            "approximate": bool(grid.approximate[row, a] or grid.approximate[row, b]),
+            "description": f"{grid.row_labels[row]} {verb} from {_format(start[row], unit)} in "
+                           f"{grid.column_labels[a]} to {_format(end[row], unit)} in "
+                           f"{grid.column_labels[b]} ({', '.join(details)})",
+        })
+    return changes
+
+
+def _ranking(grid: _Grid, column: int, row_kind: str, unit: Optional[str], column_kind: str) -> dict:
+    """Rows ordered from highest to lowest value in one column."""
+    values = grid.values[:, column]
+    order = [int(row) for row in np.argsort(-values, kind="stable") if not np.isnan(values[row])]
+    return {
+        f"{column_kind}_id": grid.column_ids[column],
+        f"{column_kind}_label": grid.column_labels[column],
+        "ranking": [grid.row_ids[row] for row in order],
+        "approximate": bool(grid.approximate[order, column].any()) if order else False,
+        "description": f"{grid.column_labels[column]}: " + " > ".join(
+            f"{grid.row_labels[row]} ({_format(values[row], unit)})" for row in order
+        ),
+    }
+
+
+def _outliers(values: np.ndarray) -> List[Tuple[int, int, str]]:
+    """Cells outside Tukey's fences (1.5 IQR beyond the quartiles), given at least 4 values."""
+    if np.count_nonzero(~np.isnan(values)) < 4:
+        return []
+    q1, q3 = np.nanpercentile(values, [25, 75])
+    spread = 1.5 * (q3 - q1)
+    with np.errstate(invalid="ignore"):
+        high = values > q3 + spread
+        low = values < q1 - spread
+    return [(int(row), int(column), "high") for row, column in np.argwhere(high)] + \
+        [(int(row), int(column), "low") for row, column in np.argwhere(low)]
+
+
+def _tick_numbers(grid: _Grid, ticks: List[dict], series: List[dict]) -> np.ndarray:
+    """Numeric x value of every column (NaN where unknown), for interpolating crossings."""
+    numbers = np.full(len(grid.column_ids), np.nan)
+    position = {key: i for i, key in enumerate(grid.column_ids)}
+    for tick in ticks:
+        column = position.get(_key(tick.get("tick_id")))
+        if column is not None:
+            numbers[column] = _number(tick.get("numeric_value"))
+    for points in (_dicts(item.get("data_points")) for item in series):
+        for point in points:
+            column = position.get(_key(point.get("x_tick_id")))
+            if column is not None and np.isnan(numbers[column]):
+                numbers[column] = _number(point.get("x_numeric_value"))
+    if np.isnan(numbers).any():
+        # Fall back to labels that are plain numbers (years)
+        labels = np.array([_number(label) if _NUMBER.fullmatch(label.strip()) else np.nan
+                           for label in grid.column_labels], dtype=float)
+        numbers = np.where(np.isnan(numbers), labels, numbers)
+    return numbers
+
+
+def _crossings(grid: _Grid, tick_numbers: np.ndarray) -> List[dict]:
+    """Points where one series overtakes another, between consecutive ticks or exactly at one."""
+    values = grid.values
+    if values.shape[0] < 2 or values.shape[1] < 2:
+        return []
+    # difference[a, b, t] = series a minus series b at tick t
+    difference = values[:, None, :] - values[None, :, :]
+    sign = np.sign(difference)
+    pairs = np.triu(np.ones(values.shape[:1] * 2, dtype=bool), k=1)[:, :, None]
+    with np.errstate(invalid="ignore"):
+        between = pairs & (sign[:, :, :-1] * sign[:, :, 1:] < 0)
+        at_tick = pairs & (sign[:, :, 1:-1] == 0) & (sign[:, :, :-2] * sign[:, :, 2:] < 0)
+
+    events = [(int(a), int(b), int(t), int(t) + 1) for a, b, t in np.argwhere(between)]
+    events += [(int(a), int(b), int(t) + 1, int(t) + 1) for a, b, t in np.argwhere(at_tick)]
+    crossings = []
+    for a, b, start, end in sorted(events, key=lambda event: (event[2], event[0], event[1])):
+        before = start - 1 if start == end else start
+        after = end + 1 if start == end else end
+        leader, other = (a, b) if difference[a, b, after] > 0 else (b, a)
+        item = {
+            "series_ids": [grid.row_ids[leader], grid.row_ids[other]],
+            "series_labels": [grid.row_labels[leader], grid.row_labels[other]],
+            "between": [grid.column_labels[start], grid.column_labels[end]],
+            "approx_x": None,
+            "approximate": bool(grid.approximate[[a, b]][:, [before, after]].any()),
+        }
+        if start == end:
+            item["approx_x"] = _number_out(tick_numbers[start]) if not np.isnan(tick_numbers[start]) else None
+            where = f"in {grid.column_labels[start]}"
+        else:
+            gap = difference[a, b, start] - difference[a, b, end]
+            x0, x1 = tick_numbers[start], tick_numbers[end]
+            if not (np.isnan(x0) or np.isnan(x1)):
+                item["approx_x"] = _number_out(round(x0 + (x1 - x0) * difference[a, b, start] / gap, 1))
+            where = f"between {grid.column_labels[start]} and {grid.column_labels[end]}"
+            if item["approx_x"] is not None:
+                where += f" (around {item['approx_x']})"
+        item["description"] = f"{grid.row_labels[leader]} overtook {grid.row_labels[other]} {where}"
+        crossings.append(item)
+    return crossings
+
+
+def _stability(grid: _Grid, unit: Optional[str]) -> List[dict]:
+    """Whether each series moved steadily in one direction, stayed flat or fluctuated."""
+    results = []
+    for row in range(len(grid.row_ids)):
+        observed = np.flatnonzero(~np.isnan(grid.values[row]))
+        if observed.size < 3:
+            continue
+        values = grid.values[row, observed]
+        steps = np.sign(np.diff(values))
+        moving = steps[steps != 0]
+        reversals = int(np.count_nonzero(moving[1:] != moving[:-1]))
+        low, high, mean = float(values.min()), float(values.max()), float(np.abs(values).mean())
+        if high - low <= _STABLE_SHARE * mean:
+            pattern = "stable"
+            description = f"stayed roughly stable between {_format(low, unit)} and {_format(high, unit)}"
+        elif reversals == 0:
+            pattern = "increasing" if moving[0] > 0 else "decreasing"
+            description = f"{'rose' if moving[0] > 0 else 'fell'} steadily at every step"
+        else:
+            pattern = "fluctuating"
+            description = (f"fluctuated between {_format(low, unit)} and {_format(high, unit)}, "
+                           f"changing direction {reversals} time(s)")
+        results.append({
+            "series_id": grid.row_ids[row],
+            "series_label": grid.row_labels[row],
+            "pattern": pattern,
+            "direction_changes": reversals,
+            "min": _number_out(low),
+            "max": _number_out(high),
+            "approximate": bool(grid.approximate[row, observed].any()),
+            "description": f"{grid.row_labels[row]} {description}",
+        })
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Small helpers
+# ---------------------------------------------------------------------------
+
+def _point(grid: _Grid, row: int, column: int, row_kind: str, column_kind: str,
+           value_key: str, description: str) -> dict:
+    """One value of a grid as a derived item."""
+    return {
+        f"{row_kind}_id": grid.row_ids[row],
+        f"{row_kind}_label": grid.row_labels[row],
+        f"{column_kind}_id": grid.column_ids[column],
+        f"{column_kind}_label": grid.column_labels[column],
+        value_key: _number_out(grid.values[row, column]),
+        "approximate": bool(grid.approximate[row, column]),
+        "description": description,
+    }
+
+
+def _highlights(highest: List[dict], lowest: List[dict], words=("Highest", "Lowest")) -> List[str]:
+    """Summary lines for the single highest and lowest item."""
+    lines = []
+    if highest:
+        lines.append(f"{words[0]}: {highest[0]['description']}")
+    if lowest:
+        lines.append(f"{words[1]}: {lowest[0]['description']}")
+    return lines
+
+
+def _time_labels(metadata: dict) -> set:
+    """Time labels listed in topic_context.time_dimension."""
+    context = metadata.get("topic_context")
+    time_dimension = context.get("time_dimension") if isinstance(context, dict) else None
+    if not isinstance(time_dimension, dict) or not time_dimension.get("has_time_dimension"):
+        return set()
+    labels = time_dimension.get("raw_time_labels")
+    return {str(label).strip() for label in labels} if isinstance(labels, list) else set()
+
+
+def _is_time_axis(labels: List[str], time_labels: set) -> bool:
+    """Whether an axis runs through time (its labels are time labels or years)."""
+    if len(labels) < 2:
+        return False
+    return all(label.strip() in time_labels or _TIME_LABEL.match(label) for label in labels)
+
+
+def _ordered(items: List[dict]) -> List[dict]:
+    """Items sorted by order_index when every item has a numeric one, else as listed."""
+    indexes = [item.get("order_index") for item in items]
+    if items and all(isinstance(index, (int, float)) and not isinstance(index, bool) for index in indexes):
+        return sorted(items, key=lambda item: item["order_index"])
+    return items
+
+
+def _dicts(value) -> List[dict]:
+    """The dict items of a list (nothing if it is not a list)."""
+    return [item for item in value if isinstance(item, dict)] if isinstance(value, list) else []
+
+
+def _key(value):
+    """A usable id or label (None for missing or non-scalar values)."""
+    if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+        return value
+    return None
+
+
+def _number(value) -> float:
+    """
+    A value as a float, NaN if it is not numeric.
+
+    Strings count when they hold exactly one number ("approx. 40%", "1,200"),
+    which covers bare values quoted by JSON repair.
+    """
+    if isinstance(value, bool) or value is None:
+        return math.nan
+    if isinstance(value, (int, float)):
+        return float(value) if math.isfinite(value) else math.nan
+    if isinstance(value, str):
+        numbers = _NUMBER.findall(value.replace(",", ""))
+        if len(numbers) == 1:
+            return float(numbers[0])
+    return math.nan
+
+
+def _number_out(value: float):
+    """A float for JSON output: rounded to 4 decimals, int when whole."""
+    rounded = round(float(value), 4)
+    return int(rounded) if rounded.is_integer() else rounded
+
+
+def _format(value: float, unit: Optional[str] = None) -> str:
+    """A value for a description, with a % sign for percentages."""
+    text = f"{float(value):,.2f}".rstrip("0").rstrip(".")
+    return text + "%" if unit == "percent" else text
+
+
+def _signed(value: float) -> str:
+    """A change with its sign."""
+    return ("+" if value > 0 else "") + _format(value)
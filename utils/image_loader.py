@@ -0,0 +1,57 @@
+"""
+Image decoding and content hashing helpers.
+"""
+import hashlib
+import io
+
+from PIL import Image, ImageOps
+
+
+class InvalidImageError(ValueError):
+    """Image data could not be decoded."""
+
+
+def load_image_from_bytes(image_bytes: bytes) -> Image.Image:
+    """
+    Decode image bytes into an upright RGB PIL image.
+
+    Phone photos are often stored sideways with an EXIF orientation tag;
+    the rotation is applied here so everything downstream sees the chart
+    the way it is displayed.
+
+    Args:
+        image_bytes: Encoded image data
+
+    Returns:
+        Image.Image: Fully decoded RGB image
+
+    Raises:
+        InvalidImageError: If the data is not a readable image (unknown
+            format, truncated file, or over PIL's decompression-bomb limit)
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.load()
+    except Exception as e:
+        raise InvalidImageError(f"Invalid image format: {str(e)}") from e
+    image = ImageOps.exif_transpose(image)
+    return image.convert("RGB")
+
+
+def image_content_hash(image: Image.Image) -> str:
+    """
+    Hash the decoded pixel content of an image.
+
+    Two files that decode to the same pixels (e.g. the same PNG with
+    different metadata chunks) produce the same hash.
+
+    Args:
+        image: Decoded image
+
+    Returns:
+        str: Hex digest of the image mode, size and pixel data
+    """
+    digest = hashlib.blake2b(digest_size=32)
+    digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
@@ -0,0 +1,130 @@
+"""
+Chart-aware preprocessing ahead of the vision encoder.
+
+Qwen2.5-VL turns every 28x28 pixel block into one vision token, so a 4000px
+phone photo of a bar chart costs thousands of tokens of prefill without
+making its labels any more legible. Images are trimmed of uniform margins
+and resized into a pixel budget before they reach the model.
+"""
+import math
+from typing import Tuple
+
+from PIL import Image
+
+from utils.config import IMAGE_GRAYSCALE, IMAGE_MAX_PIXELS, IMAGE_MIN_PIXELS, IMAGE_TRIM_BORDERS
+from utils.perceptual_hash import trim_uniform_border
+
+# Side of the pixel block that becomes one vision token (14px patches,
+# merged 2x2)
+PATCH_FACTOR = 28
+
+# Trimming that leaves less than this on either side is treated as a
+# failure (e.g. a blank scan with a speck in one corner)
+_MIN_TRIMMED_SIDE = 2 * PATCH_FACTOR
+
+
+def fit_pixel_budget(
+    width: int,
+    height: int,
+    min_pixels: int = IMAGE_MIN_PIXELS,
+    max_pixels: int = IMAGE_MAX_PIXELS,
+    factor: int = PATCH_FACTOR,
+) -> Tuple[int, int]:
+    """
+    Compute the size an image is resized to before encoding.
+
+    Both sides become multiples of `factor`, the aspect ratio is kept as
+    far as that allows, and the area is scaled into [min_pixels, max_pixels].
+    This matches the resizing the Qwen2.5-VL processor applies itself, so
+    an image already at this size is passed through unchanged.
+
+    Args:
+        width: Original width in pixels
+        height: Original height in pixels
+        min_pixels: Smallest allowed area
+        max_pixels: Largest allowed area
+        factor: Both sides are rounded to a multiple of this
+
+    Returns:
+        tuple: (width, height) after resizing
+    """
+    new_width = max(factor, round(width / factor) * factor)
+    new_height = max(factor, round(height / factor) * factor)
+    if new_width * new_height > max_pixels:
+        scale = math.sqrt(width * height / max_pixels)
+        new_width = max(factor, math.floor(width / scale / factor) * factor)
+        new_height = max(factor, math.floor(height / scale / factor) * factor)
+    elif new_width * new_height < min_pixels:
+        scale = math.sqrt(min_pixels / (width * height))
+        new_width = math.ceil(width * scale / factor) * factor
+        new_height = math.ceil(height * scale / factor) * factor
+    return new_width, new_height
+
+
+def vision_token_count(width: int, height: int, factor: int = PATCH_FACTOR) -> int:
+    """
+    Number of vision tokens an image of this (already fitted) size produces.
+
+    Args:
+        width: Width in pixels
+        height: Height in pixels
+        factor: Pixel block per token
+
+    Returns:
+        int: Vision tokens
+    """
+    return (width // factor) * (height // factor)
+
+
+def preprocess_image(
+    image: Image.Image,
+    min_pixels: int = IMAGE_MIN_PIXELS,
+    max_pixels: int = IMAGE_MAX_PIXELS,
+    trim_borders: bool = IMAGE_TRIM_BORDERS,
+    grayscale: bool = IMAGE_GRAYSCALE,
+) -> Image.Image:
+    """
+    Prepare a decoded (and EXIF-oriented) image for the vision encoder.
+
+    Args:
+        image: Decoded RGB image
+        min_pixels: Smallest area after resizing
+        max_pixels: Largest area after resizing
+        trim_borders: Crop uniform margins before resizing, so the pixel
+            budget is spent on the chart itself
+        grayscale: Drop colour (series are then told apart by shape and
+            labels only; useful for scanned monochrome material)
+
+    Returns:
+        Image.Image: RGB image whose sides are multiples of 28 pixels
+    """
+    if trim_borders:
+        trimmed = trim_uniform_border(image)
+        if min(trimmed.size) >= _MIN_TRIMMED_SIDE:
+            image = trimmed
+    if grayscale:
+        image = image.convert("L")
+    image = image.convert("RGB")
+
+    size = fit_pixel_budget(image.width, image.height, min_pixels, max_pixels)
+    if size != image.size:
+        # Lanczos keeps thin axis lines and small label text readable when
+        # shrinking; bicubic avoids ringing when enlarging
+        downscale = size[0] * size[1] < image.width * image.height
+        image = image.resize(size, Image.LANCZOS if downscale else Image.BICUBIC)
+    return image
+
+
+def preprocessing_signature(
+    min_pixels: int = IMAGE_MIN_PIXELS,
+    max_pixels: int = IMAGE_MAX_PIXELS,
+    trim_borders: bool = IMAGE_TRIM_BORDERS,
+    grayscale: bool = IMAGE_GRAYSCALE,
+) -> str:
+    """
+    Describe the preprocessing settings, for mixing into result-cache keys.
+
+    Returns:
+        str: Settings that change what the model sees
+    """
+    return f"pixels={min_pixels}-{max_pixels};trim={int(trim_borders)};gray={int(grayscale)}"
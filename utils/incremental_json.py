@@ -0,0 +1,130 @@
+"""
+Incremental parser that reports top-level JSON object members as soon as
+they are complete.
+
+The model emits one large JSON object token by token; this parser tracks
+brace and string state over the growing text so each top-level key
+(`task_visual_category`, `topic_context`, ...) can be handed to the client
+the moment its value closes, long before the whole object is finished.
+"""
+import json
+from typing import Any, List, Optional, Tuple
+
+
+class IncrementalSectionParser:
+    """Feed text chunks, get back completed (key, value) top-level members."""
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        # What the parser expects next at depth 1: "key", "colon" or "value"
+        self._expect = "key"
+        self._key: Optional[str] = None
+        self._value_start = 0
+        self._value_done = False
+
+    @property
+    def finished(self) -> bool:
+        """Whether the top-level object has been closed."""
+        return self._finished
+
+    @property
+    def text(self) -> str:
+        """All text fed so far."""
+        return self._buffer
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Consume a chunk of model output.
+
+        Args:
+            chunk: Newly decoded text
+
+        Returns:
+            list: (key, value) pairs for members completed by this chunk;
+                members whose value is not valid JSON are skipped
+        """
+        self._buffer += chunk
+        sections = []
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer) and not self._finished:
+            char = buffer[i]
+
+            if not self._started:
+                # Skip anything before the object, e.g. a ```json fence
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+                i += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._close_depth1_string(i, sections)
+                i += 1
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._expect == "value":
+                    # A nested object/array value just closed
+                    self._emit(i + 1, sections)
+                elif self._depth == 0:
+                    if self._expect == "value":
+                        self._emit(i, sections)
+                    self._finished = True
+            elif self._depth == 1:
+                if char == ":" and self._expect == "colon":
+                    self._expect = "value"
+                    self._value_start = i + 1
+                    self._value_done = False
+                elif char == ",":
+                    if self._expect == "value":
+                        self._emit(i, sections)
+                    self._expect = "key"
+            i += 1
+
+        self._pos = i
+        return sections
+
+    def _close_depth1_string(self, end: int, sections: List[Tuple[str, Any]]):
+        """Handle a string that just closed directly inside the top-level object."""
+        if self._expect == "key":
+            try:
+                self._key = json.loads(self._buffer[self._string_start:end + 1])
+            except ValueError:
+                self._key = None
+            self._expect = "colon"
+        elif self._expect == "value":
+            self._emit(end + 1, sections)
+
+    def _emit(self, end: int, sections: List[Tuple[str, Any]]):
+        """Parse the current member's value and record it once."""
+        if self._value_done or self._key is None:
+            return
+        self._value_done = True
+        raw = self._buffer[self._value_start:end].strip()
+        if not raw:
+            return
+        try:
+            sections.append((self._key, json.loads(raw)))
+        except ValueError:
+            pass
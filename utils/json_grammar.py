@@ -0,0 +1,294 @@
+"""
+Character-level JSON grammar for the task1_v1 output, with enum constraints
+derived from the schema in utils/prompts.py.
+
+The grammar is a pushdown automaton over characters. States are immutable
+tuples so they can be used directly as cache keys for per-state token masks
+(see services/constrained_decoding.py).
+"""
+import re
+from typing import Dict, FrozenSet, Optional, Tuple
+
+# Keys whose values the schema documents as a closed set of options. Other
+# "a | b | c" strings in the prompt (approx_location, unit, category, ...)
+# are examples the model may legitimately go beyond.
+ENUM_KEYS = (
+    "schema_version",
+    "task_visual_category",
+    "visual_type",
+    "role",
+    "importance_level",
+    "relationship_type",
+    "time_unit",
+    "bar_chart_type",
+    "orientation",
+    "scale",
+    "connection_type",
+    "map_orientation",
+    "status",
+    "change_type",
+)
+
+_INLINE_OPTIONS = re.compile(r'"(\w+)":\s*"([^"\n]*\|[^"\n]*)"')
+_COMMENT_OPTIONS = re.compile(r'"(\w+)":[^\n]*?//\s*((?:"[^"\n]+"|null)(?:\s*\|\s*(?:"[^"\n]+"|null))+)')
+_VERSION = re.compile(r'"schema_version":\s*"([^"\n|]+)"')
+
+
+def extract_enum_constraints(prompt: str, keys=ENUM_KEYS) -> Dict[str, FrozenSet[str]]:
+    """
+    Collect the allowed string values of enum-like keys from a schema prompt.
+
+    Both `"key": "a | b | c"` and `"key": ...  // "a" | "b" | null` forms are
+    recognized; when a key appears in several places its options are merged.
+    `null` is always accepted for these keys and is not part of the result.
+
+    Args:
+        prompt: Schema prompt text
+        keys: Keys to collect options for
+
+    Returns:
+        dict: key -> allowed string values
+    """
+    options: Dict[str, set] = {}
+    for key, values in _INLINE_OPTIONS.findall(prompt):
+        for value in values.split("|"):
+            value = value.strip()
+            if value and value != "null":
+                options.setdefault(key, set()).add(value)
+    for key, values in _COMMENT_OPTIONS.findall(prompt):
+        for value in values.split("|"):
+            value = value.strip()
+            if value.startswith('"'):
+                options.setdefault(key, set()).add(value.strip('"'))
+    for version in _VERSION.findall(prompt):
+        options.setdefault("schema_version", set()).add(version.strip())
+    return {key: frozenset(options[key]) for key in keys if key in options}
+
+
+# Modes of the automaton
+START = "start"              # before the top-level object
+OBJ_FIRST = "obj_first"      # after "{": key or "}"
+OBJ_NEXT = "obj_next"        # after "," in an object: key
+KEY = "key"                  # inside a key string
+AFTER_KEY = "after_key"      # expecting ":"
+VALUE = "value"              # expecting a value
+ARR_FIRST = "arr_first"      # after "[": value or "]"
+ENUM_START = "enum_start"    # expecting an enum string or null
+ENUM = "enum"                # inside an enum string
+STRING = "string"            # inside a free string value
+NUMBER = "number"            # inside a number
+LITERAL = "literal"          # inside true/false/null
+AFTER_VALUE = "after_value"  # expecting "," or a closing bracket
+DONE = "done"                # top-level object closed
+
+WHITESPACE = " \t\n\r"
+_DIGITS = "0123456789"
+_HEX = "0123456789abcdefABCDEF"
+_ESCAPES = '"\\/bfnrt'
+
+# Modes in which whitespace leaves the state unchanged
+WS_SELF_LOOP_MODES = frozenset({START, OBJ_FIRST, OBJ_NEXT, AFTER_KEY, VALUE, ARR_FIRST,
+                                ENUM_START, AFTER_VALUE, DONE})
+# Modes in which any character other than '"', '\\' or a control character
+# is accepted without changing the structural state
+FREE_TEXT_MODES = frozenset({KEY, STRING})
+
+# State: (mode, aux, stack, key)
+#   aux   - escape progress in strings, enum prefix, number phase, literal rest
+#   stack - tuple of "O"/"A" frames
+#   key   - current/last key while it may still name an enum key, else None
+State = Tuple[str, object, Tuple[str, ...], Optional[str]]
+
+INITIAL_STATE: State = (START, None, (), None)
+
+
+class JSONGrammar:
+    """Transition function of the task1_v1 JSON automaton."""
+
+    def __init__(self, enums: Dict[str, FrozenSet[str]]):
+        """
+        Args:
+            enums: key -> allowed string values (null is always allowed)
+        """
+        self.enums = enums
+        self._key_prefixes = frozenset(
+            key[:i] for key in enums for i in range(len(key) + 1)
+        )
+        self._enum_prefixes = {
+            key: frozenset(value[:i] for value in values for i in range(len(value) + 1))
+            for key, values in enums.items()
+        }
+
+    def advance(self, state: Optional[State], text: str) -> Optional[State]:
+        """
+        Feed a string through the automaton.
+
+        Args:
+            state: Current state (None means already rejected)
+            text: Characters to consume
+
+        Returns:
+            State or None: The new state, or None if the text is not allowed
+        """
+        for char in text:
+            if state is None:
+                return None
+            state = self.step(state, char)
+        return state
+
+    def _close(self, stack: Tuple[str, ...], frame: str) -> Optional[State]:
+        """Pop a container frame if it matches the closing bracket."""
+        if not stack or stack[-1] != frame:
+            return None
+        stack = stack[:-1]
+        return (AFTER_VALUE, None, stack, None) if stack else (DONE, None, stack, None)
+
+    def _start_value(self, char: str, stack: Tuple[str, ...]) -> Optional[State]:
+        """Begin a value of any type."""
+        if char == "{":
+            return (OBJ_FIRST, None, stack + ("O",), None)
+        if char == "[":
+            return (ARR_FIRST, None, stack + ("A",), None)
+        if char == '"':
+            return (STRING, 0, stack, None)
+        if char == "-":
+            return (NUMBER, "sign", stack, None)
+        if char == "0":
+            return (NUMBER, "zero", stack, None)
+        if char in _DIGITS:
+            return (NUMBER, "int", stack, None)
+        if char == "t":
+            return (LITERAL, "rue", stack, None)
+        if char == "f":
+            return (LITERAL, "alse", stack, None)
+        if char == "n":
+            return (LITERAL, "ull", stack, None)
+        return None
+
+    def step(self, state: State, char: str) -> Optional[State]:
+        """
+        Consume one character.
+
+        Args:
+            state: Current state
+            char: Next character
+
+        Returns:
+            State or None: The new state, or None if the character is not allowed
+        """
+        mode, aux, stack, key = state
+
+        if mode in FREE_TEXT_MODES:
+            if aux:
+                # Escape sequence in progress: aux is "esc" or remaining hex digits
+                if aux == "esc":
+                    if char == "u":
+                        return (mode, 4, stack, None if mode == KEY else key)
+                    if char in _ESCAPES:
+                        return (mode, 0, stack, None if mode == KEY else key)
+                    return None
+                if char in _HEX:
+                    return (mode, aux - 1, stack, key)
+                return None
+            if char == '"':
+                if mode == KEY:
+                    return (AFTER_KEY, None, stack, key)
+                return (AFTER_VALUE, None, stack, None)
+            if char == "\\":
+                return (mode, "esc", stack, None if mode == KEY else key)
+            if char < " ":
+                return None
+            if mode == KEY and key is not None:
+                extended = key + char
+                key = extended if extended in self._key_prefixes else None
+            return (mode, 0, stack, key)
+
+        if mode == NUMBER:
+            return self._step_number(aux, stack, char)
+
+        if mode == LITERAL:
+            if char != aux[0]:
+                return None
+            if len(aux) == 1:
+                return (AFTER_VALUE, None, stack, None)
+            return (LITERAL, aux[1:], stack, None)
+
+        if mode == ENUM:
+            if char == '"':
+                return (AFTER_VALUE, None, stack, None) if aux in self.enums[key] else None
+            extended = aux + char
+            if extended in self._enum_prefixes[key]:
+                return (ENUM, extended, stack, key)
+            return None
+
+        if char in WHITESPACE:
+            return state if mode in WS_SELF_LOOP_MODES else None
+
+        if mode == START:
+            return (OBJ_FIRST, None, ("O",), None) if char == "{" else None
+
+        if mode in (OBJ_FIRST, OBJ_NEXT):
+            if char == '"':
+                return (KEY, 0, stack, "")
+            if char == "}" and mode == OBJ_FIRST:
+                return self._close(stack, "O")
+            return None
+
+        if mode == AFTER_KEY:
+            if char != ":":
+                return None
+            if key in self.enums:
+                return (ENUM_START, None, stack, key)
+            return (VALUE, None, stack, None)
+
+        if mode == ENUM_START:
+            if char == '"':
+                return (ENUM, "", stack, key)
+            if char == "n":
+                return (LITERAL, "ull", stack, None)
+            return None
+
+        if mode == VALUE:
+            return self._start_value(char, stack)
+
+        if mode == ARR_FIRST:
+            if char == "]":
+                return self._close(stack, "A")
+            return self._start_value(char, stack)
+
+        if mode == AFTER_VALUE:
+            if char == ",":
+                return (OBJ_NEXT, None, stack, None) if stack[-1] == "O" else (VALUE, None, stack, None)
+            if char == "}":
+                return self._close(stack, "O")
+            if char == "]":
+                return self._close(stack, "A")
+            return None
+
+        # DONE: nothing but whitespace
+        return None
+
+    def _step_number(self, phase: str, stack: Tuple[str, ...], char: str) -> Optional[State]:
+        """Number sub-automaton; a delimiter ends the number and is re-dispatched."""
+        if char in _DIGITS:
+            if phase in ("sign", "int"):
+                return (NUMBER, "int", stack, None) if phase == "int" or char != "0" else (NUMBER, "zero", stack, None)
+            if phase in ("dot", "frac"):
+                return (NUMBER, "frac", stack, None)
+            if phase in ("exp", "exp_sign", "exp_digits"):
+                return (NUMBER, "exp_digits", stack, None)
+            return None  # leading zero followed by a digit
+        if char == "." and phase in ("zero", "int"):
+            return (NUMBER, "dot", stack, None)
+        if char in "eE" and phase in ("zero", "int", "frac"):
+            return (NUMBER, "exp", stack, None)
+        if char in "+-" and phase == "exp":
+            return (NUMBER, "exp_sign", stack, None)
+        if phase in ("zero", "int", "frac", "exp_digits"):
+            return self.step((AFTER_VALUE, None, stack, None), char)
+        return None
+
+    @staticmethod
+    def is_complete(state: Optional[State]) -> bool:
+        """Whether the top-level object has been closed."""
+        return state is not None and state[0] == DONE
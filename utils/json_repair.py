@@ -0,0 +1,396 @@
+"""
+Tolerant parsing of model output.
+
+Output that is valid JSON (after stripping a markdown code fence) is parsed
+directly with orjson. Anything else gets one pass over the text that fixes
+the mistakes the model actually makes, and is parsed again:
+
+- `//` and `/* */` comments (the schema in utils/prompts.py is annotated
+  with them, and the model sometimes copies them)
+- trailing or doubled commas, and missing commas between members
+- bare values such as `35 vs 10` or `approx. 40%` (quoted as strings),
+  unquoted keys, and Python's True/False/None
+- raw newlines and tabs inside strings, and backslashes that do not start
+  a valid escape (`\\q` becomes a literal backslash and `q`)
+- text before the opening brace or after the closing one
+- output cut off before the object closes: the member being written in the
+  innermost open container (an unterminated string, a number that may be
+  missing digits, a key without its value) is dropped and the open arrays
+  and objects are closed
+
+Each repair is counted so callers can report what was changed; a
+"truncated" count means later fields are missing (see is_truncated()).
+Escapes of unpaired UTF-16 surrogates (`\\ud800` on its own) are not
+repaired and still fail to parse.
+"""
+import re
+from typing import Any, Dict, List, Tuple
+
+import orjson
+
+# Body of a JSON string up to the closing quote, a raw control character or the end
+_STRING_BODY = re.compile(r'(?:[^"\\\x00-\x1f]|\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4}))*')
+# An escape the text ends in the middle of
+_PARTIAL_ESCAPE = re.compile(r"\\(?:u[0-9a-fA-F]{0,3})?")
+_NUMBER_OR_LITERAL = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null")
+_BARE_VALUE = re.compile(r"[^,\]}\n]*")
+_BARE_KEY = re.compile(r"[^:,\]}\n]*")
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+# Warning text per repair kind, in reporting order
+_REPAIR_MESSAGES = {
+    "comment": "removed {n} comment(s)",
+    "trailing_comma": "removed {n} trailing or doubled comma(s)",
+    "missing_comma": "inserted {n} missing comma(s)",
+    "missing_value": "filled {n} missing value(s) with null",
+    "bare_value": "quoted {n} unquoted value(s)",
+    "unquoted_key": "quoted {n} unquoted key(s)",
+    "python_literal": "converted {n} Python literal(s)",
+    "control_character": "escaped {n} raw control character(s) in strings",
+    "invalid_escape": "escaped {n} backslash(es) not starting a valid escape",
+    "leading_text": "ignored text before the JSON object",
+    "trailing_text": "ignored text after the JSON object",
+    "unclosed_bracket": "closed {n} bracket(s) left open before an outer closing bracket",
+    "truncated": "output was cut off; dropped the incomplete last member and closed {n} open array(s) or object(s)",
+}
+
+
+def strip_code_fence(text: str) -> str:
+    """Remove a surrounding ```json ... ``` fence and whitespace."""
+    text = text.strip()
+    if text.startswith("```json"):
+        text = text[7:]
+    elif text.startswith("```"):
+        text = text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return text.strip()
+
+
+def parse_model_output(text: str) -> Tuple[Any, Dict[str, int]]:
+    """
+    Parse model output as JSON, repairing it if necessary.
+
+    Args:
+        text: Decoded model output
+
+    Returns:
+        tuple: (parsed value, repairs made as {kind: count}; empty when the
+            output was valid JSON)
+
+    Raises:
+        orjson.JSONDecodeError: If the output cannot be repaired (a
+            subclass of json.JSONDecodeError)
+    """
+    text = strip_code_fence(text)
+    try:
+        return orjson.loads(text), {}
+    except orjson.JSONDecodeError:
+        pass
+    repaired, repairs = repair_json(text)
+    return orjson.loads(repaired), repairs
+
+
+def describe_repairs(repairs: Dict[str, int]) -> str:
+    """
+    Summarize repairs as one warning sentence.
+
+    Args:
+        repairs: {kind: count} as returned by parse_model_output
+
+    Returns:
+        str: Warning text
+    """
+    parts = [
+        message.format(n=repairs[kind]) for kind, message in _REPAIR_MESSAGES.items() if repairs.get(kind)
+    ]
+    return "Repaired malformed JSON output: " + "; ".join(parts)
+
+
+def is_truncated(metadata: dict) -> bool:
+    """
+    Whether parsed metadata was marked as cut off before it was complete.
+
+    Args:
+        metadata: Metadata dict as returned by the vision service
+
+    Returns:
+        bool: True if extraction_notes.truncated is set
+    """
+    notes = metadata.get("extraction_notes")
+    return isinstance(notes, dict) and notes.get("truncated") is True
+
+
+class _Frame:
+    """An open object or array and what it expects next."""
+
+    __slots__ = ("opener", "state", "safe")
+
+    def __init__(self, opener: str, safe: int):
+        self.opener = opener
+        # Objects: "key", "colon", "value" or "after"; arrays: "value" or "after"
+        self.state = "key" if opener == "{" else "value"
+        # Output length up to the last complete member, for cutting off a
+        # member left unfinished by truncation
+        self.safe = safe
+
+
+def repair_json(text: str) -> Tuple[str, Dict[str, int]]:
+    """
+    Rewrite almost-JSON into JSON in a single pass.
+
+    Args:
+        text: Model output without a code fence
+
+    Returns:
+        tuple: (repaired text, repairs made as {kind: count})
+    """
+    out: List[str] = []
+    repairs: Dict[str, int] = {}
+    stack: List[_Frame] = []
+
+    def count(kind: str, n: int = 1):
+        repairs[kind] = repairs.get(kind, 0) + n
+
+    def begin_value():
+        """Account for a value starting in the innermost container."""
+        if not stack:
+            return
+        frame = stack[-1]
+        if frame.state == "after":
+            out.append(",")
+            count("missing_comma")
+        frame.state = "after"
+
+    length = len(text)
+    i = _skip_leading_text(text, count)
+    if i < 0:
+        return text, repairs
+    started = False
+    while i < length:
+        char = text[i]
+
+        if started and not stack:
+            if text[i:].strip():
+                count("trailing_text")
+            break
+
+        if char in " \t\r\n":
+            i += 1
+            continue
+
+        if char == "/" and i + 1 < length and text[i + 1] in "/*":
+            i = _skip_comment(text, i)
+            count("comment")
+            continue
+
+        if char == '"':
+            i, string, closed = _read_string(text, i, count)
+            if not closed and stack:
+                # Cut off inside the string; drop the member it belongs to
+                break
+            frame = stack[-1] if stack else None
+            if frame is not None and frame.opener == "{" and frame.state in ("key", "after"):
+                if frame.state == "after":
+                    out.append(",")
+                    count("missing_comma")
+                frame.state = "colon"
+            else:
+                begin_value()
+            out.append(string)
+            started = True
+            continue
+
+        if char == ":":
+            frame = stack[-1] if stack else None
+            if frame is not None and frame.state == "colon":
+                frame.state = "value"
+                out.append(":")
+            i += 1
+            continue
+
+        if char == ",":
+            frame = stack[-1] if stack else None
+            if frame is not None and frame.state == "value" and frame.opener == "{":
+                out.append("null")
+                count("missing_value")
+                frame.state = "after"
+            next_char = _next_significant(text, i + 1)
+            if frame is None or frame.state != "after" or (next_char and next_char in "}]"):
+                count("trailing_comma")
+            else:
+                frame.safe = len(out)
+                out.append(",")
+                frame.state = "key" if frame.opener == "{" else "value"
+            i += 1
+            continue
+
+        if char in "{[":
+            begin_value()
+            out.append(char)
+            stack.append(_Frame(char, len(out)))
+            started = True
+            i += 1
+            continue
+
+        if char in "}]":
+            if not any(_CLOSERS[frame.opener] == char for frame in stack):
+                # Nothing open that this closes
+                i += 1
+                continue
+            while _CLOSERS[stack[-1].opener] != char:
+                count("unclosed_bracket")
+                _close(stack.pop(), out, count, truncated=False)
+            _close(stack.pop(), out, count, truncated=False)
+            i += 1
+            continue
+
+        # Anything else is an unquoted key or value
+        frame = stack[-1] if stack else None
+        is_key = frame is not None and frame.opener == "{" and frame.state in ("key", "after")
+        literal = None if is_key else _NUMBER_OR_LITERAL.match(text, i)
+        next_char = _next_significant(text, literal.end()) if literal is not None else None
+        if next_char == "" and stack and literal.group() not in ("true", "false", "null"):
+            # A number at the very end may be missing digits
+            break
+        if next_char is not None and (not next_char or next_char in ',]}"'):
+            # A number or literal followed by a delimiter (or by the next
+            # member's key, missing its comma)
+            begin_value()
+            out.append(literal.group())
+            started = True
+            i = literal.end()
+            continue
+        match = (_BARE_KEY if is_key else _BARE_VALUE).match(text, i)
+        i = match.end()
+        token = match.group()
+        comment = token.find("//")
+        if comment >= 0:
+            token = token[:comment]
+            count("comment")
+            i = _skip_comment(text, match.start() + comment)
+        token = token.strip()
+        if not token:
+            i = max(i, match.start() + 1)
+            continue
+        if i >= length and stack:
+            # Cut off in the middle of a bare key or value; it may be incomplete
+            break
+        if is_key:
+            if frame.state == "after":
+                out.append(",")
+                count("missing_comma")
+            frame.state = "colon"
+            out.append(orjson.dumps(token).decode())
+            count("unquoted_key")
+        else:
+            begin_value()
+            out.append(_bare_value(token, count))
+        started = True
+
+    if stack:
+        count("truncated", len(stack))
+        while stack:
+            _close(stack.pop(), out, count, truncated=True)
+
+    return "".join(out), repairs
+
+
+def _skip_leading_text(text: str, count) -> int:
+    """Index of the first `{` or `[` (-1 if there is none), counting comments or prose before it."""
+    i = 0
+    length = len(text)
+    while i < length:
+        if text[i] in " \t\r\n":
+            i += 1
+        elif text.startswith("//", i) or text.startswith("/*", i):
+            i = _skip_comment(text, i)
+            count("comment")
+        else:
+            break
+    brace = min((index for index in (text.find("{", i), text.find("[", i)) if index >= 0), default=-1)
+    if brace > i:
+        count("leading_text")
+    return brace
+
+
+def _skip_comment(text: str, i: int) -> int:
+    """Index just past a // or /* */ comment starting at i."""
+    if text.startswith("//", i):
+        end = text.find("\n", i)
+        return len(text) if end < 0 else end + 1
+    end = text.find("*/", i + 2)
+    return len(text) if end < 0 else end + 2
+
+
+def _next_significant(text: str, i: int) -> str:
+    """The next character that is not whitespace or inside a comment ("" at the end)."""
+    length = len(text)
+    while i < length:
+        char = text[i]
+        if char in " \t\r\n":
+            i += 1
+        elif char == "/" and i + 1 < length and text[i + 1] in "/*":
+            i = _skip_comment(text, i)
+        else:
+            return char
+    return ""
+
+
+def _read_string(text: str, i: int, count) -> Tuple[int, str, bool]:
+    """
+    Read a string starting at the quote at i, closing it if the text ends first.
+
+    Returns:
+        tuple: (index after the string, JSON string literal, whether the
+            closing quote was found)
+    """
+    parts = ['"']
+    position = i + 1
+    length = len(text)
+    while True:
+        match = _STRING_BODY.match(text, position)
+        parts.append(match.group())
+        position = match.end()
+        if position >= length or _PARTIAL_ESCAPE.fullmatch(text, position):
+            parts.append('"')
+            return length, "".join(parts), False
+        if text[position] == '"':
+            parts.append('"')
+            return position + 1, "".join(parts), True
+        if text[position] == "\\":
+            # Not a valid escape: keep the backslash as a literal character
+            parts.append("\\\\")
+            count("invalid_escape")
+            position += 1
+            continue
+        # Raw control character
+        char = text[position]
+        parts.append(_CONTROL_ESCAPES.get(char, f"\\u{ord(char):04x}"))
+        count("control_character")
+        position += 1
+
+
+def _bare_value(token: str, count) -> str:
+    """JSON for an unquoted value: kept if it is a number or literal, else quoted."""
+    if _NUMBER_OR_LITERAL.fullmatch(token):
+        return token
+    if token in _PYTHON_LITERALS:
+        count("python_literal")
+        return _PYTHON_LITERALS[token]
+    count("bare_value")
+    return orjson.dumps(token).decode()
+
+
+def _close(frame: _Frame, out: List[str], count, truncated: bool):
+    """Close a container, first completing or dropping a member it holds only part of."""
+    if frame.opener == "{" and frame.state in ("colon", "value") and not truncated:
+        # `{"key"}` or `{"key": }`
+        out.append(":null" if frame.state == "colon" else "null")
+        count("missing_value")
+    elif frame.state in ("colon", "value") or (out and out[-1] == ","):
+        # A key without its value, or a dangling comma
+        del out[frame.safe:]
+    out.append(_CLOSERS[frame.opener])
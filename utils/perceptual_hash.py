@@ -0,0 +1,90 @@
+"""
+Perceptual hashing for near-duplicate image detection.
+"""
+from typing import Tuple
+
+from PIL import Image, ImageChops, ImageOps
+
+
+def trim_uniform_border(
+    image: Image.Image,
+    tolerance: int = 10,
+    max_passes: int = 3,
+) -> Image.Image:
+    """
+    Crop away uniform borders (e.g. screenshot padding or scan margins).
+
+    The border colour is taken from the top-left pixel; anything within
+    `tolerance` of it at the edges is removed. Nested borders (a grey frame
+    around a white chart background) are peeled off over several passes.
+
+    Args:
+        image: Decoded image
+        tolerance: Per-channel difference still treated as border
+        max_passes: Maximum number of nested borders to remove
+
+    Returns:
+        Image.Image: Cropped image, or the original if nothing to trim
+    """
+    for _ in range(max_passes):
+        rgb = image.convert("RGB")
+        background = Image.new("RGB", rgb.size, rgb.getpixel((0, 0)))
+        diff = ImageChops.difference(rgb, background).convert("L")
+        bbox = diff.point(lambda value: 255 if value > tolerance else 0).getbbox()
+        if bbox is None or bbox == (0, 0) + image.size:
+            break
+        image = image.crop(bbox)
+    return image
+
+
+def dhash(image: Image.Image, hash_size: int = 16, margin: int = 2) -> int:
+    """
+    Compute a difference hash over a normalized thumbnail.
+
+    The image is converted to grayscale and contrast-stretched before being
+    shrunk, so re-encoded, resized or rescanned copies of the same chart
+    hash to nearby values. Trim borders first (see fingerprint()) to also
+    tolerate added padding.
+
+    Args:
+        image: Decoded image
+        hash_size: Hash is hash_size * hash_size bits
+        margin: Brightness step needed to set a bit; keeps compression
+            noise in flat regions from flipping bits
+
+    Returns:
+        int: The hash as an unsigned integer
+    """
+    gray = ImageOps.autocontrast(image.convert("L"))
+    # Box-filter down first so the final resample sees averaged pixels
+    gray = gray.resize((hash_size * 4 + 4, hash_size * 4), Image.BOX)
+    thumbnail = gray.resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(thumbnail.getdata())
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1] + margin)
+    return value
+
+
+def fingerprint(image: Image.Image, hash_size: int = 16) -> Tuple[int, float]:
+    """
+    Border-trim an image and compute its perceptual hash and aspect ratio.
+
+    Args:
+        image: Decoded image
+        hash_size: Hash is hash_size * hash_size bits
+
+    Returns:
+        tuple: (dhash of the trimmed content, its width / height)
+    """
+    content = trim_uniform_border(image)
+    width, height = content.size
+    return dhash(content, hash_size), width / max(height, 1)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two hashes."""
+    return bin(a ^ b).count("1")
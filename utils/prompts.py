@@ -1,4 +1,20 @@
-IELTS_TASK1_VISION_SYSTEM_PROMPT = """
+"""
+System prompts for the vision model.
+
+The task1_v1 schema prompt is kept in sections: the rules and top-level
+shape every extraction needs, the multi-visual sections, and one
+"structure" section per visual type. IELTS_TASK1_VISION_SYSTEM_PROMPT joins
+all of them; build_system_prompt() joins only the sections for the visual
+types the classification pass found, for two-stage extraction. The
+data-heavy sections also come in a compact columnar variant
+(COMPACT_OUTPUT, see utils/compact_format.py).
+"""
+import functools
+import re
+from typing import Optional, Tuple
+
+
+_ROLE_AND_RULES = """
 You are an IELTS Task 1 VISUAL METADATA EXTRACTOR.
 
 Your job:
@@ -34,7 +50,9 @@ GENERAL RULES
   - Extremes (highest/lowest, biggest changes)
 - Do NOT invent data not present in the image. You may paraphrase labels.
 
-TOP-LEVEL JSON SHAPE
+"""
+
+_TOP_LEVEL_SHAPE = """TOP-LEVEL JSON SHAPE
 --------------------
 Always output a JSON object with this top-level structure:
 
@@ -107,7 +125,9 @@ Always output a JSON object with this top-level structure:
   }
 }
 
-VISUALS ARRAY (COMMON STRUCTURE)
+"""
+
+_VISUALS_ARRAY = """VISUALS ARRAY (COMMON STRUCTURE)
 --------------------------------
 Each item in "visuals" describes one chart/map/diagram:
 
@@ -133,7 +153,9 @@ Each item in "visuals" describes one chart/map/diagram:
 - If there is only one visual, "visuals" has one object.
 - For multiple-graph tasks, "visuals" has one object per sub-visual.
 
-RELATIONSHIPS BETWEEN VISUALS
+"""
+
+_RELATIONSHIPS = """RELATIONSHIPS BETWEEN VISUALS
 -----------------------------
 For "task_visual_category": "multiple_graphs":
 
@@ -146,10 +168,14 @@ For "task_visual_category": "multiple_graphs":
   }
 ]
 
-TYPE-SPECIFIC "structure"
+"""
+
+_TYPE_SPECIFIC_HEADER = """TYPE-SPECIFIC "structure"
 =========================
 
-1) BAR CHART  (visual_type = "bar_chart")
+"""
+
+_BAR_CHART = """1) BAR CHART  (visual_type = "bar_chart")
 -----------------------------------------
 "structure": {
   "bar_chart_type": "single | grouped | stacked",
@@ -213,7 +239,9 @@ TYPE-SPECIFIC "structure"
   }
 }
 
-2) LINE GRAPH  (visual_type = "line_graph")
+"""
+
+_LINE_GRAPH = """2) LINE GRAPH  (visual_type = "line_graph")
 -------------------------------------------
 "structure": {
   "axes": {
@@ -274,7 +302,9 @@ TYPE-SPECIFIC "structure"
   }
 }
 
-3) PROCESS DIAGRAM  (visual_type = "process_diagram")
+"""
+
+_PROCESS_DIAGRAM = """3) PROCESS DIAGRAM  (visual_type = "process_diagram")
 -----------------------------------------------------
 "structure": {
   "process_title": null,
@@ -335,7 +365,9 @@ TYPE-SPECIFIC "structure"
   }
 }
 
-4) TABLE  (visual_type = "table")
+"""
+
+_TABLE = """4) TABLE  (visual_type = "table")
 ---------------------------------
 "structure": {
   "table_title": null,
@@ -382,7 +414,9 @@ TYPE-SPECIFIC "structure"
   }
 }
 
-5) MAP  (visual_type = "map")
+"""
+
+_MAP = """5) MAP  (visual_type = "map")
 -----------------------------
 "structure": {
   "base_region_description": null,
@@ -426,7 +460,9 @@ TYPE-SPECIFIC "structure"
   }
 }
 
-6) PIE CHART  (visual_type = "pie_chart")
+"""
+
+_PIE_CHART = """6) PIE CHART  (visual_type = "pie_chart")
 -----------------------------------------
 "structure": {
   "context_label": null,
@@ -463,7 +499,9 @@ TYPE-SPECIFIC "structure"
   }
 }
 
-MULTIPLE GRAPHS  (task_visual_category = "multiple_graphs")
+"""
+
+_MULTIPLE_GRAPHS = """MULTIPLE GRAPHS  (task_visual_category = "multiple_graphs")
 ===========================================================
 If the image has TWO OR MORE distinct visuals:
 
@@ -476,7 +514,9 @@ If the image has TWO OR MORE distinct visuals:
   - "summary_vs_detail" (table + pies)
   - "redevelopment" (old site vs redevelopment plan)
 
-QUALITY CHECK
+"""
+
+_QUALITY_CHECK = """QUALITY CHECK
 -------------
 Before you answer:
 - Ensure the JSON is syntactically valid and includes all required top-level keys.
@@ -484,4 +524,366 @@ Before you answer:
 - Ensure each item in "visuals" matches its "visual_type" structure.
 - Ensure "primary_overview" and "primary_features" reflect the main message and key features.
 - Output ONLY the final JSON object.
-"""
\ No newline at end of file
+"""
+
+# Compact variants of the data-heavy sections (COMPACT_OUTPUT): values as
+# arrays in axis order with ids implied by position, expanded back into the
+# task1_v1 objects above by utils/compact_format.py
+_COMPACT_RULES = """
+COMPACT OUTPUT FORMAT
+---------------------
+Write "schema_version": "task1_compact" and use the compact "structure" of
+bar charts, line graphs, tables and pie charts documented below: values are
+arrays in category, tick, row or slice order instead of one object per
+value. Ids are implied by position (categories c1, c2, ...; series s1,
+s2, ...; ticks t1, t2, ...; table rows r1, r2, ... and columns c1, c2, ...;
+slices sl1, sl2, ...); use them in "extremes", "patterns_and_trends" and
+the other fields exactly as if they had been written out. Leave out
+optional keys whose value would be null, false or empty.
+
+TOP-LEVEL JSON SHAPE"""
+
+_BAR_CHART_COMPACT = """1) BAR CHART  (visual_type = "bar_chart")
+-----------------------------------------
+"structure": {
+  "bar_chart_type": "single | grouped | stacked",
+  "orientation": "vertical | horizontal",
+
+  "axes": {
+    "category_axis": {
+      "label": null,
+      "unit": null,
+      "categories": ["1990", "2000"]   // ids c1, c2, ...; {"label": "1990", "group": "Men"} when grouped
+    },
+    "value_axis": {
+      "label": null,
+      "unit": "percent | number | index | other | null",
+      "min_value": null,
+      "max_value": null,
+      "scale": "linear | logarithmic | other"
+    }
+  },
+
+  "series": [
+    {
+      "label": "65 and over",          // ids s1, s2, ...; add "legend" only if the legend text differs
+      "values": [10.0, 12.5],          // one per category, null where there is no bar
+      "approx": true,                  // true if all values are estimated, or one true/false per value
+      "ranges": [[9.0, 11.0], [12.0, 13.0]],  // optional [min, max] per value (null where exact)
+      "raw": ["10%", null],            // optional printed value labels
+      "summary": null                  // optional series_pattern_summary; "notes" likewise
+    }
+  ],
+
+  "stacking_info": {
+    "is_stacked": false,
+    "stack_groups": []
+  },
+
+  "extremes": {
+    "highest_bars": [],
+    "lowest_bars": []
+  },
+
+  "patterns_and_trends": {
+    "overall_pattern": [],
+    "group_comparisons": [],
+    "notable_outliers": []
+  }
+}
+
+"""
+
+_LINE_GRAPH_COMPACT = """2) LINE GRAPH  (visual_type = "line_graph")
+-------------------------------------------
+"structure": {
+  "axes": {
+    "x_axis": {
+      "type": "time | category | numeric",
+      "label": null,
+      "unit": null,
+      "ticks": ["1967", "1970"]        // ids t1, t2, ...; {"label": "Q1", "value": 1} if the number is not the label
+    },
+    "y_axis": {
+      "label": null,
+      "unit": "percent | number | index | other | null",
+      "min_value": null,
+      "max_value": null,
+      "scale": "linear | logarithmic | other"
+    }
+  },
+
+  "line_series": [
+    {
+      "label": "United Kingdom",       // ids s1, s2, ...; add "legend" only if the legend text differs
+      "values": [11.0, 13.5],          // one per tick, null where the line has no point
+      "approx": true,                  // true if all values are estimated, or one true/false per value
+      "ranges": [[10.5, 11.5], [13.0, 14.0]], // optional [min, max] per value (null where exact)
+      "raw": null,                     // optional printed value labels
+      "summary": null                  // optional series_trend_summary
+    }
+  ],
+
+  "extremes": {
+    "overall_max_points": [],
+    "overall_min_points": [],
+    "per_series_max": [],
+    "per_series_min": []
+  },
+
+  "patterns_and_trends": {
+    "overall_trend_description": [],
+    "cross_series_comparisons": [],
+    "crossing_points": [],
+    "stability_and_fluctuation": []
+  }
+}
+
+"""
+
+_TABLE_COMPACT = """4) TABLE  (visual_type = "table")
+---------------------------------
+"structure": {
+  "table_title": null,
+
+  "row_headers": [                     // ids r1, r2, ...
+    {"label": "Use e-mail", "group": "Activity"}  // or just "Use e-mail"
+  ],
+
+  "column_headers": [                  // ids c1, c2, ...
+    {"label": "Teens", "unit": "percent | number | other | null", "group": "Age group"}  // or just "Teens"
+  ],
+
+  "values": [[90.0, 75.0]],            // one array per row, one value per column, null for an empty cell
+  "approx": false,                     // true/false for the whole table, per row, or per cell
+  "ranges": null,                      // optional [min, max] per cell, rows like "values"
+  "raw": [["90", "75"]],               // optional printed cell text, rows like "values"
+
+  "derived_information": {
+    "row_totals": [],
+    "column_totals": [],
+    "extremes": {
+      "highest_cells": [],
+      "lowest_cells": []
+    },
+    "row_comparisons": [],
+    "column_comparisons": []
+  }
+}
+
+"""
+
+_PIE_CHART_COMPACT = """6) PIE CHART  (visual_type = "pie_chart")
+-----------------------------------------
+"structure": {
+  "context_label": null,
+  "is_donut_chart": false,
+
+  "slices": {                          // ids sl1, sl2, ... in "labels" order
+    "labels": ["Food", "Housing"],
+    "percentages": [24.0, 31.0],
+    "values": null,                    // optional absolute values, one per slice
+    "category": "expenditure_category | population_group | language | marital_status | other",  // one for all, or one per slice
+    "approx": false,                   // true/false for all slices, or one per slice
+    "ranges": null,                    // optional [min, max] per slice
+    "raw": ["24%", "31%"],             // optional printed labels
+    "highlighted": null                // optional true/false per slice
+  },
+
+  "percentage_sum_check": {
+    "total_percentage": 100.0,
+    "is_approximately_100": true
+  },
+
+  "extremes": {
+    "largest_slices": [],
+    "smallest_slices": []
+  },
+
+  "patterns_and_trends": {
+    "within_pie_comparisons": [],
+    "comparisons_with_other_pies": []
+  }
+}
+
+"""
+
+# Type-specific "structure" sections, in schema order
+STRUCTURE_SECTIONS = {
+    "bar_chart": _BAR_CHART,
+    "line_graph": _LINE_GRAPH,
+    "process_diagram": _PROCESS_DIAGRAM,
+    "table": _TABLE,
+    "map": _MAP,
+    "pie_chart": _PIE_CHART,
+}
+VISUAL_TYPES = tuple(STRUCTURE_SECTIONS)
+TASK_VISUAL_CATEGORIES = VISUAL_TYPES + ("multiple_graphs",)
+
+
+COMPACT_STRUCTURE_SECTIONS = {
+    "bar_chart": _BAR_CHART_COMPACT,
+    "line_graph": _LINE_GRAPH_COMPACT,
+    "table": _TABLE_COMPACT,
+    "pie_chart": _PIE_CHART_COMPACT,
+}
+
+
+def _assemble(visual_types: Tuple[str, ...], multiple: bool, compact: bool = False) -> str:
+    """Join the schema sections for some visual types, with or without the multi-visual ones."""
+    structure_sections = dict(STRUCTURE_SECTIONS, **COMPACT_STRUCTURE_SECTIONS) if compact else STRUCTURE_SECTIONS
+    sections = [_ROLE_AND_RULES, _TOP_LEVEL_SHAPE, _VISUALS_ARRAY]
+    if multiple:
+        sections.append(_RELATIONSHIPS)
+    sections.append(_TYPE_SPECIFIC_HEADER)
+    sections.extend(structure_sections[visual_type] for visual_type in VISUAL_TYPES if visual_type in visual_types)
+    if multiple:
+        sections.append(_MULTIPLE_GRAPHS)
+    sections.append(_QUALITY_CHECK)
+    prompt = "".join(sections)
+    if compact:
+        prompt = prompt.replace('"schema_version": "task1_v1"', '"schema_version": "task1_compact"', 1)
+        prompt = prompt.replace("\nTOP-LEVEL JSON SHAPE", _COMPACT_RULES, 1)
+    return prompt
+
+
+IELTS_TASK1_VISION_SYSTEM_PROMPT = _assemble(VISUAL_TYPES, multiple=True)
+
+
+# Blocks of the schema above that are pure arithmetic over the extracted
+# values; in data-only mode utils/derived_fields.py computes them instead
+_DERIVED_BLOCK = re.compile(
+    r',\n\n  "(?:extremes|patterns_and_trends|derived_information|percentage_sum_check)": \{.*?\n  \}',
+    re.DOTALL,
+)
+
+_DATA_ONLY_RULES = """
+DATA-ONLY MODE
+--------------
+Extremes, rankings, totals, changes and crossing points are computed by the
+server from the values you extract. Do NOT output "extremes",
+"patterns_and_trends", "derived_information", "percentage_sum_check" or
+"extremes_summary". Spend your effort on reading every value exactly: every
+bar in "data_points", every point in "line_series", every table cell and
+every pie slice, with "approximate" and "value_range" where you estimate.
+
+TOP-LEVEL JSON SHAPE"""
+
+
+def _data_only_prompt(prompt: str) -> str:
+    """The schema prompt without the derived blocks, plus the data-only rules."""
+    prompt = _DERIVED_BLOCK.sub("", prompt)
+    prompt = prompt.replace('    "extremes_summary": [],\n', "")
+    prompt = prompt.replace("  - Extremes (highest/lowest, biggest changes)\n", "")
+    return prompt.replace("\nTOP-LEVEL JSON SHAPE", _DATA_ONLY_RULES, 1)
+
+
+IELTS_TASK1_VISION_DATA_ONLY_SYSTEM_PROMPT = _data_only_prompt(IELTS_TASK1_VISION_SYSTEM_PROMPT)
+
+
+def get_system_prompt(data_only: bool, compact: bool = False) -> str:
+    """
+    The system prompt for an extraction mode.
+
+    Args:
+        data_only: Whether the model outputs raw values only (derived
+            blocks are computed server-side)
+        compact: Whether the model writes the compact columnar format
+            (expanded server-side)
+
+    Returns:
+        str: System prompt text
+    """
+    if compact:
+        return build_system_prompt(VISUAL_TYPES, True, data_only, compact)
+    return IELTS_TASK1_VISION_DATA_ONLY_SYSTEM_PROMPT if data_only else IELTS_TASK1_VISION_SYSTEM_PROMPT
+
+
+@functools.lru_cache(maxsize=None)
+def build_system_prompt(
+    visual_types: Tuple[str, ...], multiple: bool, data_only: bool, compact: bool = False
+) -> str:
+    """
+    The schema prompt reduced to the sections some visual types need.
+
+    Args:
+        visual_types: Visual types present in the image (see VISUAL_TYPES)
+        multiple: Whether the image has several visuals (keeps the
+            relationships and multiple-graphs sections)
+        data_only: Whether the model outputs raw values only
+        compact: Whether the model writes the compact columnar format
+
+    Returns:
+        str: System prompt text
+    """
+    prompt = _assemble(visual_types, multiple, compact)
+    return _data_only_prompt(prompt) if data_only else prompt
+
+
+IELTS_TASK1_CLASSIFICATION_PROMPT = """
+You classify IELTS Academic Task 1 images by the kind of visual they show.
+
+Output ONLY one JSON object, with no other text:
+{"task_visual_category": "...", "visual_types": ["..."]}
+
+- "task_visual_category": one of "bar_chart", "line_graph", "process_diagram",
+  "table", "map", "pie_chart", or "multiple_graphs" when the image has two or
+  more distinct visuals (e.g. a line graph and a table, two maps, several pie
+  charts).
+- "visual_types": the visual_type of each visual, in reading order (left to
+  right, top to bottom), each one of "bar_chart", "line_graph", "pie_chart",
+  "table", "process_diagram", "map". One entry for a single visual.
+"""
+
+IELTS_TASK1_CLASSIFICATION_USER_PROMPT = "Classify this IELTS Task 1 image."
+
+IELTS_TASK1_USER_PROMPT = "Analyze this IELTS Task 1 image and provide the complete JSON metadata as specified."
+
+
+def parse_classification(value) -> Optional[Tuple[str, Tuple[str, ...]]]:
+    """
+    Validate the classification pass's output.
+
+    Args:
+        value: Parsed JSON output of the classification prompt
+
+    Returns:
+        tuple or None: (task_visual_category, visual types), or None if the
+            output is not a usable classification
+    """
+    if not isinstance(value, dict):
+        return None
+    category = value.get("task_visual_category")
+    visual_types = value.get("visual_types")
+    if category not in TASK_VISUAL_CATEGORIES:
+        return None
+    if not isinstance(visual_types, list) or not visual_types:
+        visual_types = [] if category == "multiple_graphs" else [category]
+    if not visual_types or any(visual_type not in VISUAL_TYPES for visual_type in visual_types):
+        return None
+    return category, tuple(visual_types)
+
+
+def get_classified_prompts(
+    classification: Tuple[str, Tuple[str, ...]], data_only: bool, compact: bool = False
+) -> Tuple[str, str]:
+    """
+    System and user prompt for the extraction pass after classification.
+
+    Args:
+        classification: (task_visual_category, visual types) as returned by
+            parse_classification
+        data_only: Whether the model outputs raw values only
+        compact: Whether the model writes the compact columnar format
+
+    Returns:
+        tuple: (system prompt, user prompt)
+    """
+    category, visual_types = classification
+    multiple = category == "multiple_graphs" or len(visual_types) > 1
+    system_prompt = build_system_prompt(tuple(sorted(set(visual_types))), multiple, data_only, compact)
+    user_prompt = (
+        f'{IELTS_TASK1_USER_PROMPT} The image was classified as task_visual_category "{category}" '
+        f"with visual types {', '.join(visual_types)}."
+    )
+    return system_prompt, user_prompt
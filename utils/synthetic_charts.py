@@ -0,0 +1,74 @@
+"""
+Synthetic IELTS-style chart images for model warmup and the benchmarks.
+"""
+import random
+from typing import List, Optional
+
+from PIL import Image, ImageDraw
+
+
+def bar_chart_values(categories: int = 6, series: int = 2, seed: Optional[int] = 0) -> List[List[int]]:
+    """
+    Bar heights (percent of the axis) drawn by make_bar_chart for a seed.
+
+    Args:
+        categories: Number of category groups
+        series: Number of bars per group
+        seed: Random seed
+
+    Returns:
+        list: values[category][series]
+    """
+    rng = random.Random(seed)
+    return [[rng.randint(10, 95) for _ in range(series)] for _ in range(categories)]
+
+
+def make_bar_chart(
+    width: int = 800,
+    height: int = 600,
+    categories: int = 6,
+    series: int = 2,
+    seed: Optional[int] = 0,
+) -> Image.Image:
+    """
+    Draw a simple grouped bar chart with axes, labels and a title.
+
+    Args:
+        width: Image width in pixels
+        height: Image height in pixels
+        categories: Number of category groups on the x axis
+        series: Number of bars per group
+        seed: Random seed for bar heights (None for unseeded)
+
+    Returns:
+        Image.Image: RGB chart image
+    """
+    values = bar_chart_values(categories, series, seed)
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+
+    left, right = int(width * 0.1), int(width * 0.95)
+    top, bottom = int(height * 0.12), int(height * 0.85)
+    draw.text((width // 3, int(height * 0.03)), "Households by income group, 1990-2015", fill="black")
+    draw.line([left, bottom, right, bottom], fill="black", width=2)
+    draw.line([left, top, left, bottom], fill="black", width=2)
+    for tick in range(0, 101, 20):
+        y = bottom - (bottom - top) * tick // 100
+        draw.line([left - 5, y, left, y], fill="black")
+        draw.text((left - 30, y - 6), str(tick), fill="black")
+
+    colors = [(31, 119, 180), (255, 127, 14), (44, 160, 44), (214, 39, 40)]
+    group_width = (right - left) / categories
+    bar_width = group_width * 0.8 / series
+    for c in range(categories):
+        x0 = left + c * group_width + group_width * 0.1
+        for s in range(series):
+            value = values[c][s]
+            y = bottom - (bottom - top) * value / 100
+            bx = x0 + s * bar_width
+            draw.rectangle([bx, y, bx + bar_width - 2, bottom], fill=colors[s % len(colors)])
+        draw.text((x0, bottom + 8), str(1990 + 5 * c), fill="black")
+    for s in range(series):
+        draw.rectangle([right - 120, top + 18 * s, right - 108, top + 18 * s + 12], fill=colors[s % len(colors)])
+        draw.text((right - 100, top + 18 * s), f"Series {s + 1}", fill="black")
+    return image